@@ -5,7 +5,7 @@ from copy import copy
 
 from typing import (
     List, Set, Union, Dict, Any, Optional, Tuple,
-    cast, NamedTuple, TYPE_CHECKING, Callable, Hashable, Sequence, overload, Mapping,
+    cast, NamedTuple, TYPE_CHECKING, Callable, Hashable, Sequence, overload, Mapping, Iterator,
 )
 
 import numpy
@@ -20,8 +20,9 @@ from bach.utils import escape_parameter_characters
 from sql_models.constants import NotSet, not_set
 from sql_models.graph_operations import update_placeholders_in_graph, get_all_placeholders
 from sql_models.model import SqlModel, Materialization, CustomSqlModelBuilder, RefPath
+from sql_models.optimizer import optimize_if_enabled, materialize_shared_models
 
-from sql_models.sql_generator import to_sql
+from sql_models.sql_generator import to_sql, to_sql_statements
 from sql_models.util import quote_identifier, is_bigquery, DatabaseNotSupportedException, is_postgres
 
 if TYPE_CHECKING:
@@ -585,7 +586,7 @@ class DataFrame:
             sql_params['bq_project_id'] = quote_identifier(engine.dialect, bq_project_id)
 
         sql = f'SELECT * FROM {sql_table_name_template}'
-        model_builder = CustomSqlModelBuilder(sql=sql, name='from_table')
+        model_builder = CustomSqlModelBuilder(sql=sql, name='from_table', has_ctes=False)
         sql_model = model_builder(**sql_params)
 
         return cls._from_node(
@@ -1907,35 +1908,97 @@ class DataFrame:
 
         return selected_indexes
 
-    def to_pandas(self, limit: Union[int, slice] = None) -> pandas.DataFrame:
+    def to_pandas(
+        self,
+        limit: Union[int, slice] = None,
+        materialize_shared: bool = False
+    ) -> pandas.DataFrame:
         """
         Run a SQL query representing the current state of this DataFrame against the database and return the
         resulting data as a Pandas DataFrame.
 
         :param limit: the limit to apply, either as a max amount of rows or a slice of the data.
+        :param materialize_shared: Postgres only. If True, first compute the parts of the query that are
+            used multiple times and consist of multiple steps, e.g. after a merge with itself, into temporary
+            tables. This gives the query planner actual statistics on these parts, but requires the TEMP
+            privilege and doesn't work on read-only replicas. Tables that are used multiple times are not
+            copied. If False, a single query is executed.
         :returns: a pandas DataFrame.
 
         .. note::
             This function queries the database.
         """
-        sql = self.view_sql(limit=limit)
+        statements = self._get_sql_statements(limit=limit, materialize_shared=materialize_shared)
+        with self.engine.connect() as conn:
+            with conn.begin():
+                # The temporary tables are dropped when the transaction is committed
+                for statement in statements[:-1]:
+                    conn.execute(escape_parameter_characters(conn, statement))
+                # read_sql_query expects a parameterized query, so we need to escape the parameter characters
+                sql = escape_parameter_characters(conn, statements[-1])
+                pandas_df = pandas.read_sql_query(sql, conn, dtype=self._get_pandas_dtypes())
+        return self._post_process_pandas_df(pandas_df)
+
+    def iter_pandas(
+        self,
+        chunksize: int,
+        limit: Optional[Union[int, slice]] = None,
+        materialize_shared: bool = False
+    ) -> Iterator[pandas.DataFrame]:
+        """
+        Similar to :py:meth:`to_pandas`, but returns an iterator over pandas DataFrames of at most
+        `chunksize` rows each. The results are streamed from the database, using a server-side cursor if the
+        database driver supports that. This way, results that don't fit in memory can be processed.
+
+        :param chunksize: maximum number of rows per returned pandas DataFrame.
+        :param limit: the limit to apply, either as a max amount of rows or a slice of the data.
+        :param materialize_shared: see :py:meth:`to_pandas`
+        :returns: an iterator of pandas DataFrames.
+
+        .. note::
+            This function queries the database. The query is only started when iteration starts, and
+            the database connection is kept open until the iterator is exhausted or closed.
+        """
+        if chunksize <= 0:
+            raise ValueError(f'chunksize should be a positive number, value: {chunksize}')
+        statements = self._get_sql_statements(limit=limit, materialize_shared=materialize_shared)
+        return self._iter_pandas_chunks(statements=statements, chunksize=chunksize)
 
+    def _iter_pandas_chunks(self, statements: List[str], chunksize: int) -> Iterator[pandas.DataFrame]:
+        """ Generator that executes the statements, and yields the results of the last one in chunks. """
+        dtypes = self._get_pandas_dtypes()
+        with self.engine.connect() as conn:
+            with conn.begin():
+                for statement in statements[:-1]:
+                    conn.execute(escape_parameter_characters(conn, statement))
+                sql = escape_parameter_characters(conn, statements[-1])
+                streaming_conn = conn.execution_options(stream_results=True)
+                chunks = pandas.read_sql_query(sql, streaming_conn, dtype=dtypes, chunksize=chunksize)
+                for pandas_df in chunks:
+                    yield self._post_process_pandas_df(pandas_df)
+
+    def _get_pandas_dtypes(self) -> Dict[str, str]:
+        """ Get the pandas dtypes that should be set on the query results, per series name. """
         series_name_to_dtype = {}
         for series in self.all_series.values():
             pandas_info = series.to_pandas_info()
             if pandas_info is not None:
                 series_name_to_dtype[series.name] = pandas_info.dtype
+        return series_name_to_dtype
 
-        with self.engine.connect() as conn:
-            # read_sql_query expects a parameterized query, so we need to escape the parameter characters
-            sql = escape_parameter_characters(conn, sql)
-            pandas_df = pandas.read_sql_query(sql, conn, dtype=series_name_to_dtype)
-
-        # Post-process any columns if needed. e.g. in BigQuery we represent UUIDs as text, so we convert
-        # the strings that the query gives us into UUID objects
+    def _post_process_pandas_df(self, pandas_df: pandas.DataFrame) -> pandas.DataFrame:
+        """
+        Post-process the columns of the query results if needed, and set the index.
+        e.g. in BigQuery we represent UUIDs as text, so we convert the strings that the query gives us into
+        UUID objects
+        """
         for name, series in self.all_series.items():
             to_pandas_info = series.to_pandas_info()
-            if to_pandas_info is not None and to_pandas_info.function is not None:
+            if to_pandas_info is None:
+                continue
+            if to_pandas_info.series_function is not None:
+                pandas_df[name] = to_pandas_info.series_function(pandas_df[name])
+            elif to_pandas_info.function is not None:
                 pandas_df[name] = pandas_df[name].apply(to_pandas_info.function)
 
         if self.index:
@@ -1994,7 +2057,7 @@ class DataFrame:
     def get_current_node(
         self,
         name: str,
-        limit: Union[int, slice] = None,
+        limit: Optional[Union[int, slice]] = None,
         distinct: bool = False,
         where_clause: Expression = None,
         having_clause: Expression = None,
@@ -2102,6 +2165,14 @@ class DataFrame:
         :returns: SQL query
         """
 
+        model = self._get_final_model(limit=limit)
+        return to_sql(dialect=self.engine.dialect, model=model)
+
+    def _get_final_model(self, limit: Optional[Union[int, slice]] = None) -> SqlModel:
+        """
+        INTERNAL: Get the model to query the current state of this DataFrame, with all variable values set.
+        The model is optimized and should only be used to generate sql.
+        """
         # we need to construct each multi-level series, since it should resemble the final result
         model = self.get_current_node('view_sql', limit=limit, construct_multi_levels=True)
         placeholder_values = get_variable_values_sql(
@@ -2109,7 +2180,26 @@ class DataFrame:
             variable_values=self.variables
         )
         model = update_placeholders_in_graph(start_node=model, placeholder_values=placeholder_values)
-        return to_sql(dialect=self.engine.dialect, model=model)
+        return optimize_if_enabled(dialect=self.engine.dialect, start_node=model)
+
+    def _get_sql_statements(
+        self,
+        limit: Optional[Union[int, slice]] = None,
+        materialize_shared: bool = False
+    ) -> List[str]:
+        """
+        INTERNAL: Get the sql statements that to_pandas() executes. The last statement is the query, any
+        other statements create temporary tables that the query uses.
+        See :py:meth:`to_pandas` for the parameters.
+        """
+        if materialize_shared and not is_postgres(self.engine):
+            raise DatabaseNotSupportedException(
+                self.engine, f'materialize_shared is not supported for this SQL dialect: {self.engine.name}'
+            )
+        model = self._get_final_model(limit=limit)
+        if materialize_shared:
+            model = materialize_shared_models(start_node=model)
+        return to_sql_statements(dialect=self.engine.dialect, start_node=model)
 
     def merge(
         self,
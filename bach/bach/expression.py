@@ -18,12 +18,25 @@ if TYPE_CHECKING:
 @dataclass(frozen=True)
 class ExpressionToken:
     """ Abstract base class of ExpressionTokens"""
+    # Subclasses define __slots__ with their fields, as there can be many tokens in memory.
+    __slots__ = ()
 
     def __post_init__(self):
         # Make sure that other code can rely on an ExpressionToken always being a subclass of this class.
         if self.__class__ == ExpressionToken:
             raise TypeError("Cannot instantiate ExpressionToken directly. Instantiate a subclass.")
 
+    def __getstate__(self):
+        # Needed for copying and pickling: the default implementation would use setattr() to restore the
+        # slots, which is not allowed on a frozen dataclass.
+        slots: Tuple[str, ...] = type(self).__slots__
+        return tuple(getattr(self, slot) for slot in slots)
+
+    def __setstate__(self, state):
+        slots: Tuple[str, ...] = type(self).__slots__
+        for slot, value in zip(slots, state):
+            object.__setattr__(self, slot, value)
+
     def to_sql(self, dialect: Dialect):
         """
         Must be implemented by subclasses. Generated SQL must be assumed to be used as raw sql in
@@ -37,6 +50,7 @@ class ExpressionToken:
 
 @dataclass(frozen=True)
 class RawToken(ExpressionToken):
+    __slots__ = ('raw', )
     raw: str
 
     def to_sql(self, dialect: Dialect) -> str:
@@ -45,6 +59,7 @@ class RawToken(ExpressionToken):
 
 @dataclass(frozen=True)
 class VariableToken(ExpressionToken):
+    __slots__ = ('dtype', 'name')
     dtype: str
     name: str
 
@@ -74,6 +89,7 @@ class VariableToken(ExpressionToken):
 
 @dataclass(frozen=True)
 class TableColumnReferenceToken(ExpressionToken):
+    __slots__ = ('table_name', 'column_name')
     table_name: Optional[str]
     column_name: str
 
@@ -85,6 +101,7 @@ class TableColumnReferenceToken(ExpressionToken):
 
 @dataclass(frozen=True)
 class ColumnReferenceToken(ExpressionToken):
+    __slots__ = ('column_name', )
     column_name: str
 
     def to_sql(self, dialect: Dialect):
@@ -97,6 +114,7 @@ class ColumnReferenceToken(ExpressionToken):
 
 @dataclass(frozen=True)
 class ModelReferenceToken(ExpressionToken):
+    __slots__ = ('model', )
     model: 'BachSqlModel'
 
     def refname(self) -> str:
@@ -109,6 +127,7 @@ class ModelReferenceToken(ExpressionToken):
 @dataclass(frozen=True)
 class StringValueToken(ExpressionToken):
     """ Wraps a string value. The value in this object is unescaped and unquoted. """
+    __slots__ = ('value', )
     value: str
 
     def to_sql(self, dialect: Dialect) -> str:
@@ -117,6 +136,7 @@ class StringValueToken(ExpressionToken):
 
 @dataclass(frozen=True)
 class IdentifierToken(ExpressionToken):
+    __slots__ = ('name', )
     name: str
 
     def to_sql(self, dialect: Dialect) -> str:
@@ -138,7 +158,12 @@ class Expression:
     needed use-cases. Most sql is simply encoded as a 'raw' token.
 
     For special type Expressions, this class is subclassed to assign special properties to a subexpression.
+
+    As Expressions are immutable, the generated sql and the hash are cached on the instance.
     """
+    __slots__ = ('_data', '_hash', '_sql_cache')
+    # String used to join the sql of the items in data
+    _sql_separator = ''
 
     def __init__(self, data: Union['Expression', Sequence[Union[ExpressionToken, 'Expression']]] = None):
         if not data:
@@ -147,19 +172,33 @@ class Expression:
             # if we only got a base Expression, we absorb it.
             data = data.data if type(data) is Expression else [data]
         self._data: Tuple[Union[ExpressionToken, 'Expression'], ...] = tuple(data)
+        self._hash: Optional[int] = None
+        # Mapping (dialect name, table_name) to sql
+        self._sql_cache: Dict[Tuple[str, Optional[str]], str] = {}
 
     @property
     def data(self) -> List[Union[ExpressionToken, 'Expression']]:
         return list(self._data)
 
     def __eq__(self, other):
-        return isinstance(other, Expression) and self.data == other.data
+        return isinstance(other, Expression) and self._data == other._data
 
     def __repr__(self):
         return f'{self.__class__}({repr(self.data)})'
 
     def __hash__(self):
-        return hash(self._data)
+        if self._hash is None:
+            self._hash = hash(self._data)
+        return self._hash
+
+    def __getstate__(self):
+        # Don't include the cached values: hash values of strings differ between Python processes.
+        return self._data
+
+    def __setstate__(self, state):
+        self._data = state
+        self._hash = None
+        self._sql_cache = {}
 
     @classmethod
     def construct(cls, fmt: str, *args: Union['Expression', 'Series']) -> 'Expression':
@@ -286,7 +325,7 @@ class Expression:
         True iff we are a AggregateFunctionExpression, or there is at least one in this Expression.
         """
         return isinstance(self, AggregateFunctionExpression) or any(
-            d.has_aggregate_function for d in self.data if isinstance(d, Expression)
+            d.has_aggregate_function for d in self._data if isinstance(d, Expression)
         )
 
     @property
@@ -295,7 +334,7 @@ class Expression:
         True iff we are a WindowFunctionExpression, or there is at least one in this Expression.
         """
         return isinstance(self, WindowFunctionExpression) or any(
-            d.has_windowed_aggregate_function for d in self.data if isinstance(d, Expression)
+            d.has_windowed_aggregate_function for d in self._data if isinstance(d, Expression)
         )
 
     @property
@@ -310,13 +349,13 @@ class Expression:
     @property
     def has_multi_level_expressions(self) -> bool:
         return isinstance(self, MultiLevelExpression) or any(
-            d.has_multi_level_expressions for d in self.data if isinstance(d, Expression)
+            d.has_multi_level_expressions for d in self._data if isinstance(d, Expression)
         )
 
     def resolve_column_references(self, dialect: Dialect, table_name: Optional[str]) -> 'Expression':
         """ resolve the table name aliases for all columns in this expression """
         result: List[Union[ExpressionToken, Expression]] = []
-        for data_item in self.data:
+        for data_item in self._data:
             if isinstance(data_item, Expression):
                 result.append(data_item.resolve_column_references(dialect, table_name))
             elif isinstance(data_item, ColumnReferenceToken):
@@ -364,7 +403,7 @@ class Expression:
 
     def get_references(self) -> Dict[str, 'BachSqlModel']:
         rv = {}
-        for data_item in self.data:
+        for data_item in self._data:
             if isinstance(data_item, Expression):
                 rv.update(data_item.get_references())
             elif isinstance(data_item, ModelReferenceToken):
@@ -373,7 +412,7 @@ class Expression:
 
     def get_all_tokens(self) -> List[ExpressionToken]:
         result = []
-        for data_item in self.data:
+        for data_item in self._data:
             if isinstance(data_item, Expression):
                 result.extend(data_item.get_all_tokens())
             else:
@@ -387,10 +426,22 @@ class Expression:
             '"{table_name}"."{column_name}"' instead of just '"{column_name}"'.
         :return SQL representation of the expression.
         """
-        resolved_tables_expression = self.resolve_column_references(dialect, table_name)
-        return ''.join(
-            d.to_sql(dialect=dialect) for d in resolved_tables_expression.data
-        )
+        key = (dialect.name, table_name)
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            # Same result as compiling self.resolve_column_references(dialect, table_name), but without
+            # building a new expression tree.
+            parts = []
+            for d in self._data:
+                if isinstance(d, Expression):
+                    parts.append(d.to_sql(dialect, table_name))
+                elif isinstance(d, ColumnReferenceToken):
+                    parts.append(d.resolve(table_name).to_sql(dialect))
+                else:
+                    parts.append(d.to_sql(dialect))
+            sql = self._sql_separator.join(parts)
+            self._sql_cache[key] = sql
+        return sql
 
 
 class NonAtomicExpression(Expression):
@@ -400,11 +451,11 @@ class NonAtomicExpression(Expression):
     in parenthesis, e.g. `expression` `<` `ANY (subquery)` should probably have `expression` wrapped if it's
     a complex expression, but not the `ANY ...` part, since that would not be valid SQL.
     """
-    pass
+    __slots__ = ()
 
 
 class IndependentSubqueryExpression(Expression):
-    pass
+    __slots__ = ()
 
 
 class SingleValueExpression(Expression):
@@ -412,6 +463,8 @@ class SingleValueExpression(Expression):
     An Expression that is expected to return just one value.
     If wrapped around IndependentSubqueryExpression, this will still have is_independent_subquery == True
     """
+    __slots__ = ()
+
     @property
     def is_independent_subquery(self) -> bool:
         # If this Expression is wrapped around a IndependentSubqueryExpression, most likely, there will be
@@ -421,10 +474,12 @@ class SingleValueExpression(Expression):
 
 
 class ConstValueExpression(SingleValueExpression):
-    pass
+    __slots__ = ()
 
 
 class AggregateFunctionExpression(Expression):
+    __slots__ = ()
+
     @property
     def is_constant(self) -> bool:
         # We don't consider an aggregate function constant even if all its subexpressions are,
@@ -441,6 +496,8 @@ class WindowFunctionExpression(Expression):
     is contained within the expression.
 
     """
+    __slots__ = ()
+
     @property
     def is_constant(self) -> bool:
         # We don't consider an window expression constant even if all its subexpressions are,
@@ -458,13 +515,9 @@ class MultiLevelExpression(Expression):
     """
     A MultiLevelExpression contains multiple expressions referencing to different columns.
     """
-    def to_sql(self, dialect: Dialect, table_name: Optional[str] = None) -> str:
-        # same as original function, we just need to join by a comma since parent expression is composed
-        # by multiple column references
-        resolved_tables_expression = self.resolve_column_references(dialect, table_name)
-        return ','.join(
-            d.to_sql(dialect=dialect) for d in resolved_tables_expression.data
-        )
+    __slots__ = ()
+    # join by a comma since parent expression is composed by multiple column references
+    _sql_separator = ','
 
 
 def join_expressions(expressions: Sequence[Expression], join_str: str = ', ') -> Expression:
@@ -17,7 +17,7 @@ def get_dtypes_from_model(engine: Engine, node: SqlModel) -> Dict[str, Structure
     """ Create a temporary database table from model and use it to deduce the model's dtypes. """
     if not is_postgres(engine):
         raise DatabaseNotSupportedException(engine)
-    new_node = CustomSqlModelBuilder(sql='select * from {{previous}} limit 0')(previous=node)
+    new_node = CustomSqlModelBuilder(sql='select * from {{previous}} limit 0', has_ctes=False)(previous=node)
     select_statement = to_sql(dialect=engine.dialect, model=new_node)
     sql = f"""
         create temporary table tmp_table_name on commit drop as
@@ -151,7 +151,7 @@ def from_pandas_ephemeral(
     else:
         raise DatabaseNotSupportedException(engine)
 
-    model_builder = CustomSqlModelBuilder(sql=sql, name=name)
+    model_builder = CustomSqlModelBuilder(sql=sql, name=name, has_ctes=False)
     sql_model = model_builder()
 
     index = list(index_dtypes.keys())
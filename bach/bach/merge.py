@@ -625,6 +625,8 @@ def _get_expression(df_series: DataFrameOrSeries, label: str) -> Expression:
 
 
 class MergeSqlModel(BachSqlModel):
+    __slots__ = ('_merge_on', )
+
     def __init__(self, merge_on: MergeOn, *args, **kwargs):
         self._merge_on = merge_on
         super().__init__(*args,  **kwargs)
@@ -677,7 +679,7 @@ class MergeSqlModel(BachSqlModel):
         )
 
         return MergeSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
+            model_spec=CustomSqlModelBuilder(sql=sql, name=name, has_ctes=False),
             placeholders=cls._get_placeholders(dialect, variables, all_expressions),
             references=references,
             materialization=Materialization.CTE,
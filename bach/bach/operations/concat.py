@@ -327,6 +327,8 @@ class SeriesConcatOperation(ConcatOperation[Series]):
 
 
 class ConcatSqlModel(BachSqlModel):
+    __slots__ = ()
+
     @classmethod
     def get_instance(
         cls,
@@ -350,7 +352,7 @@ class ConcatSqlModel(BachSqlModel):
         )
 
         return ConcatSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
+            model_spec=CustomSqlModelBuilder(sql=sql, name=name, has_ctes=False),
             placeholders=cls._get_placeholders(dialect, variables, all_series_expressions),
             references=references,
             materialization=Materialization.CTE,
@@ -3,14 +3,18 @@ Copyright 2022 Objectiv B.V.
 """
 from collections import abc
 from enum import Enum
-from typing import Optional, Union, Sequence, List, Set
+from typing import Optional, Union, Sequence, List, Set, Dict, Tuple
+
+from sqlalchemy.engine import Dialect
 
 from bach import (
-    DataFrame, SeriesAbstractNumeric, DataFrameOrSeries, get_series_type_from_dtype,
+    DataFrame, SeriesAbstractNumeric, SeriesTimedelta, DataFrameOrSeries, get_series_type_from_dtype, Series,
 )
-from bach.operations.concat import DataFrameConcatOperation
 from bach.expression import Expression
-from sql_models.util import is_bigquery
+from bach.sql_model import BachSqlModel, construct_references
+from bach.utils import get_merged_series_dtype
+from sql_models.model import CustomSqlModelBuilder, Materialization
+from sql_models.util import is_bigquery, quote_identifier, quote_string
 
 
 class SupportedStats(Enum):
@@ -125,22 +129,47 @@ class DescribeOperation:
 
     def __call__(self) -> DataFrame:
         """
-        Generates an aggregated dataframe per stat and concatenates all results into a new dataframe
-        containing all descriptive statistics of the dataset.
+        Calculates all stats and percentiles of all described series in a single aggregation, and unpivots
+        the result into a new dataframe containing all descriptive statistics of the dataset, with one row
+        per stat.
 
-        Values are sorted based on the position of the stat in SupportedStats.
+        Values are sorted based on the position of the stat in SupportedStats, followed by the percentiles.
         """
-        all_stats_df = []
-        for pos, stat in enumerate(SupportedStats):
-            stat_df = self._calculate_stat(stat=stat, stat_position=pos)
-            if stat_df:
-                all_stats_df.append(stat_df)
-
-        percentiles_df = self._calculate_percentiles()
-        if percentiles_df:
-            all_stats_df.append(percentiles_df)
-
-        describe_df = DataFrameConcatOperation(objects=all_stats_df)()
+        stats_df, stat_columns = self._calculate_stats()
+        all_stat_names = [stat.value for stat in SupportedStats] + [str(pt) for pt in self.percentiles]
+        # only return rows for stats that are calculated for at least one series
+        positions = sorted({position for columns in stat_columns.values() for position in columns})
+        stat_names = {position: all_stat_names[position] for position in positions}
+
+        series_dtypes: Dict[str, str] = {}
+        series_expressions: Dict[str, Dict[int, Expression]] = {}
+        for series_name, columns in stat_columns.items():
+            dtype = get_merged_series_dtype({stats_df.data[column].dtype for column in columns.values()})
+            series_dtypes[series_name] = dtype
+            series_expressions[series_name] = {
+                position: stats_df.data[column].astype(dtype).expression
+                for position, column in columns.items()
+            }
+
+        describe_df = stats_df.copy_override(
+            base_node=DescribeSqlModel.get_instance(
+                dialect=stats_df.engine.dialect,
+                stats_node=stats_df.base_node,
+                stat_names=stat_names,
+                stat_series_name=self.STAT_SERIES_NAME,
+                series_expressions=series_expressions,
+            ),
+            index={},
+            series=None,
+            group_by=None,
+            order_by=[],
+            index_dtypes={},
+            series_dtypes={
+                self.STAT_SERIES_NAME: 'string',
+                f'{self.STAT_SERIES_NAME}_position': 'int64',
+                **series_dtypes,
+            },
+        )
         describe_df = describe_df.sort_values(by=f'{self.STAT_SERIES_NAME}_position')
         describe_df = describe_df.round(decimals=self.RESULT_DECIMALS)
         describe_df = describe_df.set_index(self.STAT_SERIES_NAME)
@@ -151,92 +180,135 @@ class DescribeOperation:
         ]
         return describe_df[all_described_series]  # type: ignore
 
-    def _calculate_stat(
-        self,
-        stat: SupportedStats,
-        stat_position: int,
-    ) -> Optional[DataFrame]:
-        """
-        Returns an aggregated dataframe based on the stat to be calculated.
-        :param series_to_aggregate: List of series names that stat supports
-        :param stat: aggregation to be calculated
-        :param stat_position: position of the stat in the final result
+    def _calculate_stats(self) -> Tuple[DataFrame, Dict[str, Dict[int, str]]]:
         """
-        # filter series that can perform the aggregation
-        series_to_aggregate = []
-        for s in self.series_to_describe:
-            # check one: function exists on Series
-            if not hasattr(self.df[s], stat.value):
-                continue
-            # check two: function doesn't raise NotImplementedError
-            try:
-                self.df[s].apply_func(stat.value)
-            except NotImplementedError:
-                continue
-            series_to_aggregate.append(s)
-
-        if not series_to_aggregate:
-            return None
-
-        stat_df = self.df.copy_override(
-            series={
-                s: self.df[s].copy_override(index={})
-                for s in series_to_aggregate
-            }, index={}
+        Returns a materialized dataframe with a single row containing all stats and percentiles of all
+        described series, which are calculated in a single select statement. Stats that are not supported
+        by a series are skipped.
 
+        Additionally returns per described series a dictionary mapping the position of each calculated stat
+        to the name of its series in the returned dataframe.
+        """
+        df = self.df.copy_override(
+            series={s: self.df[s].copy_override(index={}) for s in self.series_to_describe},
+            index={},
+            order_by=[],
         )
-        original_series_names = stat_df.data_columns
-        stat_df = stat_df.agg(func=stat.value).materialize()
 
-        # original column names should remain
-        stat_df = stat_df.rename(
-            columns=dict(zip(stat_df.data_columns, original_series_names)),
+        # BigQuery only supports percentile_cont as window function, which cannot be combined with the
+        # aggregations. Add the percentiles as columns first, these have the same value for all rows.
+        percentile_columns: Dict[Tuple[str, int], str] = {}
+        if is_bigquery(df.engine):
+            for series_name in self.series_to_describe:
+                series = df.all_series[series_name]
+                if not isinstance(series, (SeriesAbstractNumeric, SeriesTimedelta)):
+                    continue
+                for pos, pt in enumerate(self.percentiles):
+                    column_name = f'__percentile_{len(percentile_columns)}'
+                    df[column_name] = series.quantile(q=pt)
+                    percentile_columns[(series_name, pos)] = column_name
+            if percentile_columns:
+                df = df.materialize(node_name='describe_percentiles')
+
+        grouped_df = df.groupby()
+        stat_series: Dict[str, Series] = {}
+        stat_columns: Dict[str, Dict[int, str]] = {}
+        for series_name in self.series_to_describe:
+            series = grouped_df.all_series[series_name]
+            calculated: Dict[int, Series] = {}
+            for pos, stat in enumerate(SupportedStats):
+                if not hasattr(series, stat.value):
+                    continue
+                try:
+                    calculated[pos] = getattr(series, stat.value)()
+                except NotImplementedError:
+                    continue
+
+            for pos, pt in enumerate(self.percentiles):
+                position = len(SupportedStats) + pos
+                if (series_name, pos) in percentile_columns:
+                    calculated[position] = grouped_df.all_series[percentile_columns[(series_name, pos)]].max()
+                elif (
+                    not is_bigquery(df.engine)
+                    and isinstance(series, (SeriesAbstractNumeric, SeriesTimedelta))
+                ):
+                    calculated[position] = series.quantile(q=pt)
+
+            if not calculated:
+                continue
+            stat_columns[series_name] = {}
+            for position, result in calculated.items():
+                column_name = f'__stat_{len(stat_series)}'
+                stat_series[column_name] = result.copy_override(name=column_name)
+                stat_columns[series_name][position] = column_name
+
+        if not stat_series:
+            raise ValueError('None of the described series supports any of the stats.')
+        new_index = next(iter(stat_series.values())).index
+        stats_df = grouped_df.copy_override(
+            index=new_index, group_by=grouped_df.group_by, series=stat_series,
         )
-        stat_df[self.STAT_SERIES_NAME] = stat.value
-        stat_df[f'{self.STAT_SERIES_NAME}_position'] = stat_position
-        return stat_df
+        stats_df = stats_df.materialize(node_name='describe_stats')
+        return stats_df, stat_columns
+
+
+class DescribeSqlModel(BachSqlModel):
+    """
+    Model that unpivots the single row of a model with all calculated stats into one row per stat. The
+    stat names are a `union all` of constant selects, which is cross joined with the stats row.
+    """
+    __slots__ = ()
 
-    def _calculate_percentiles(self) -> Optional[DataFrame]:
+    @classmethod
+    def get_instance(
+        cls,
+        *,
+        dialect: Dialect,
+        stats_node: BachSqlModel,
+        stat_names: Dict[int, str],
+        stat_series_name: str,
+        series_expressions: Dict[str, Dict[int, Expression]],
+    ) -> 'DescribeSqlModel':
         """
-        Returns dataframe containing percentiles per each numerical series.
+        :param stats_node: model with a single row, containing all calculated stats
+        :param stat_names: mapping from the position of each stat to its name
+        :param stat_series_name: name of the series containing the stat names. The series containing the
+            positions is named f'{stat_series_name}_position'
+        :param series_expressions: per result series, a dictionary mapping the position of a stat to the
+            expression that gives the value of that stat in stats_node. For missing stats the value is NULL
         """
-        # filter series that can perform the aggregation 'quantile' operation
-        series_to_aggregate = {
-            s: self.df[s] for s in self.series_to_describe if hasattr(self.df[s], 'quantile')
-        }
-        if not series_to_aggregate:
-            return None
-
-        percentile_df: DataFrame = self.df.copy_override(series=series_to_aggregate)
-        percentile_df = percentile_df.reset_index(drop=True)
-
-        percentile_df = percentile_df.quantile(q=list(self.percentiles))
-        has_q_index = 'quantile' in percentile_df.all_series
-
-        columns_rename = {
-            col: col.replace('_quantile', '')
-            for col in percentile_df.data_columns
-        }
-        percentile_df = percentile_df.reset_index(drop=not has_q_index)
-
-        if not has_q_index:
-            percentile_df['quantile'] = self.percentiles[0]
-
-        # original column names should remain
-        columns_rename['quantile'] = self.STAT_SERIES_NAME
-        percentile_df = percentile_df.rename(columns=columns_rename)
-        current_position = len(SupportedStats)
-
-        # SeriesFloat64 + int is not supported, need an expression
-        percentile_df[f'{self.STAT_SERIES_NAME}_position'] = (
-            percentile_df[self.STAT_SERIES_NAME].copy_override(
-                expression=Expression.construct(
-                    f'{current_position} + {{}}', percentile_df.all_series[self.STAT_SERIES_NAME],
-                ),
+        name_column = quote_identifier(dialect, stat_series_name)
+        position_column = quote_identifier(dialect, f'{stat_series_name}_position')
+        stat_names_sql = ' union all '.join(
+            f'select {quote_string(dialect, stat_name)} as {name_column}, {position} as {position_column}'
+            for position, stat_name in stat_names.items()
+        )
+
+        all_expressions: List[Expression] = []
+        column_exprs = [Expression.column_reference(stat_series_name)]
+        for series_name, expressions in series_expressions.items():
+            case_expr = Expression.construct(
+                'case {} ' + ' '.join(f'when {position} then {{}}' for position in expressions) + ' end',
+                Expression.column_reference(f'{stat_series_name}_position'),
+                *expressions.values()
             )
+            all_expressions.extend(expressions.values())
+            column_exprs.append(Expression.construct_expr_as_name(expr=case_expr, name=series_name))
+
+        columns_sql = ', '.join(expr.to_sql(dialect) for expr in column_exprs)
+        sql = (
+            f'select {columns_sql}, {position_column} '
+            f'from {{{{stats}}}} cross join ({stat_names_sql}) as stat_names'
         )
 
-        if is_bigquery(percentile_df.engine):
-            # BigQuery returns quantile per row, need to apply distinct
-            percentile_df = percentile_df.materialize(node_name='describe_quantile', distinct=True)
-        return percentile_df
+        column_names = [stat_series_name, f'{stat_series_name}_position'] + list(series_expressions.keys())
+        return DescribeSqlModel(
+            model_spec=CustomSqlModelBuilder(sql=sql, name='describe', has_ctes=False),
+            placeholders={},
+            references=construct_references(
+                base_references={'stats': stats_node}, expressions=all_expressions,
+            ),
+            materialization=Materialization.CTE,
+            materialization_name=None,
+            column_expressions={c: Expression.column_reference(c) for c in column_names},
+        )
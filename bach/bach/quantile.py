@@ -1,29 +1,105 @@
-from typing import cast, Union, List
+from fractions import Fraction
+from math import gcd
+from typing import Union, List, Tuple, Dict, Optional
 
-from bach import SeriesString
+from sqlalchemy.engine import Dialect
+
+from bach import SeriesFloat64
 from bach.series import SeriesAbstractNumeric, SeriesTimedelta, Series
-from bach.expression import Expression, AggregateFunctionExpression, WindowFunctionExpression
+from bach.expression import Expression, AggregateFunctionExpression, join_expressions
 from bach.series.series import WrappedPartition
-from sql_models.util import is_bigquery
+from bach.sql_model import BachSqlModel, construct_references
+from sql_models.model import CustomSqlModelBuilder, Materialization
+from sql_models.util import is_bigquery, quote_identifier
+
+# Maximum number of buckets used for approx_quantiles() on BigQuery
+_APPROX_QUANTILES_MAX_BUCKETS = 1000
 
 
 def calculate_quantiles(
     series: Union[SeriesTimedelta, SeriesAbstractNumeric],
     partition: WrappedPartition = None,
     q: Union[float, List[float]] = 0.5,
+    approximate: bool = False,
 ) -> Series:
     """
     When q is a float or len(q) == 1, the resultant series index will remain
     In case multiple quantiles are calculated, the resultant series index will have all calculated
     quantiles as index values.
+
+    Multiple quantiles are calculated in a single aggregation. On Postgres all quantiles are calculated by a
+    single percentile_cont() call, of which the result is unnested.
+
+    If approximate is True, then on BigQuery approx_quantiles() is used, which is an aggregate function,
+    instead of the percentile_cont() window function. On Postgres the result is always exact.
     """
     quantiles = [q] if isinstance(q, float) else q
-    quantile_results = []
+    for qt in quantiles:
+        if qt < 0 or qt > 1:
+            raise ValueError(f'value {qt} should be between 0 and 1.')
 
     partition = partition or series.group_by
-    #  BigQuery requires a window function for quantiles, window frame clause is not allowed
-    window = None
     if is_bigquery(series.engine):
+        return _calculate_quantiles_bigquery(series, partition, quantiles, approximate)
+
+    if len(quantiles) == 1:
+        qt = quantiles[0]
+        return series.copy_override(name=str(qt))._derived_agg_func(
+            partition=partition,
+            expression=AggregateFunctionExpression.construct(
+                f'percentile_cont({qt}) within group (order by {{}})', series,
+            ),
+        )
+
+    # Calculate all quantiles at once, and unnest the quantiles together with the resulting values.
+    quantiles_array = f"cast(array[{', '.join(str(qt) for qt in quantiles)}] as double precision[])"
+    agg_result = series._derived_agg_func(
+        partition=partition,
+        expression=Expression.construct(
+            'unnest({})',
+            AggregateFunctionExpression.construct(
+                f'percentile_cont({quantiles_array}) within group (order by {{}})', series,
+            ),
+        ),
+    )
+    # The quantiles are unnested once per group, in the same order as the aggregated values. As such we
+    # treat it as an aggregated series too.
+    q_result = agg_result.copy_override_type(SeriesFloat64).copy_override(
+        name='q', expression=AggregateFunctionExpression.construct(f'unnest({quantiles_array})'),
+    )
+    df = agg_result.to_frame()
+    df['q'] = q_result
+
+    final_index = (df.index_columns if partition else []) + ['q']
+    df = df.materialize(node_name='quantile')
+    df = df.reset_index(drop=False)
+    return df.set_index(final_index)[series.name]
+
+
+def _calculate_quantiles_bigquery(
+    series: Union[SeriesTimedelta, SeriesAbstractNumeric],
+    partition: Optional[WrappedPartition],
+    quantiles: List[float],
+    approximate: bool,
+) -> Series:
+    """
+    Calculate the quantiles on BigQuery. All quantiles are calculated as separate columns of a single
+    select, which are unnested if there are multiple quantiles.
+    """
+    if approximate:
+        buckets, offsets = _get_approx_quantiles_offsets(quantiles)
+        quantile_results = [
+            series.copy_override(name=_get_bigquery_quantile_name(qt))._derived_agg_func(
+                partition=partition,
+                expression=AggregateFunctionExpression.construct(
+                    f'approx_quantiles({{}}, {buckets})[offset({offset})]', series,
+                ),
+                dtype='float64',
+            )
+            for qt, offset in zip(quantiles, offsets)
+        ]
+    else:
+        #  BigQuery requires a window function for quantiles, window frame clause is not allowed
         from bach.partitioning import Window, GroupBy
         group_by = None
         if partition:
@@ -34,53 +110,106 @@ def calculate_quantiles(
             start_boundary=None,
             end_boundary=None,
         )
-
-    for qt in quantiles:
-        if qt < 0 or qt > 1:
-            raise ValueError(f'value {qt} should be between 0 and 1.')
-
-        if is_bigquery(series.engine):
-            # BigQuery names should start with a letter or underscore. Dots are not valid
-            q_col_name = f"__q_{str(qt).replace('.', '_')}"
-            agg_result = series.copy_override(name=q_col_name)._derived_agg_func(
+        quantile_results = [
+            series.copy_override(name=_get_bigquery_quantile_name(qt))._derived_agg_func(
                 partition=window,
                 expression=Expression.construct(f'percentile_cont({{}}, {qt})', series),
                 dtype='float64',
             )
-        else:
-            agg_result = series.copy_override(name=str(qt))._derived_agg_func(
-                partition=partition,
-                expression=AggregateFunctionExpression.construct(
-                    f'percentile_cont({qt}) within group (order by {{}})', series,
-                ),
-            )
-
-        quantile_results.append(agg_result)
+            for qt in quantiles
+        ]
 
     base_q = quantile_results[0]
     if len(quantile_results) == 1:
         return base_q
 
     df = base_q.to_frame().copy_override(series={s.name: s for s in quantile_results})
-    # stack all series into one. q values are in index
-    # should keep q index since multiple quantiles were calculated
-    final_index = (df.index_columns if partition else []) + ['q']
-    df = df.stack().to_frame()
-    df = df.reset_index(drop=False).rename(columns={'__stacked_index': 'q', '__stacked': series.name})
-    df = df[final_index + [series.name]]
+    index_columns = df.index_columns if partition else []
+    df = df.reset_index(drop=False)[index_columns + [s.name for s in quantile_results]]
+    # The window function returns the quantiles for each row, need to apply distinct
+    df = df.materialize(node_name='quantile', distinct=not approximate)
 
-    if is_bigquery(series.engine):
-        # TODO: replace with df['q'].str[2:].str.replace('_', '.') when supported
-        df['q'] = df['q'].copy_override(
-            expression=Expression.construct(
-                f"replace({{}}, '_', '.')",
-                df['q'].copy_override_type(SeriesString).str[4:],
-            ),
-        )
+    unnested_df = df.copy_override(
+        base_node=QuantileUnnestSqlModel.get_instance(
+            dialect=df.engine.dialect,
+            quantiles_node=df.base_node,
+            index_columns=index_columns,
+            quantiles={qt: df.all_series[s.name].expression for qt, s in zip(quantiles, quantile_results)},
+            name=series.name,
+        ),
+        index={},
+        series=None,
+        index_dtypes={},
+        series_dtypes={
+            **{column: df.all_series[column].dtype for column in index_columns},
+            'q': 'float64',
+            series.name: 'float64',
+        },
+    )
+    return unnested_df.set_index(index_columns + ['q'])[series.name]
 
-        # BigQuery returns quantile per row, need to apply distinct
-        df = df.materialize(node_name='quantile', distinct=True)
 
-    # q values should be numeric
-    df['q'] = df['q'].astype(float)
-    return df.set_index(final_index)[series.name]
+def _get_bigquery_quantile_name(qt: float) -> str:
+    """ BigQuery names should start with a letter or underscore. Dots are not valid """
+    return f"__q_{str(qt).replace('.', '_')}"
+
+
+def _get_approx_quantiles_offsets(quantiles: List[float]) -> Tuple[int, List[int]]:
+    """
+    Determine the number of buckets to use for approx_quantiles(), and the offset of each quantile in the
+    returned array. The number of buckets is chosen such that all offsets are exact if possible, with a
+    maximum of _APPROX_QUANTILES_MAX_BUCKETS.
+    """
+    buckets = 1
+    for qt in quantiles:
+        denominator = Fraction(qt).limit_denominator(_APPROX_QUANTILES_MAX_BUCKETS).denominator
+        buckets = buckets * denominator // gcd(buckets, denominator)
+    buckets = min(buckets, _APPROX_QUANTILES_MAX_BUCKETS)
+    return buckets, [round(qt * buckets) for qt in quantiles]
+
+
+class QuantileUnnestSqlModel(BachSqlModel):
+    """
+    Model that unnests the quantile columns of a model into one row per quantile, with the quantile in the
+    'q' column. Only supported on BigQuery.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def get_instance(
+        cls,
+        *,
+        dialect: Dialect,
+        quantiles_node: BachSqlModel,
+        index_columns: List[str],
+        quantiles: Dict[float, Expression],
+        name: str,
+    ) -> 'QuantileUnnestSqlModel':
+        """
+        :param quantiles_node: model containing the index columns and a column per quantile
+        :param index_columns: names of the columns of quantiles_node that should be returned as is
+        :param quantiles: mapping from each quantile to the expression of its value in quantiles_node
+        :param name: name of the column containing the values of the quantiles
+        """
+        quantiles_sql = ', '.join(str(qt) for qt in quantiles)
+        values_sql = join_expressions(list(quantiles.values())).to_sql(dialect)
+        columns_sql = ''.join(
+            f'{quote_identifier(dialect, column)}, ' for column in index_columns
+        )
+        sql = (
+            f'select {columns_sql}'
+            f'[{quantiles_sql}][offset(__offset)] as {quote_identifier(dialect, "q")}, '
+            f'__value as {quote_identifier(dialect, name)} '
+            f'from {{{{quantiles}}}} cross join unnest([{values_sql}]) as __value with offset as __offset'
+        )
+        column_names = index_columns + ['q', name]
+        return QuantileUnnestSqlModel(
+            model_spec=CustomSqlModelBuilder(sql=sql, name='quantile_unnest', has_ctes=False),
+            placeholders={},
+            references=construct_references(
+                base_references={'quantiles': quantiles_node}, expressions=list(quantiles.values()),
+            ),
+            materialization=Materialization.CTE,
+            materialization_name=None,
+            column_expressions={c: Expression.column_reference(c) for c in column_names},
+        )
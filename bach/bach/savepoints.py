@@ -288,7 +288,7 @@ def _get_virtual_node(references: Dict[str, BachSqlModel]) -> SqlModel:
     # reference_sql is of form "{{ref_0}}, {{1}}, ..., {{n}}"
     reference_sql = ', '.join(f'{{{{{ref_name}}}}}' for ref_name in references.keys())
     sql = f'select * from {reference_sql}'
-    return CustomSqlModelBuilder(name='virtual_node', sql=sql)\
+    return CustomSqlModelBuilder(name='virtual_node', sql=sql, has_ctes=False)\
         .set_materialization(Materialization.VIRTUAL_NODE)\
         .set_values(**references)\
         .instantiate()
@@ -4,7 +4,7 @@ Copyright 2021 Objectiv B.V.
 from abc import ABC, abstractmethod
 from copy import copy, deepcopy
 from typing import Optional, Dict, Tuple, Union, Type, Any, List, cast, TYPE_CHECKING, Callable, Mapping, \
-    TypeVar, Sequence, NamedTuple
+    TypeVar, Sequence, NamedTuple, Iterator
 from uuid import UUID
 
 import numpy
@@ -40,7 +40,10 @@ class ToPandasInfo(NamedTuple):
     INTERNAL: Used to encode how to go from raw database result to pandas object, see Series.to_pandas_info.
     """
     dtype: str
+    # function that is applied to each value
     function: Optional[Callable[[Any], Any]]
+    # function that is applied to the whole pandas Series at once. If set, `function` is not used.
+    series_function: Optional[Callable[[pandas.Series], pandas.Series]] = None
 
 
 class Series(ABC):
@@ -567,6 +570,8 @@ class Series(ABC):
         ToPandasInfo defines both the pandas-dtype of the data, and an optional function to apply to query
         results. If defined for a given DBDialect, we use this information in :meth:`DataFrame.to_pandas()`,
         by setting the dtype and applying the function to columns of the resulting pandas DataFrame.
+        Where possible, a vectorized series_function should be defined instead of a function that is applied
+        to each value.
 
         Example usage: UUIDs in BigQuery are represented as strings, we convert these strings to UUID
         objects in to_pandas().
@@ -721,12 +726,35 @@ class Series(ABC):
         other_series = df.all_series[mod_other_name]
         return caller_series, other_series
 
-    def to_pandas(self, limit: Union[int, slice] = None) -> pandas.Series:
+    def to_pandas(
+        self,
+        limit: Union[int, slice] = None,
+        materialize_shared: bool = False
+    ) -> pandas.Series:
         """
         Get the data from this series as a pandas.Series
         :param limit: The limit to apply, either as a max amount of rows or a slice.
+        :param materialize_shared: See :py:meth:`DataFrame.to_pandas`
         """
-        return self.to_frame().to_pandas(limit=limit)[self.name]
+        return self.to_frame().to_pandas(limit=limit, materialize_shared=materialize_shared)[self.name]
+
+    def iter_pandas(
+        self,
+        chunksize: int,
+        limit: Optional[Union[int, slice]] = None,
+        materialize_shared: bool = False
+    ) -> Iterator[pandas.Series]:
+        """
+        Get the data from this series as an iterator over pandas.Series of at most `chunksize` rows each.
+        See :py:meth:`DataFrame.iter_pandas`
+
+        .. note::
+            This function queries the database.
+        """
+        chunks = self.to_frame().iter_pandas(
+            chunksize=chunksize, limit=limit, materialize_shared=materialize_shared,
+        )
+        return (chunk[self.name] for chunk in chunks)
 
     def head(self, n: int = 5) -> pandas.Series:
         """
@@ -7,6 +7,7 @@ from enum import Enum
 from typing import Union, cast, List, Tuple, Optional
 
 import numpy
+import pandas
 from sqlalchemy.engine import Dialect
 
 from bach import DataFrame
@@ -155,10 +156,8 @@ class SeriesAbstractDateTime(Series, ABC):
             return series
 
 
-def dt_strip_timezone(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
-    if value is None:
-        return None
-    return value.replace(tzinfo=None)
+def dt_strip_timezone(series: pandas.Series) -> pandas.Series:
+    return series.dt.tz_localize(None)
 
 
 class SeriesTimestamp(SeriesAbstractDateTime):
@@ -238,7 +237,7 @@ class SeriesTimestamp(SeriesAbstractDateTime):
         if is_postgres(self.engine):
             return ToPandasInfo('datetime64[ns]', None)
         if is_bigquery(self.engine):
-            return ToPandasInfo('datetime64[ns, UTC]', dt_strip_timezone)
+            return ToPandasInfo('datetime64[ns, UTC]', None, series_function=dt_strip_timezone)
         return None
 
     def __add__(self, other) -> 'Series':
@@ -467,13 +466,19 @@ class SeriesTimedelta(SeriesAbstractDateTime):
         return cast('SeriesTimedelta', result)
 
     def quantile(
-        self, partition: WrappedPartition = None, q: Union[float, List[float]] = 0.5,
+        self,
+        partition: WrappedPartition = None,
+        q: Union[float, List[float]] = 0.5,
+        approximate: bool = False,
     ) -> 'SeriesTimedelta':
         """
         When q is a float or len(q) == 1, the resultant series index will remain
         In case multiple quantiles are calculated, the resultant series index will have all calculated
         quantiles as index values.
+
+        :param approximate: if True, calculate approximate quantiles on BigQuery. See
+            :py:meth:`SeriesAbstractNumeric.quantile`
         """
         from bach.quantile import calculate_quantiles
-        result = calculate_quantiles(series=self.copy(), partition=partition, q=q)
+        result = calculate_quantiles(series=self.copy(), partition=partition, q=q, approximate=approximate)
         return cast('SeriesTimedelta', result)
@@ -159,7 +159,11 @@ class SeriesAbstractNumeric(Series, ABC):
         )
 
     def quantile(
-        self, partition: WrappedPartition = None, q: Union[float, List[float]] = 0.5, **kwargs
+        self,
+        partition: WrappedPartition = None,
+        q: Union[float, List[float]] = 0.5,
+        approximate: bool = False,
+        **kwargs
     ) -> 'SeriesFloat64':
         """
         When q is a float or len(q) == 1, the resultant series index will remain
@@ -168,9 +172,11 @@ class SeriesAbstractNumeric(Series, ABC):
 
         :param partition: The partition or window to apply
         :param q: A quantile or list of quantiles to be calculated
+        :param approximate: if True, calculate approximate quantiles with ``APPROX_QUANTILES`` on BigQuery,
+            which is considerably cheaper for large datasets. On Postgres the quantiles are always exact.
         """
         from bach.quantile import calculate_quantiles
-        result = calculate_quantiles(self, partition=partition, q=q)
+        result = calculate_quantiles(self, partition=partition, q=q, approximate=approximate)
         return cast('SeriesFloat64', result)
 
     def var(self, partition: WrappedPartition = None, skipna: bool = True, ddof: int = None, **kwargs):
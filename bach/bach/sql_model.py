@@ -2,14 +2,18 @@
 Copyright 2021 Objectiv B.V.
 """
 import typing
-from typing import Dict, TypeVar, Tuple, List, Optional, Mapping, Hashable, Union
+from typing import (
+    Dict, TypeVar, Tuple, List, Optional, Mapping, Hashable, Union, NamedTuple, Set, cast, overload,
+)
 
 from sqlalchemy.engine import Dialect
 
-from bach.expression import Expression, get_variable_tokens, VariableToken
+from bach.expression import Expression, get_variable_tokens, VariableToken, ColumnReferenceToken, \
+    TableColumnReferenceToken, RawToken, IdentifierToken, ExpressionToken, StringValueToken, \
+    ModelReferenceToken, IndependentSubqueryExpression
 from bach.types import value_to_dtype, get_series_type_from_dtype
 from sql_models.util import quote_identifier
-from sql_models.model import CustomSqlModelBuilder, SqlModel, Materialization, SqlModelSpec
+from sql_models.model import CustomSqlModelBuilder, SqlModel, Materialization, SqlModelSpec, RowFilter
 from sql_models.constants import NotSet, not_set
 
 T = TypeVar('T', bound='SqlModelSpec')
@@ -30,6 +34,8 @@ class BachSqlModel(SqlModel[T]):
     interacting with the models. The information is not reflected in the `hash`, as it doesn't matter for
     the purpose of sql generation.
     """
+    __slots__ = ('_column_expressions', )
+
     def __init__(
         self,
         model_spec: T,
@@ -123,6 +129,8 @@ class SampleSqlModel(BachSqlModel):
 
     See the DataFrame.sample() implementation for more information
     """
+    __slots__ = ('previous', )
+
     def __init__(
         self,
         model_spec: T,
@@ -181,7 +189,7 @@ class SampleSqlModel(BachSqlModel):
         """ Helper function to instantiate a SampleSqlModel """
         sql = 'SELECT * FROM {table_name}'
         return SampleSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
+            model_spec=CustomSqlModelBuilder(sql=sql, name=name, has_ctes=False),
             placeholders={'table_name': quote_identifier(dialect, table_name)},
             references={},
             materialization=Materialization.CTE,
@@ -191,7 +199,64 @@ class SampleSqlModel(BachSqlModel):
         )
 
 
+class CurrentNodeClauses(NamedTuple):
+    """ The parts of a CurrentNodeSqlModel's query, other than the selected columns. """
+    distinct: bool
+    where_clause: Optional[Expression]
+    group_by_clause: Optional[Expression]
+    having_clause: Optional[Expression]
+    order_by_clause: Optional[Expression]
+    limit_clause: Expression
+
+    @property
+    def expressions(self) -> List[Expression]:
+        """ All clauses that are set. """
+        return [expr for expr in self[1:] if expr is not None]
+
+
 class CurrentNodeSqlModel(BachSqlModel):
+    """
+    Model that selects columns from the previous node, with optional clauses such as 'where' or 'group by'.
+
+    In addition to the column expressions, the clauses are stored. This allows the optimizer to merge
+    nodes and remove unused columns, see sql_models/optimizer.py
+    """
+    __slots__ = ('_clauses', )
+
+    def __init__(self, clauses: CurrentNodeClauses, *args, **kwargs) -> None:
+        self._clauses = clauses
+        super().__init__(*args, **kwargs)
+
+    @property
+    def clauses(self) -> CurrentNodeClauses:
+        return self._clauses
+
+    def copy_override(
+        self: 'CurrentNodeSqlModel',
+        *,
+        model_spec: Optional[T] = None,
+        placeholders: Optional[Mapping[str, Hashable]] = None,
+        references: Optional[Mapping[str, 'SqlModel']] = None,
+        materialization: Optional[Materialization] = None,
+        materialization_name: Union[Optional[str], NotSet] = not_set,
+        column_expressions: Optional[Dict[str, Expression]] = None,
+        clauses: Optional[CurrentNodeClauses] = None
+    ) -> 'CurrentNodeSqlModel':
+        """
+        Similar to super class's implementation, but adds optional 'clauses' parameter
+        """
+        materialization_name_value = \
+            self.materialization_name if materialization_name is not_set else materialization_name
+        return self.__class__(
+            model_spec=self.model_spec if model_spec is None else model_spec,
+            placeholders=self.placeholders if placeholders is None else placeholders,
+            references=self.references if references is None else references,
+            materialization=self.materialization if materialization is None else materialization,
+            materialization_name=materialization_name_value,
+            column_expressions=self.column_expressions if column_expressions is None else column_expressions,
+            clauses=self.clauses if clauses is None else clauses
+        )
+
     @staticmethod
     def get_instance(
         *,
@@ -208,14 +273,44 @@ class CurrentNodeSqlModel(BachSqlModel):
         previous_node: BachSqlModel,
         variables: Dict['DtypeNamePair', Hashable],
     ) -> 'CurrentNodeSqlModel':
+        clauses = CurrentNodeClauses(
+            distinct=distinct,
+            where_clause=where_clause,
+            group_by_clause=group_by_clause,
+            having_clause=having_clause,
+            order_by_clause=order_by_clause,
+            limit_clause=limit_clause,
+        )
+        model_spec = CurrentNodeSqlModel._get_model_spec(dialect, name, column_exprs, clauses)
+
+        # Add all references found in the Expressions to self.references
+        all_expressions = column_exprs + clauses.expressions
+        references = construct_references({'prev': previous_node}, all_expressions)
 
+        return CurrentNodeSqlModel(
+            model_spec=model_spec,
+            placeholders=BachSqlModel._get_placeholders(dialect, variables, all_expressions),
+            references=references,
+            materialization=Materialization.CTE,
+            materialization_name=None,
+            column_expressions={name: expr for name, expr in zip(column_names, column_exprs)},
+            clauses=clauses,
+        )
+
+    @staticmethod
+    def _get_model_spec(
+        dialect: Dialect,
+        name: str,
+        column_exprs: List[Expression],
+        clauses: CurrentNodeClauses
+    ) -> CustomSqlModelBuilder:
         columns_str = ', '.join(expr.to_sql(dialect) for expr in column_exprs)
-        distinct_stmt = ' distinct ' if distinct else ''
-        where_str = where_clause.to_sql(dialect) if where_clause else ''
-        group_by_str = group_by_clause.to_sql(dialect) if group_by_clause else ''
-        having_str = having_clause.to_sql(dialect) if having_clause else ''
-        order_by_str = order_by_clause.to_sql(dialect) if order_by_clause else ''
-        limit_str = limit_clause.to_sql(dialect) if limit_clause else ''
+        distinct_stmt = ' distinct ' if clauses.distinct else ''
+        where_str = clauses.where_clause.to_sql(dialect) if clauses.where_clause else ''
+        group_by_str = clauses.group_by_clause.to_sql(dialect) if clauses.group_by_clause else ''
+        having_str = clauses.having_clause.to_sql(dialect) if clauses.having_clause else ''
+        order_by_str = clauses.order_by_clause.to_sql(dialect) if clauses.order_by_clause else ''
+        limit_str = clauses.limit_clause.to_sql(dialect) if clauses.limit_clause else ''
 
         sql = (
             f"select {distinct_stmt}{columns_str} \n"
@@ -226,21 +321,395 @@ class CurrentNodeSqlModel(BachSqlModel):
             f"{order_by_str} \n"
             f"{limit_str} \n"
         )
+        return CustomSqlModelBuilder(sql=sql, name=name, has_ctes=False)
 
-        # Add all references found in the Expressions to self.references
-        nullable_expressions = [where_clause, group_by_clause, having_clause, order_by_clause, limit_clause]
-        all_expressions = column_exprs + [expr for expr in nullable_expressions if expr is not None]
-        references = construct_references({'prev': previous_node}, all_expressions)
+    def _copy_with_query(
+        self,
+        dialect: Dialect,
+        column_expressions: Dict[str, Expression],
+        clauses: CurrentNodeClauses,
+        placeholders: Mapping[str, Hashable],
+        references: Mapping[str, SqlModel],
+    ) -> 'CurrentNodeSqlModel':
+        """
+        Create a copy of self with a different query. Only the placeholders and references that are used in
+        the new query are retained.
+        """
+        model_spec = self._get_model_spec(
+            dialect, self.generic_name, list(column_expressions.values()), clauses
+        )
+        return self.copy_override(
+            model_spec=model_spec,
+            placeholders={key: placeholders[key] for key in model_spec.spec_placeholders},
+            references={key: references[key] for key in model_spec.spec_references},
+            column_expressions=column_expressions,
+            clauses=clauses
+        )
 
-        return CurrentNodeSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
-            placeholders=BachSqlModel._get_placeholders(dialect, variables, all_expressions),
+    def get_used_columns(self, reference_name: str) -> Optional[Set[str]]:
+        """
+        Give the columns of the previous node that are used by this node. See SqlModel.get_used_columns()
+        """
+        if reference_name != 'prev':
+            return None
+        result = set()
+        for expression in list(self.column_expressions.values()) + self.clauses.expressions:
+            for token in _get_tokens_outside_subqueries(expression):
+                if isinstance(token, ModelReferenceToken):
+                    # A reference to another model outside a subquery, the column references around it
+                    # might refer to that model.
+                    return None
+                if isinstance(token, ColumnReferenceToken):
+                    result.add(token.column_name)
+                elif isinstance(token, TableColumnReferenceToken):
+                    if token.table_name is not None:
+                        return None
+                    result.add(token.column_name)
+                elif isinstance(token, RawToken) and ('"' in token.raw or '`' in token.raw):
+                    # Raw sql might contain quoted column names, so we cannot determine the used columns
+                    return None
+        return result
+
+    def get_row_filters(self, dialect: Dialect, reference_name: str) -> List[RowFilter]:
+        """
+        Give the conditions of the where clause that only refer to columns of the previous node.
+        See SqlModel.get_row_filters()
+        """
+        if reference_name != 'prev' or _is_empty(self.clauses.where_clause):
+            return []
+        condition = _get_where_condition(self.clauses.where_clause)
+        if condition is None:
+            return []
+        result = []
+        for conjunction in _get_conjunctions(dialect, condition):
+            columns = _get_filter_columns(conjunction)
+            if columns:
+                # Expression.to_sql() gives sql that is escaped for use in SqlModel.sql, RowFilter.sql must
+                # not be escaped.
+                sql = conjunction.to_sql(dialect).format().format()
+                result.append(RowFilter(sql=sql, columns=frozenset(columns)))
+        return result
+
+    def get_pruned_model(self, dialect: Dialect, columns: Set[str]) -> Optional['CurrentNodeSqlModel']:
+        """
+        Give a copy that only selects the given columns. See SqlModel.get_pruned_model()
+
+        Returns None if this node has a distinct, group by, or order by clause. The result of 'distinct'
+        depends on all columns. The group by and order by clauses might refer to the selected columns.
+        """
+        clauses = self.clauses
+        if clauses.distinct or not _is_empty(clauses.group_by_clause) \
+                or not _is_empty(clauses.order_by_clause):
+            return None
+        if self.materialization != Materialization.CTE or self.materialization_name is not None:
+            return None
+        column_expressions = {
+            name: expr for name, expr in self.column_expressions.items() if name in columns
+        }
+        if not column_expressions:
+            # Always select at least one column
+            first_column = self.columns[0]
+            column_expressions = {first_column: self.column_expressions[first_column]}
+        if len(column_expressions) == len(self.column_expressions):
+            return None
+        return self._copy_with_query(
+            dialect=dialect,
+            column_expressions=column_expressions,
+            clauses=clauses,
+            placeholders=self.placeholders,
+            references=self.references
+        )
+
+    def get_merged_model(self, dialect: Dialect) -> Optional['CurrentNodeSqlModel']:
+        """
+        If the previous node is a CurrentNodeSqlModel that only selects and renames columns, and possibly
+        filters rows, then give a copy of this node that selects from the previous node's previous node.
+        See SqlModel.get_merged_model()
+        """
+        prev = self.references['prev']
+        if type(self) is not CurrentNodeSqlModel or type(prev) is not CurrentNodeSqlModel:
+            return None
+        if prev.materialization != Materialization.CTE or prev.materialization_name is not None:
+            return None
+        prev_clauses = prev.clauses
+        other_prev_clauses = [prev_clauses.group_by_clause, prev_clauses.having_clause,
+                              prev_clauses.order_by_clause, prev_clauses.limit_clause]
+        if prev_clauses.distinct or not all(_is_empty(expr) for expr in other_prev_clauses):
+            return None
+        if any(name != 'prev' and reference == prev for name, reference in self.references.items()):
+            return None
+
+        used_columns = self.get_used_columns('prev')
+        source_columns = prev._get_source_columns()
+        if used_columns is None or not used_columns.issubset(source_columns):
+            return None
+        rename = {name: source_columns[name] for name in used_columns}
+        clauses = self.clauses
+        if any(key != value for key, value in rename.items()) and (
+                not _is_empty(clauses.group_by_clause) or not _is_empty(clauses.order_by_clause)):
+            # Group by and order by might refer to our own column names, renaming references to the
+            # previous node's columns might make them resolve to different columns.
+            return None
+
+        where_clause = _combine_where_clauses(
+            prev_clauses.where_clause, _rename_column_references(clauses.where_clause, rename)
+        )
+        if where_clause is _CANNOT_COMBINE:
+            return None
+
+        placeholders = dict(prev.placeholders)
+        references = dict(prev.references)
+        for key, value in self.placeholders.items():
+            if placeholders.setdefault(key, value) != value:
+                return None
+        for key, value in self.references.items():
+            if key != 'prev' and references.setdefault(key, value) != value:
+                return None
+
+        return self._copy_with_query(
+            dialect=dialect,
+            column_expressions={
+                name: _rename_column_references(expr, rename)
+                for name, expr in self.column_expressions.items()
+            },
+            clauses=clauses._replace(
+                where_clause=where_clause,
+                group_by_clause=_rename_column_references(clauses.group_by_clause, rename),
+                having_clause=_rename_column_references(clauses.having_clause, rename),
+                order_by_clause=_rename_column_references(clauses.order_by_clause, rename),
+                limit_clause=_rename_column_references(clauses.limit_clause, rename),
+            ),
+            placeholders=placeholders,
             references=references,
-            materialization=Materialization.CTE,
-            materialization_name=None,
-            column_expressions={name: expr for name, expr in zip(column_names, column_exprs)},
         )
 
+    def _get_source_columns(self) -> Dict[str, str]:
+        """
+        Give the columns that are a plain (possibly renamed) column of the previous node, mapped to the name
+        of the column in the previous node.
+        """
+        result = {}
+        for name, expr in self.column_expressions.items():
+            tokens = expr.get_all_tokens()
+            if not tokens or not (
+                isinstance(tokens[0], ColumnReferenceToken)
+                or (isinstance(tokens[0], TableColumnReferenceToken) and tokens[0].table_name is None)
+            ):
+                continue
+            if tokens[1:] and tokens[1:] != [RawToken(' as '), IdentifierToken(name)]:
+                continue
+            result[name] = tokens[0].column_name
+        return result
+
+
+# Returned by _combine_where_clauses, if the clauses don't have the expected form.
+_CANNOT_COMBINE = Expression.raw('')
+
+
+def _is_empty(expression: Optional[Expression]) -> bool:
+    """ True if the expression is None, or only consists of whitespace. """
+    if expression is None:
+        return True
+    return all(
+        isinstance(token, RawToken) and token.raw.strip() == '' for token in expression.get_all_tokens()
+    )
+
+
+def _combine_where_clauses(first: Optional[Expression], second: Optional[Expression]) -> Optional[Expression]:
+    """
+    Combine two where clauses of the form 'where <condition>' into a single clause that combines the
+    conditions with 'and'. Returns _CANNOT_COMBINE if the clauses are not of the expected form.
+    """
+    if _is_empty(first):
+        return second
+    if _is_empty(second):
+        return first
+    first_condition = _get_where_condition(first)
+    second_condition = _get_where_condition(second)
+    if first_condition is None or second_condition is None:
+        return _CANNOT_COMBINE
+    return Expression.construct('where ({}) and ({})', first_condition, second_condition)
+
+
+def _get_where_condition(where_clause: Optional[Expression]) -> Optional[Expression]:
+    """ Give the condition of a clause of the form 'where <condition>', or None if it has another form. """
+    if where_clause is None:
+        return None
+    data = where_clause.data
+    if not data or not isinstance(data[0], RawToken) or not data[0].raw.lower().startswith('where '):
+        return None
+    remainder = data[0].raw[len('where '):]
+    new_data: List[Union[ExpressionToken, Expression]] = [RawToken(remainder)] if remainder else []
+    return Expression(new_data + data[1:])
+
+
+def _get_conjunctions(dialect: Dialect, condition: Expression) -> List[Expression]:
+    """
+    Split a condition of the form '(<a>) and (<b>)' into [<a>, <b>], recursively. This is the form that
+    both SeriesBoolean.__and__() and _combine_where_clauses() generate. If the condition has another form,
+    then [condition] is returned.
+    """
+    # Work on a flat list, in which the raw sql is split into single characters.
+    items: List[Union[str, ExpressionToken]] = []
+    for token in condition.get_all_tokens():
+        if isinstance(token, RawToken):
+            if "'" in token.raw:
+                # Parentheses might be part of a string literal
+                return [condition]
+            items.extend(token.raw)
+        else:
+            items.append(token)
+    if Expression(_items_to_tokens(items)).to_sql(dialect) != condition.to_sql(dialect):
+        # Some sub-expression doesn't generate the plain concatenation of its tokens
+        return [condition]
+
+    conjunctions = _split_conjunction(_strip_parentheses(items))
+    if len(conjunctions) == 1:
+        return [condition]
+    return [
+        expression
+        for conjunction in conjunctions
+        for expression in _get_conjunctions(dialect, Expression(_items_to_tokens(conjunction)))
+    ]
+
+
+def _items_to_tokens(items: List[Union[str, ExpressionToken]]) -> List[ExpressionToken]:
+    """ Reverse of the flattening in _get_conjunctions(): merge consecutive characters into RawTokens. """
+    result: List[ExpressionToken] = []
+    raw = ''
+    for item in items:
+        if isinstance(item, str):
+            raw += item
+            continue
+        if raw:
+            result.append(RawToken(raw))
+            raw = ''
+        result.append(item)
+    if raw:
+        result.append(RawToken(raw))
+    return result
+
+
+def _get_group_end(items: List[Union[str, ExpressionToken]], start: int) -> Optional[int]:
+    """ Give the index of the parenthesis that closes the one at items[start], or None if it isn't closed. """
+    depth = 0
+    for index in range(start, len(items)):
+        if items[index] == '(':
+            depth += 1
+        elif items[index] == ')':
+            depth -= 1
+            if depth == 0:
+                return index
+    return None
+
+
+def _strip_parentheses(items: List[Union[str, ExpressionToken]]) -> List[Union[str, ExpressionToken]]:
+    """ Remove whitespace and parentheses that enclose all items. """
+    while True:
+        while items and items[0] in (' ', '\n'):
+            items = items[1:]
+        while items and items[-1] in (' ', '\n'):
+            items = items[:-1]
+        if not items or items[0] != '(' or _get_group_end(items, 0) != len(items) - 1:
+            return items
+        items = items[1:-1]
+
+
+def _split_conjunction(
+        items: List[Union[str, ExpressionToken]]
+) -> List[List[Union[str, ExpressionToken]]]:
+    """ Split items of the form '(<a>) and (<b>)' into [<a>, <b>], or return [items] if not of that form. """
+    if not items or items[0] != '(':
+        return [items]
+    first_end = _get_group_end(items, 0)
+    if first_end is None:
+        return [items]
+    separator = ''
+    second_start = first_end + 1
+    while second_start < len(items) and isinstance(items[second_start], str) and items[second_start] != '(':
+        separator += cast(str, items[second_start])
+        second_start += 1
+    if separator.strip().lower() != 'and' or second_start == len(items) \
+            or _get_group_end(items, second_start) != len(items) - 1:
+        return [items]
+    return [items[1:first_end], items[second_start + 1:-1]]
+
+
+def _get_filter_columns(condition: Expression) -> Optional[Set[str]]:
+    """
+    Give the columns of the previous node that a condition refers to, or None if the condition cannot be
+    used as a RowFilter: because it refers to other models, contains variables, or might not be
+    deterministic.
+    """
+    result = set()
+    for token in condition.get_all_tokens():
+        if isinstance(token, ColumnReferenceToken):
+            result.add(token.column_name)
+        elif isinstance(token, TableColumnReferenceToken) and token.table_name is None:
+            result.add(token.column_name)
+        elif isinstance(token, RawToken):
+            if '"' in token.raw or '`' in token.raw or 'rand' in token.raw.lower():
+                return None
+        elif not isinstance(token, StringValueToken):
+            return None
+    return result
+
+
+def _get_tokens_outside_subqueries(expression: Expression) -> List[ExpressionToken]:
+    """
+    Give all tokens of the expression, except the tokens of independent subqueries. The column references
+    in an independent subquery refer to the columns of the model that the subquery selects from, not to
+    the columns of the previous node.
+    """
+    if isinstance(expression, IndependentSubqueryExpression):
+        return []
+    result: List[ExpressionToken] = []
+    for item in expression.data:
+        if isinstance(item, Expression):
+            result.extend(_get_tokens_outside_subqueries(item))
+        else:
+            result.append(item)
+    return result
+
+
+TExpression = TypeVar('TExpression', bound=Expression)
+
+
+@overload
+def _rename_column_references(expression: None, rename: Mapping[str, str]) -> None:
+    ...
+
+
+@overload
+def _rename_column_references(expression: TExpression, rename: Mapping[str, str]) -> TExpression:
+    ...
+
+
+def _rename_column_references(
+    expression: Optional[Expression], rename: Mapping[str, str]
+) -> Optional[Expression]:
+    """
+    Give a copy of the expression, in which the column references are renamed as specified by rename.
+    Unlike Expression.replace_column_references() this retains the structure of the expression.
+
+    Independent subqueries are not changed, as their column references refer to another model.
+    """
+    if expression is None or isinstance(expression, IndependentSubqueryExpression) \
+            or all(key == value for key, value in rename.items()):
+        return expression
+    data: List[Union[ExpressionToken, Expression]] = []
+    for item in expression.data:
+        if isinstance(item, Expression):
+            data.append(_rename_column_references(item, rename))
+        elif isinstance(item, ColumnReferenceToken) and item.column_name in rename:
+            data.append(ColumnReferenceToken(rename[item.column_name]))
+        elif isinstance(item, TableColumnReferenceToken) and item.table_name is None \
+                and item.column_name in rename:
+            data.append(TableColumnReferenceToken(table_name=None, column_name=rename[item.column_name]))
+        else:
+            data.append(item)
+    return expression.__class__(data)
+
 
 def construct_references(
         base_references: Mapping[str, 'SqlModel'],
@@ -221,7 +221,7 @@ def update_placeholders_in_graph(
         }
         if not dict_to_update:
             continue
-        new_dict = found_node.model.placeholders
+        new_dict = dict(found_node.model.placeholders)
         new_dict.update(dict_to_update)
         start_node = start_node.set(found_node.reference_path, **new_dict)
     return start_node
@@ -15,10 +15,12 @@ Models:
 import collections
 import hashlib
 from abc import abstractmethod, ABCMeta
-from copy import deepcopy
 from enum import Enum
+from types import MappingProxyType
 from typing import TypeVar, Generic, Dict, Any, Set, Tuple, Type, Union, Hashable, NamedTuple, Optional, \
-    Mapping, MutableMapping, cast
+    Mapping, FrozenSet, List
+
+from sqlalchemy.engine import Dialect
 
 from sql_models.constants import not_set, NotSet
 from sql_models.util import extract_format_fields
@@ -83,6 +85,20 @@ REFERENCE_UNIQUE_FIELD = 'id'
 
 RefPath = Tuple[str, ...]
 
+
+class RowFilter(NamedTuple):
+    """
+    Condition on the rows of a model. Used by the optimizer to push filters down to the referenced models
+    that can apply them, see sql_models/optimizer.py
+
+    sql: the condition as sql. Columns are referred to by their unqualified, quoted names. Unlike
+        SqlModel.sql, this must not be escaped.
+    columns: names of the columns that the condition refers to.
+    """
+    sql: str
+    columns: FrozenSet[str]
+
+
 T = TypeVar('T', bound='SqlModelSpec')
 TB = TypeVar('TB', bound='SqlModelBuilder')
 TSqlModel = TypeVar('TSqlModel', bound='SqlModel')
@@ -119,6 +135,53 @@ class SqlModelSpec:
         """ Must be implemented by child class. Return value should typically be a constant. """
         raise NotImplementedError()
 
+    @property
+    def sql_has_ctes(self) -> bool:
+        """
+        Whether the sql might contain common table expressions. Can be overridden by subclasses. Must be a
+        constant.
+
+        If True, the sql_generator will parse the sql to split out the CTEs. Subclasses whose sql is always
+        a single select statement (possibly containing sub-queries) should return False, which saves the
+        sql_generator from parsing the sql.
+        """
+        return True
+
+    @property
+    def filter_placeholder(self) -> Optional[str]:
+        """
+        Name of a placeholder that filters the rows of this model. Can be overridden by subclasses. Must be a
+        constant.
+
+        The value of the placeholder must be either an empty string or a 'where' clause. The optimizer can
+        add conditions on the columns in filter_columns to it.
+        """
+        return None
+
+    @property
+    def filter_columns(self) -> Set[str]:
+        """
+        Columns that conditions in the filter_placeholder can refer to. Can be overridden by subclasses.
+        Must be a constant.
+
+        Within the 'where' clause, these columns must have the same names and values as in the output of the
+        model.
+        """
+        return set()
+
+    @property
+    def filter_passthrough(self) -> Dict[str, Set[str]]:
+        """
+        Per reference name, the columns for which a condition on the rows of this model can instead be
+        applied to the rows of the referenced model. Can be overridden by subclasses. Must be a constant.
+
+        This requires that the columns have the same names and values in the referenced model, and that
+        every row of this model only depends on rows of the referenced model that satisfy the same
+        condition. The latter doesn't hold for example for window functions that don't partition on the
+        columns.
+        """
+        return {}
+
     @property
     @abstractmethod
     def spec_references(self) -> Set[str]:
@@ -218,12 +281,12 @@ class SqlModelBuilder(SqlModelSpec, metaclass=ABCMeta):
     def references(self):
         # return shallow-copy of the dictionary.
         # keys are strings and thus immutable, values are included uncopied.
-        return {key: value for key, value in self._references.items()}
+        return dict(self._references)
 
     @property
     def placeholders(self):
-        # return deepcopy of the dictionary
-        return deepcopy(self._placeholders)
+        # return shallow-copy of the dictionary. Placeholder values are immutable, so they can be shared.
+        return dict(self._placeholders)
 
     @classmethod
     def build(cls: Type[TB], **values) -> 'SqlModel[TB]':
@@ -357,7 +420,14 @@ class SqlModel(Generic[T]):
         * All references have to be set at initialization, the referenced objects have to be already
             initialized models, and references are unidirectional, therefore it is not possible to create
             cycles in the graph.
+    As instances are immutable, the accessors return read-only views or the original objects, rather than
+    copies.
     """
+    __slots__ = (
+        '_model_spec', '_generic_name', '_sql', '_sql_has_ctes', '_references', '_placeholders',
+        '_materialization', '_materialization_name', '_placeholder_formatter', '_hash'
+    )
+
     def __init__(self,
                  model_spec: T,
                  placeholders: Mapping[str, Hashable],
@@ -379,8 +449,10 @@ class SqlModel(Generic[T]):
         self._model_spec = model_spec
         self._generic_name = model_spec.generic_name
         self._sql = model_spec.sql
-        self._references: Mapping[str, 'SqlModel'] = references
-        self._placeholders: Mapping[str, Any] = placeholders
+        self._sql_has_ctes = model_spec.sql_has_ctes
+        # Copy the dictionaries once, so changes to the given dictionaries don't affect this instance.
+        self._references: Dict[str, 'SqlModel'] = dict(references)
+        self._placeholders: Dict[str, Any] = dict(placeholders)
         self._materialization = materialization
         self._materialization_name = materialization_name
         self._placeholder_formatter = model_spec.placeholders_to_sql
@@ -422,7 +494,8 @@ class SqlModel(Generic[T]):
 
     @property
     def model_spec(self):
-        return deepcopy(self._model_spec)
+        """ The model spec. Must not be modified, as it might be shared by other models. """
+        return self._model_spec
 
     @property
     def generic_name(self) -> str:
@@ -439,15 +512,19 @@ class SqlModel(Generic[T]):
         return self._sql
 
     @property
-    def references(self) -> MutableMapping[str, 'SqlModel']:
-        # return shallow-copy of the dictionary.
-        # keys are strings and thus immutable, values are included uncopied.
-        return {key: value for key, value in self._references.items()}
+    def sql_has_ctes(self) -> bool:
+        """ Whether sql might contain common table expressions. See SqlModelSpec.sql_has_ctes """
+        return self._sql_has_ctes
 
     @property
-    def placeholders(self) -> MutableMapping[str, Hashable]:
-        # return deepcopy of the dictionary
-        return cast(MutableMapping[str, Hashable], deepcopy(self._placeholders))
+    def references(self) -> Mapping[str, 'SqlModel']:
+        """ Read-only view of the references. """
+        return MappingProxyType(self._references)
+
+    @property
+    def placeholders(self) -> Mapping[str, Hashable]:
+        """ Read-only view of the placeholders. """
+        return MappingProxyType(self._placeholders)
 
     @property
     def materialization(self) -> Materialization:
@@ -502,7 +579,7 @@ class SqlModel(Generic[T]):
         deprecated:: Use copy_override() if possible.
             https://github.com/objectiv/objectiv-analytics/issues/412
         """
-        placeholders = self.placeholders
+        placeholders = dict(self.placeholders)
         for new_key, new_val in new_placeholders.items():
             if new_key not in placeholders:
                 raise ValueError(f'Trying to update non-existing placeholder key: {new_key}. '
@@ -520,7 +597,7 @@ class SqlModel(Generic[T]):
         deprecated:: Use copy_override() if possible.
             https://github.com/objectiv/objectiv-analytics/issues/412
         """
-        references = self.references
+        references = dict(self.references)
         for new_key, new_val in new_references.items():
             if new_key not in references:
                 raise ValueError(f'Trying to update non-existing references key: {new_key}. '
@@ -667,18 +744,82 @@ class SqlModel(Generic[T]):
         """ python hash. Must not be confused with the unique hash that is self.hash """
         return hash(self.hash)
 
+    # Hooks for the optimizer, see sql_models/optimizer.py. Subclasses that know the structure of their sql
+    # can override these. The default implementations don't allow any optimization.
+
+    def get_used_columns(self, reference_name: str) -> Optional[Set[str]]:
+        """
+        Give the names of the columns of the referenced model that are used by this model.
+        :param reference_name: name of the reference
+        :return: Set of column names, or None if this is unknown. In that case the optimizer assumes that
+            all columns are used.
+        """
+        return None
+
+    def get_merged_model(self, dialect: Dialect) -> Optional['SqlModel']:
+        """
+        Give a model that is equivalent to this model, but that has one or more of the referenced models
+        merged into its own sql.
+        :return: The merged model, or None if no referenced models can be merged.
+        """
+        return None
+
+    def get_pruned_model(self, dialect: Dialect, columns: Set[str]) -> Optional['SqlModel']:
+        """
+        Give a model that is equivalent to this model for the given columns, but that might not return all
+        other columns.
+        :param columns: names of the columns that are used by the models that reference this model.
+        :return: The pruned model, or None if nothing can be pruned.
+        """
+        return None
+
+    def get_row_filters(self, dialect: Dialect, reference_name: str) -> List[RowFilter]:
+        """
+        Give the conditions that this model applies to the rows of the referenced model. Rows of the
+        referenced model that don't satisfy these conditions must not affect the result of this model.
+        :param reference_name: name of the reference
+        """
+        return []
+
+    def get_filtered_model(self, filters: List[RowFilter]) -> Optional['SqlModel']:
+        """
+        Give a model that doesn't return the rows that don't satisfy the given filters, or some of them.
+
+        The default implementation adds the filters on filter_columns to the filter_placeholder of the
+        model_spec.
+        :return: The filtered model, or None if none of the filters can be applied.
+        """
+        spec = self._model_spec
+        if spec.filter_placeholder is None:
+            return None
+        conditions = [f'({row_filter.sql})' for row_filter in filters
+                      if row_filter.columns and row_filter.columns.issubset(spec.filter_columns)]
+        if not conditions:
+            return None
+        current = str(self._placeholders[spec.filter_placeholder]).strip()
+        if current:
+            if not current.lower().startswith('where '):
+                return None
+            conditions.insert(0, f'({current[len("where "):]})')
+        placeholders = dict(self._placeholders)
+        placeholders[spec.filter_placeholder] = 'where ' + ' and '.join(conditions)
+        return self.copy_override(placeholders=placeholders)
+
 
 class CustomSqlModelBuilder(SqlModelBuilder):
     """
     Builder that instantiates a SqlModel that can run custom sql and refer custom tables.
     """
 
-    def __init__(self, sql: str, name: str = None):
+    def __init__(self, sql: str, name: str = None, has_ctes: bool = True):
         """
         :param sql: sql of the model
         :param name: optional override of the generic name (default: 'CustomSqlModel')
+        :param has_ctes: whether the sql might start with common table expressions. Set this to False if
+            sql is a single select statement, that way the sql doesn't need to be parsed when generating sql.
         """
         self._sql = sql
+        self._has_ctes = has_ctes
         if name:
             self._generic_name = name
         else:
@@ -693,6 +834,10 @@ class CustomSqlModelBuilder(SqlModelBuilder):
     def generic_name(self):
         return self._generic_name
 
+    @property
+    def sql_has_ctes(self) -> bool:
+        return self._has_ctes
+
 
 def escape_raw_sql(sql: str) -> str:
     """
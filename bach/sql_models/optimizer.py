@@ -0,0 +1,219 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Optimizer for graphs of SqlModels.
+
+The optimizer rewrites a graph into an equivalent graph that generates smaller sql, or sql that the
+database can execute faster. It runs three passes:
+1. Merge models: models can merge referenced models into their own sql, e.g. a projection on top of a
+    filter can be combined into a single select statement.
+2. Push down filters: conditions that a model applies to the rows of a referenced model are also applied
+    by models further down the graph that declare a filter placeholder, e.g. a date range. The original
+    conditions are kept in place.
+3. Prune columns: columns that are not used by any of the models that reference a model are removed.
+
+The optimizer itself doesn't know the structure of the sql of the models. The actual rewrites are
+implemented by the models, through the hooks in SqlModel: get_merged_model(), get_row_filters(),
+get_filtered_model(), get_used_columns(), and get_pruned_model(); and through the filter properties of
+SqlModelSpec. The defaults of these don't do anything, so graphs of plain SqlModels are returned
+unchanged.
+
+The optimized graph should only be used for generating sql: the rewritten models are not necessarily
+usable for anything else.
+
+Separately from optimize(), materialize_shared_models() marks models that are used multiple times as
+temporary tables. The sql for such a graph consists of multiple statements, see
+sql_generator.to_sql_statements().
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.engine import Dialect
+
+from sql_models.model import SqlModel, RowFilter, Materialization
+
+
+# Set to False to disable the optimizer for all sql generated by `optimize_if_enabled()`
+ENABLED = True
+
+
+def optimize_if_enabled(dialect: Dialect, start_node: SqlModel) -> SqlModel:
+    """ Call optimize(), unless the optimizer has been disabled by setting ENABLED to False. """
+    if not ENABLED:
+        return start_node
+    return optimize(dialect=dialect, start_node=start_node)
+
+
+def optimize(dialect: Dialect, start_node: SqlModel) -> SqlModel:
+    """
+    Give an optimized, but equivalent, version of the graph.
+    :param dialect: SQL Dialect
+    :param start_node: start node of the graph. All columns of this node are retained.
+    :return: start node of the optimized graph
+    """
+    start_node = merge_models(dialect=dialect, start_node=start_node)
+    start_node = push_down_filters(dialect=dialect, start_node=start_node)
+    start_node = prune_columns(dialect=dialect, start_node=start_node)
+    return start_node
+
+
+def merge_models(dialect: Dialect, start_node: SqlModel) -> SqlModel:
+    """
+    Recursively, starting with the models that don't reference other models, replace models by their
+    merged version.
+    """
+    updated: Dict[int, SqlModel] = {}
+    for model in _get_models_dependencies_first(start_node):
+        updated_model = _update_references(model, updated)
+        merged = updated_model.get_merged_model(dialect)
+        updated[id(model)] = merged if merged is not None else updated_model
+    return updated[id(start_node)]
+
+
+def push_down_filters(dialect: Dialect, start_node: SqlModel) -> SqlModel:
+    """
+    Apply the conditions that models apply to the rows of the models that they reference, to the models
+    further down the graph that can filter their rows themselves.
+
+    Filters are only pushed into models that are referenced exactly once in the graph, as otherwise the
+    filter would also affect the other models that reference it.
+    """
+    models = _get_models_dependencies_first(start_node)
+    reference_count = Counter(
+        id(reference) for model in models for reference in model.references.values()
+    )
+    # Filters that hold for all rows of a model that are used by the model that references it
+    row_filters: Dict[int, List[RowFilter]] = {}
+    filtered: Dict[int, SqlModel] = {}
+    for model in reversed(models):
+        model_filters = row_filters.get(id(model), [])
+        filtered_model = model.get_filtered_model(model_filters) if model_filters else None
+        filtered[id(model)] = filtered_model if filtered_model is not None else model
+
+        passthrough = model.model_spec.filter_passthrough
+        for reference_name, reference in model.references.items():
+            if reference_count[id(reference)] != 1:
+                continue
+            passthrough_columns = passthrough.get(reference_name, set())
+            row_filters[id(reference)] = model.get_row_filters(dialect, reference_name) + [
+                row_filter for row_filter in model_filters if row_filter.columns.issubset(passthrough_columns)
+            ]
+
+    updated: Dict[int, SqlModel] = {}
+    for model in models:
+        updated[id(model)] = _update_references(filtered[id(model)], updated)
+    return updated[id(start_node)]
+
+
+def prune_columns(dialect: Dialect, start_node: SqlModel) -> SqlModel:
+    """
+    Replace models by pruned versions, that only return the columns that are used by the models
+    that reference them.
+    """
+    models = _get_models_dependencies_first(start_node)
+    # First determine which columns are used, starting with the start_node. Once all models that reference
+    # a model have been pruned, we know which columns of that model are used.
+    used_columns: Dict[int, Optional[Set[str]]] = {id(start_node): None}
+    pruned: Dict[int, SqlModel] = {}
+    for model in reversed(models):
+        columns = used_columns[id(model)]
+        pruned_model = None
+        if columns is not None:
+            pruned_model = model.get_pruned_model(dialect, columns)
+        if pruned_model is None:
+            pruned_model = model
+        pruned[id(model)] = pruned_model
+
+        for reference_name, reference in pruned_model.references.items():
+            reference_columns = pruned_model.get_used_columns(reference_name)
+            if id(reference) not in used_columns:
+                used_columns[id(reference)] = reference_columns
+            else:
+                current = used_columns[id(reference)]
+                used_columns[id(reference)] = \
+                    None if current is None or reference_columns is None else current | reference_columns
+
+    # Second, link the pruned models
+    updated: Dict[int, SqlModel] = {}
+    for model in models:
+        updated[id(model)] = _update_references(pruned[id(model)], updated)
+    return updated[id(start_node)]
+
+
+def materialize_shared_models(start_node: SqlModel, min_references: int = 2, min_models: int = 3) -> SqlModel:
+    """
+    Set the materialization of models that are used multiple times in the graph to TEMP_TABLE, so that they
+    are computed once, by a separate statement before the final query.
+
+    Models are identified by their hash: equal models at different places in the graph are considered to
+    be the same model, and all get replaced by the same temporary table.
+
+    Models without references are never materialized: these typically select from a table directly, and
+    copying such a table is more expensive than reading it, and prevents the use of its indexes.
+    :param start_node: start node of the graph. Its materialization is never changed.
+    :param min_references: minimal number of references to a model.
+    :param min_models: minimal number of distinct models in the sub-graph of a model, including the model
+        itself. This is used as a measure of how expensive it is to compute a model.
+    :return: start node of the updated graph
+    """
+    models = _get_models_dependencies_first(start_node)
+    unique_models: Dict[str, SqlModel] = {}
+    for model in models:
+        unique_models.setdefault(model.hash, model)
+
+    reference_count = Counter(
+        reference.hash for model in unique_models.values() for reference in model.references.values()
+    )
+    sub_graphs: Dict[str, Set[str]] = {}
+    for model_hash, model in unique_models.items():
+        sub_graph = {model_hash}
+        for reference in model.references.values():
+            sub_graph.update(sub_graphs[reference.hash])
+        sub_graphs[model_hash] = sub_graph
+
+    updated: Dict[str, SqlModel] = {}
+    for model_hash, model in unique_models.items():
+        references = model.references
+        new_references = {name: updated[reference.hash] for name, reference in references.items()}
+        if any(new_references[name] is not reference for name, reference in references.items()):
+            model = model.copy_link(new_references)
+        if model_hash != start_node.hash \
+                and model.references \
+                and model.materialization == Materialization.CTE \
+                and reference_count[model_hash] >= min_references \
+                and len(sub_graphs[model_hash]) >= min_models:
+            model = model.copy_set_materialization(Materialization.TEMP_TABLE)
+        updated[model_hash] = model
+    return updated[start_node.hash]
+
+
+def _get_models_dependencies_first(start_node: SqlModel) -> List[SqlModel]:
+    """
+    Give all models in the graph, ordered such that each model comes after all models that it references.
+    """
+    result: List[SqlModel] = []
+    seen: Set[int] = set()
+
+    def add_model(model: SqlModel):
+        if id(model) in seen:
+            return
+        seen.add(id(model))
+        for reference in model.references.values():
+            add_model(reference)
+        result.append(model)
+
+    add_model(start_node)
+    return result
+
+
+def _update_references(model: SqlModel, updated: Dict[int, SqlModel]) -> SqlModel:
+    """
+    Give a copy of model with its references replaced by their updated version, or model itself if none of
+    its references are updated.
+    :param updated: mapping from id() of the original models to their updated version.
+    """
+    references = model.references
+    new_references = {name: updated.get(id(reference), reference) for name, reference in references.items()}
+    if all(new_references[name] is reference for name, reference in references.items()):
+        return model
+    return model.copy_override(references=new_references)
@@ -1,13 +1,15 @@
 """
 Copyright 2021 Objectiv B.V.
 """
-from typing import List, NamedTuple, Dict, Set, Iterable
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Dict, Set, Iterable, Optional, Tuple
 
 from sqlalchemy.engine import Dialect
 
 from sql_models.graph_operations import find_nodes, FoundNode
 from sql_models.model import SqlModel, REFERENCE_UNIQUE_FIELD, Materialization
-from sql_models.sql_query_parser import raw_sql_to_selects
+from sql_models.sql_query_parser import raw_sql_to_selects, CteTuple
 from sql_models.util import quote_identifier
 
 
@@ -61,6 +63,32 @@ def to_sql_materialized_nodes(
     return result
 
 
+def to_sql_statements(dialect: Dialect, start_node: SqlModel) -> List[str]:
+    """
+    Give the sql statements to query the given model:
+        * The statements to create the temporary tables that the model depends upon
+        * The sql to query the given model
+    Other materialized nodes, such as views and tables, are assumed to already exist.
+
+    The statements should be executed in a single transaction, the temporary tables are dropped at the end
+    of the transaction.
+    :param dialect: SQL Dialect
+    :param start_node: model to convert to sql
+    :return: list of sql statements, in the order in which they should be executed.
+    """
+    compiler_cache: Dict[str, List['SemiCompiledTuple']] = {}
+    found_nodes = find_nodes(
+        start_node=start_node,
+        function=lambda node: node is start_node or node.materialization == Materialization.TEMP_TABLE,
+        first_instance=False
+    )
+    _check_names_unique(found_node.model for found_node in found_nodes)
+    return [
+        _to_sql_materialized_node(dialect=dialect, model=found_node.model, compiler_cache=compiler_cache)
+        for found_node in reversed(found_nodes)
+    ]
+
+
 def _to_sql_materialized_node(
         dialect: Dialect,
         model: SqlModel,
@@ -127,6 +155,66 @@ class SemiCompiledTuple(NamedTuple):
     sql: str
 
 
+class CompilerCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+
+class CompilerCache:
+    """
+    Size-bounded LRU cache, mapping (dialect name, model hash) to the compiled list of CTEs of that model.
+
+    The hash of a model uniquely identifies the sql that will be generated for the model and all the models
+    it references. Therefore compiled results can be reused between calls to the functions in this module,
+    and between graphs that share sub-graphs. The cached lists should not be modified.
+    """
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._cache: 'OrderedDict[Tuple[str, str], List[SemiCompiledTuple]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, dialect: Dialect, model: SqlModel) -> Optional[List[SemiCompiledTuple]]:
+        key = (dialect.name, model.hash)
+        with self._lock:
+            result = self._cache.get(key)
+            if result is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._cache.move_to_end(key)
+            return result
+
+    def put(self, dialect: Dialect, model: SqlModel, value: List[SemiCompiledTuple]):
+        key = (dialect.name, model.hash)
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """ Remove all entries and reset the statistics. """
+        with self._lock:
+            self._cache.clear()
+            self._hits = 0
+            self._misses = 0
+
+    @property
+    def stats(self) -> CompilerCacheStats:
+        with self._lock:
+            return CompilerCacheStats(
+                hits=self._hits, misses=self._misses, size=len(self._cache), max_size=self.max_size
+            )
+
+
+# Process-wide cache, shared by to_sql() and to_sql_materialized_nodes()
+COMPILER_CACHE = CompilerCache()
+
+
 def _check_names_unique(models: Iterable[SqlModel]):
     """
     Check that there are no duplicate names in the list of models. Raises an error if duplicates are found.
@@ -177,6 +265,10 @@ def _to_cte_sql(dialect: Dialect,
     """
     if model.hash in compiler_cache:
         return compiler_cache[model.hash]
+    cached = COMPILER_CACHE.get(dialect=dialect, model=model)
+    if cached is not None:
+        compiler_cache[model.hash] = cached
+        return cached
 
     # First recursively compile all CTEs that we depend on
     result = []
@@ -199,6 +291,7 @@ def _to_cte_sql(dialect: Dialect,
     )
 
     compiler_cache[model.hash] = result
+    COMPILER_CACHE.put(dialect=dialect, model=model, value=result)
     return result
 
 
@@ -247,7 +340,10 @@ def _single_model_to_sql(dialect: Dialect,
     _reference_names = dict(**reference_names)
     _reference_names[REFERENCE_UNIQUE_FIELD] = model.hash
     sql = _format_sql(sql=sql, values=_reference_names, model=model)
-    ctes = raw_sql_to_selects(sql)
+    if model.sql_has_ctes:
+        ctes = raw_sql_to_selects(sql)
+    else:
+        ctes = [CteTuple(name=None, select_sql=sql)]
     result: List[SemiCompiledTuple] = []
     for cte in ctes[:-1]:
         # For all CTEs the name should be set. Only for the final select (== cte[-1]) it will be None.
@@ -1,7 +1,8 @@
 """
 Copyright 2021 Objectiv B.V.
 """
-from typing import NamedTuple, Optional, List
+from functools import lru_cache
+from typing import NamedTuple, Optional, List, Tuple
 
 import sqlparse
 from sqlparse.sql import TokenList, Token
@@ -21,7 +22,20 @@ def raw_sql_to_selects(sql: str) -> List[CteTuple]:
     the encountered order, followed by the select statement.
     For each CTE in the returned value the `name` field is guaranteed to be set, for the final select
     statement it will be None.
+
+    Parsing is relatively expensive, therefore the results are cached by sql text.
     """
+    return list(_raw_sql_to_selects_cached(sql))
+
+
+# The same sql is typically parsed many times: for every call to to_sql() on a graph that contains the
+# model, and for every graph that shares the model.
+@lru_cache(maxsize=1024)
+def _raw_sql_to_selects_cached(sql: str) -> Tuple[CteTuple, ...]:
+    return tuple(_raw_sql_to_selects(sql))
+
+
+def _raw_sql_to_selects(sql: str) -> List[CteTuple]:
     # TODO: refactor function
     stmts = sqlparse.parse(sql)
     # if len(stmts) != 1:
@@ -132,6 +132,19 @@ def test_round(engine):
         pd.testing.assert_frame_equal(expected2, result2, check_names=False)
 
 
+def test_iter_pandas(engine):
+    bt = get_df_with_test_data(engine).sort_values(by='skating_order')
+    expected = bt.to_pandas()
+
+    chunks = list(bt.iter_pandas(chunksize=2))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    pd.testing.assert_frame_equal(expected, pd.concat(chunks))
+
+    chunks = list(bt['city'].iter_pandas(chunksize=1, limit=2))
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    pd.testing.assert_series_equal(expected['city'][:2], pd.concat(chunks))
+
+
 def test_quantile(pg_engine) -> None:
     engine = pg_engine  # TODO: BigQuery
     pdf = pd.DataFrame(
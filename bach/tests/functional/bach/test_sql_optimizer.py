@@ -0,0 +1,83 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Tests that the sql that is generated with the optimizer of sql_models.optimizer gives the same results as
+the unoptimized sql.
+"""
+import pandas as pd
+
+import sql_models.optimizer as sql_optimizer
+from bach import DataFrame
+from tests.functional.bach.test_data_and_utils import get_df_with_test_data, get_df_with_food_data
+
+
+def assert_same_result_optimized(df: DataFrame, monkeypatch) -> None:
+    """ Assert that df.to_pandas() gives the same data with and without the optimizer. """
+    monkeypatch.setattr(sql_optimizer, 'ENABLED', True)
+    optimized = df.to_pandas()
+    monkeypatch.setattr(sql_optimizer, 'ENABLED', False)
+    unoptimized = df.to_pandas()
+    # Without an order by clause, the order of the rows is not defined
+    pd.testing.assert_frame_equal(optimized.sort_index(), unoptimized.sort_index())
+
+
+def test_optimizer_rename_filter_materialize(engine, monkeypatch):
+    df = get_df_with_test_data(engine, full_data_set=True)
+    df = df.rename(columns={'city': 'town', 'inhabitants': 'population'})
+    df = df[df.population > 1000]
+    df = df.materialize('a')
+    df = df.rename(columns={'town': 'place'})
+    df['founding_century'] = df.founding // 100
+    df = df[(df.founding < 1400) & (df.place != 'Snits')]
+    df = df.materialize('b')
+    df = df[['place', 'founding_century']]
+    assert_same_result_optimized(df, monkeypatch)
+
+
+def test_optimizer_independent_subquery(engine, monkeypatch):
+    df = get_df_with_test_data(engine, full_data_set=True)
+    other = get_df_with_test_data(engine, full_data_set=True).rename(columns={'city': 'town'})
+    x = df.rename(columns={'city': 'town'})
+    x = x[x.inhabitants > 10].materialize()
+    x = x[x.town == other.town.max()]
+    assert_same_result_optimized(x, monkeypatch)
+
+    # subquery on the same data
+    y = df.rename(columns={'inhabitants': 'population'}).materialize()
+    y = y[y.population > y.population.mean()]
+    assert_same_result_optimized(y, monkeypatch)
+
+
+def test_optimizer_groupby_having(engine, monkeypatch):
+    df = get_df_with_test_data(engine, full_data_set=True)
+    df = df.rename(columns={'inhabitants': 'population'})
+    df = df[df.founding > 1200]
+    grouped = df[['municipality', 'population']].groupby('municipality').sum()
+    grouped = grouped[grouped.population_sum > 1000]
+    grouped = grouped.materialize()
+    grouped = grouped[grouped.population_sum < 100000]
+    assert_same_result_optimized(grouped, monkeypatch)
+
+
+def test_optimizer_window_filter(engine, monkeypatch):
+    df = get_df_with_test_data(engine, full_data_set=True)
+    df = df.rename(columns={'inhabitants': 'population'})
+    df = df[df.founding > 1200]
+    df['rank'] = df.population.window_row_number(df.sort_values(by='population').window())
+    df = df.materialize()
+    df = df[df['rank'] < 5]
+    df = df[['city', 'rank']]
+    assert_same_result_optimized(df, monkeypatch)
+
+
+def test_optimizer_merge(engine, monkeypatch):
+    df = get_df_with_test_data(engine, full_data_set=True)
+    df = df.rename(columns={'city': 'town'})
+    df = df[df.inhabitants > 1000][['skating_order', 'town', 'inhabitants']]
+    food = get_df_with_food_data(engine)
+    food = food[food.food != 'Dúmkes']
+    result = df.merge(food, on='skating_order')
+    result = result[result.inhabitants < 100000]
+    result = result.materialize()
+    result = result[['town', 'food']]
+    assert_same_result_optimized(result, monkeypatch)
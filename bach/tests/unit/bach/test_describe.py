@@ -110,3 +110,24 @@ def test_include_exclude(dialect) -> None:
             datetime_is_numeric=False,
             percentiles=None,
         )
+
+
+def test_describe_single_aggregation(dialect) -> None:
+    df = get_fake_df(
+        dialect=dialect,
+        index_names=['i'],
+        data_names=['a', 'b', 'c'],
+        dtype={'a': 'string', 'b': 'int64', 'c': 'float64'}
+    )
+    result = DescribeOperation(obj=df, include='all', percentiles=[0.5])()
+    assert result.dtypes == {'a': 'string', 'b': 'float64', 'c': 'float64'}
+    sql = result.view_sql()
+    # The base data is read by a single node, that calculates all stats and percentiles.
+    assert sql.count('base___') == 2
+    assert sql.count('describe_stats___') == 2
+    assert 'mean' in sql
+
+    # Only rows for stats that are calculated for at least one of the series are returned
+    sql = DescribeOperation(obj=df[['a']], include='all')().view_sql()
+    assert 'count' in sql and 'nunique' in sql
+    assert 'mean' not in sql
@@ -11,7 +11,8 @@ from bach.partitioning import GroupBy
 from bach.savepoints import Savepoints
 from bach.sql_model import BachSqlModel
 from sql_models.model import CustomSqlModelBuilder
-from tests.unit.bach.util import get_fake_df
+from sql_models.util import is_postgres, DatabaseNotSupportedException
+from tests.unit.bach.util import get_fake_df, get_fake_df_test_data
 
 
 def test__eq__(dialect):
@@ -158,3 +159,41 @@ def test_init_conditions(dialect):
         )
     # there are a few __init__ checks that we don't check here, as they are also checked when creating a
     # Series object, and are thus hard to actually trigger.
+
+
+def test_get_sql_statements(dialect):
+    df = get_fake_df(dialect, ['a'], ['b', 'c'])
+    df['d'] = df.b + df.c
+    df = df.materialize('first')
+    df = df[df.d > 3].materialize('second')
+    df_merged = df.merge(df, on='b')
+
+    # single statement by default
+    assert df_merged._get_sql_statements() == [df_merged.view_sql()]
+
+    if not is_postgres(dialect):
+        with pytest.raises(DatabaseNotSupportedException):
+            df_merged._get_sql_statements(materialize_shared=True)
+        return
+
+    # single statement if nothing is shared
+    assert df._get_sql_statements(materialize_shared=True) == [df.view_sql()]
+
+    # The 'second' node is used twice
+    statements = df_merged._get_sql_statements(materialize_shared=True)
+    assert len(statements) == 2
+    assert statements[0].startswith('create temporary table "second___')
+    assert statements[1].count(statements[0].split('"')[1]) == 2
+
+    # A shared base table is not copied into a temporary table
+    df = get_fake_df_test_data(dialect)
+    a = df[df.inhabitants > 1000]
+    b = df[df.founding < 1300]
+    df_merged = a.merge(b, on='city')
+    assert df_merged._get_sql_statements(materialize_shared=True) == [df_merged.view_sql()]
+
+
+def test_iter_pandas_chunksize(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['a'], data_names=['b', 'c'])
+    with pytest.raises(ValueError, match='chunksize should be a positive number'):
+        df.iter_pandas(chunksize=0)
@@ -1,11 +1,14 @@
 """
 Copyright 2021 Objectiv B.V.
 """
+import copy
+import pickle
+
 import pytest
 
 from bach.expression import RawToken, ColumnReferenceToken, StringValueToken, Expression, \
     ConstValueExpression, AggregateFunctionExpression, WindowFunctionExpression, SingleValueExpression, \
-    NonAtomicExpression, TableColumnReferenceToken
+    NonAtomicExpression, TableColumnReferenceToken, MultiLevelExpression, VariableToken
 from sql_models.util import is_bigquery
 from tests.unit.bach.util import get_fake_df
 
@@ -263,3 +266,40 @@ def test_has_table_column_reference() -> None:
 
     expr2 = Expression.column_reference('city')
     assert not expr2.has_table_column_references
+
+
+def test_to_sql_nested_column_references(dialect):
+    inner = Expression.construct('{} + 1', Expression.column_reference('a'))
+    expr = MultiLevelExpression([
+        Expression.construct('cast({} as text)', inner),
+        Expression.column_reference('b')
+    ])
+    if not is_bigquery(dialect):  # 'normal' path
+        assert expr.to_sql(dialect) == 'cast("a" + 1 as text),"b"'
+        assert expr.to_sql(dialect, 'tab') == 'cast("tab"."a" + 1 as text),"tab"."b"'
+        # Results are cached per table_name, make sure we don't get the sql for another table_name back
+        assert expr.to_sql(dialect) == 'cast("a" + 1 as text),"b"'
+        assert inner.to_sql(dialect, 'x') == '"x"."a" + 1'
+    else:
+        assert expr.to_sql(dialect) == 'cast(`a` + 1 as text),`b`'
+        assert expr.to_sql(dialect, 'tab') == 'cast(`tab`.`a` + 1 as text),`tab`.`b`'
+        assert expr.to_sql(dialect) == 'cast(`a` + 1 as text),`b`'
+        assert inner.to_sql(dialect, 'x') == '`x`.`a` + 1'
+    assert expr.to_sql(dialect, 'tab') == expr.resolve_column_references(dialect, 'tab').to_sql(dialect)
+
+
+@pytest.mark.db_independent
+def test_copy_and_pickle() -> None:
+    expr = Expression.construct(
+        '{} = {}', Expression([VariableToken(dtype='int64', name='x')]), Expression.string_value('y')
+    )
+    expr.__hash__()
+    assert copy.copy(expr) == expr
+    assert copy.deepcopy(expr) == expr
+    assert pickle.loads(pickle.dumps(expr)) == expr
+    assert hash(pickle.loads(pickle.dumps(expr))) == hash(expr)
+
+    token = TableColumnReferenceToken(table_name='t', column_name='c')
+    assert copy.deepcopy(token) == token
+    assert pickle.loads(pickle.dumps(token)) == token
+    assert not hasattr(token, '__dict__')
@@ -3,6 +3,8 @@ Copyright 2022 Objectiv B.V.
 """
 import pytest
 
+from bach.quantile import _get_approx_quantiles_offsets
+from sql_models.util import is_bigquery
 from tests.unit.bach.util import get_fake_df_test_data
 
 
@@ -33,3 +35,27 @@ def test_dataframe_agg_skipna_parameter(dialect):
         with pytest.raises(AttributeError):
             # methods not present at all, so needs to raise
             bt.agg(agg, skipna=False)
+
+
+def test_quantile_multiple(dialect):
+    bt = get_fake_df_test_data(dialect)
+    result = bt.groupby('city')['inhabitants'].quantile(q=[0.25, 0.5], approximate=True)
+    assert list(result.index.keys()) == ['city', 'q']
+    sql = result.view_sql()
+    # All quantiles are calculated by a single aggregation
+    assert sql.count('group by') == 1
+    if is_bigquery(dialect):
+        assert 'approx_quantiles(`inhabitants`, 4)[offset(1)]' in sql
+        assert 'approx_quantiles(`inhabitants`, 4)[offset(2)]' in sql
+        assert 'unnest(' in sql
+    else:
+        assert sql.count('percentile_cont(') == 1
+        assert 'unnest(percentile_cont(cast(array[0.25, 0.5] as double precision[]))' in sql
+
+
+def test_get_approx_quantiles_offsets():
+    assert _get_approx_quantiles_offsets([0.5]) == (2, [1])
+    assert _get_approx_quantiles_offsets([0.25, 0.5, 0.75]) == (4, [1, 2, 3])
+    assert _get_approx_quantiles_offsets([0.1, 0.25]) == (20, [2, 5])
+    assert _get_approx_quantiles_offsets([0, 1]) == (1, [0, 1])
+    assert _get_approx_quantiles_offsets([0.001, 0.999, 0.3333]) == (1000, [1, 999, 333])
@@ -4,8 +4,12 @@ Copyright 2022 Objectiv B.V.
 import pytest
 
 from bach.expression import Expression
-from bach.sql_model import BachSqlModel
+import sql_models.optimizer as sql_optimizer
+from bach.sql_model import BachSqlModel, CurrentNodeSqlModel
 from sql_models.model import CustomSqlModelBuilder, Materialization
+from sql_models.optimizer import optimize
+from sql_models.sql_generator import to_sql
+from tests.unit.bach.util import get_fake_df_test_data
 
 
 @pytest.mark.db_independent
@@ -33,3 +37,94 @@ def test_bach_sql_model_copy():
     model = model.set(tuple(), val=345)
     assert model.placeholders == {'val': 345}
     assert model.__class__ == BachSqlModel
+
+
+def test_current_node_sql_model_optimizer(dialect, monkeypatch):
+    df = get_fake_df_test_data(dialect)
+    df = df.materialize('a')
+    df = df[df.inhabitants > 1000]
+    df = df.rename(columns={'city': 'town'})
+    df = df.materialize('b')
+    df = df[df.founding < 1300]
+    df = df[['town', 'skating_order']]
+
+    model = df.get_current_node('test', construct_multi_levels=True)
+    optimized = optimize(dialect, model)
+    # all selects are merged into a single select on the base node
+    assert isinstance(optimized, CurrentNodeSqlModel)
+    assert optimized.columns == ('_index_skating_order', 'town', 'skating_order')
+    assert list(optimized.references.values()) == [df.base_node.references['prev'].references['prev']
+                                                   .references['prev'].references['prev']]
+    optimized_sql = to_sql(dialect, optimized)
+    assert 'inhabitants' in optimized_sql
+    assert 'founding' in optimized_sql
+    assert 'municipality' not in optimized_sql
+    assert df.view_sql() == optimized_sql
+
+    monkeypatch.setattr(sql_optimizer, 'ENABLED', False)
+    assert df.view_sql() == to_sql(dialect, model)
+
+
+def test_current_node_sql_model_optimizer_independent_subquery(dialect, monkeypatch):
+    df = get_fake_df_test_data(dialect)
+    other = get_fake_df_test_data(dialect).rename(columns={'city': 'town'})
+    x = df.rename(columns={'city': 'town'})
+    x = x[x.inhabitants > 10].materialize()
+    x = x[x.town == other.town.max()]
+
+    # The column references of the subquery refer to the subquery's model, they should not be renamed
+    # when merging x with the renaming node.
+    optimized_sql = x.view_sql().replace('`', '"')
+    assert '"city" = (SELECT "town" as "town" FROM ' in optimized_sql
+    assert '"city" as "town" FROM ' not in optimized_sql
+    assert 'max("city") as "town"' in optimized_sql
+
+    monkeypatch.setattr(sql_optimizer, 'ENABLED', False)
+    assert '"town" = (SELECT "town" as "town" FROM ' in x.view_sql().replace('`', '"')
+
+
+def test_current_node_sql_model_optimizer_not_merged(dialect):
+    df = get_fake_df_test_data(dialect)
+    # group by
+    df_grouped = df[['city', 'inhabitants']].groupby('city').sum()
+    df_grouped = df_grouped[df_grouped.inhabitants_sum > 1000]
+    model = df_grouped.get_current_node('test')
+    assert model.references['prev'].clauses.group_by_clause is not None
+    assert optimize(dialect, model).references['prev'].columns == model.references['prev'].columns
+
+    # limit
+    df_limited = df.materialize(limit=10)
+    df_limited = df_limited[df_limited.inhabitants > 1000]
+    model = df_limited.get_current_node('test')
+    assert optimize(dialect, model).references['prev'].columns == model.references['prev'].columns
+
+    # window function
+    df_window = df.copy()
+    df_window['rank'] = df_window.inhabitants.window_row_number(df.sort_values(by='inhabitants').window())
+    df_window = df_window.materialize()
+    df_window = df_window[df_window['rank'] < 3]
+    model = df_window.get_current_node('test')
+    optimized = optimize(dialect, model)
+    assert isinstance(optimized.references['prev'], CurrentNodeSqlModel)
+    assert 'rank' in optimized.references['prev'].columns
+
+
+def test_current_node_sql_model_row_filters(dialect):
+    df = get_fake_df_test_data(dialect)
+    df = df[((df.inhabitants > 1000) | (df.founding > 1300)) & (df.city != 'x{y}')]
+    df = df[(df.skating_order == 1) & ((df.inhabitants + df.founding) > 3)]
+    model = optimize(dialect, df.get_current_node('test'))
+    row_filters = model.get_row_filters(dialect, 'prev')
+    assert [row_filter.columns for row_filter in row_filters] == [
+        {'inhabitants', 'founding'}, {'city'}, {'skating_order'}, {'inhabitants', 'founding'}
+    ]
+    # The sql of the filters is not escaped, and refers to the columns by their unqualified names
+    assert row_filters[1].sql.replace('`', '"') == '("city" <> \'x{y}\')'
+    assert model.get_row_filters(dialect, 'other') == []
+
+    # conditions with variables are not returned
+    df = get_fake_df_test_data(dialect)
+    df, threshold = df.create_variable('threshold', 1000)
+    df = df[(df.inhabitants > threshold) & (df.city != 'x')]
+    row_filters = optimize(dialect, df.get_current_node('test')).get_row_filters(dialect, 'prev')
+    assert [row_filter.columns for row_filter in row_filters] == [{'city'}]
@@ -1,6 +1,8 @@
 """
 Copyright 2021 Objectiv B.V.
 """
+import copy
+import pickle
 import re
 from typing import List
 
@@ -354,3 +356,30 @@ def _assert_graph_difference(graph: SqlModel,
     for path in changed_paths:
         assert get_node(new_graph, path) is not get_node(graph, path)
         assert get_node(new_graph, path).hash != get_node(graph, path).hash
+
+
+def test_accessors_read_only():
+    vm = ValueModel.build(key='a', val=1)
+    rm = RefModel.build(ref=vm)
+    with pytest.raises(TypeError):
+        rm.references['ref'] = vm  # type: ignore
+    with pytest.raises(TypeError):
+        vm.placeholders['key'] = 'b'  # type: ignore
+    assert not hasattr(rm, '__dict__')
+
+    # Changing the dictionaries that were used to create a model doesn't change the model
+    placeholders = {'key': 'a', 'val': 1}
+    model = SqlModel(model_spec=ValueModel(), placeholders=placeholders, references={},
+                     materialization=Materialization.CTE)
+    placeholders['key'] = 'b'
+    assert model.placeholders == {'key': 'a', 'val': 1}
+    assert model == vm
+
+
+def test_copy_and_pickle():
+    graph = JoinModel.build(ref_left=RefModel.build(ref=ValueModel.build(key='a', val=1)),
+                            ref_right=ValueModel.build(key='a', val=2))
+    for copied in (copy.deepcopy(graph), pickle.loads(pickle.dumps(graph))):
+        assert copied == graph
+        assert copied.references == graph.references
+        assert to_sql(PGDialect(), copied) == to_sql(PGDialect(), graph)
@@ -0,0 +1,174 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+from typing import Optional, Set, List, Dict
+
+import pytest
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.engine import Dialect
+
+from sql_models.model import SqlModel, CustomSqlModelBuilder, SqlModelBuilder, RowFilter, Materialization
+from sql_models.optimizer import optimize, prune_columns, push_down_filters, materialize_shared_models
+from tests.unit.sql_models.util import ValueModel, RefModel, JoinModel, RefValueModel
+
+pytestmark = [pytest.mark.db_independent]  # mark all tests here as database independent.
+
+
+class ColumnsModel(SqlModel):
+    """ Model that selects the columns in placeholder 'columns' from reference 'ref'. """
+
+    def get_used_columns(self, reference_name: str) -> Optional[Set[str]]:
+        return set(str(self.placeholders['columns']).split(', '))
+
+    def get_pruned_model(self, dialect: Dialect, columns: Set[str]) -> Optional['SqlModel']:
+        current = str(self.placeholders['columns']).split(', ')
+        new = [column for column in current if column in columns]
+        if new == current:
+            return None
+        return self.copy_set({'columns': ', '.join(new)})
+
+
+def _get_columns_model(columns: str, ref: SqlModel) -> ColumnsModel:
+    spec = CustomSqlModelBuilder(sql='select {columns} from {{ref}}', name='columns')
+    return ColumnsModel(
+        model_spec=spec,
+        placeholders={'columns': columns},
+        references={'ref': ref},
+        materialization=spec.materialization,
+        materialization_name=None
+    )
+
+
+def test_optimize_plain_models():
+    # Plain SqlModels don't implement any of the optimizer hooks, the graph should be returned as-is
+    vm1 = ValueModel.build(key='a', val=1)
+    vm2 = ValueModel.build(key='a', val=2)
+    graph = JoinModel.build(ref_left=RefModel.build(ref=vm1), ref_right=vm2)
+    assert optimize(PGDialect(), graph) is graph
+
+
+def test_prune_columns():
+    base = ValueModel.build(key='a', val=1)
+    middle = _get_columns_model('a, b, c, d', base)
+
+    # the start node is never pruned, but the columns that it doesn't use are removed from its references
+    graph = _get_columns_model('a', _get_columns_model('a, b', middle))
+    result = prune_columns(PGDialect(), graph)
+    assert result.placeholders['columns'] == 'a'
+    assert result.references['ref'].placeholders['columns'] == 'a'
+    assert result.references['ref'].references['ref'].placeholders['columns'] == 'a'
+    assert result.references['ref'].references['ref'].references['ref'] is base
+
+    # a model that is used twice retains the columns that are used by either
+    graph = JoinModel.build(
+        ref_left=_get_columns_model('a', middle),
+        ref_right=_get_columns_model('c', middle)
+    )
+    result = prune_columns(PGDialect(), graph)
+    pruned_left = result.references['ref_left'].references['ref']
+    pruned_right = result.references['ref_right'].references['ref']
+    assert pruned_left.placeholders['columns'] == 'a, c'
+    assert pruned_left is pruned_right
+
+    # JoinModel doesn't implement get_used_columns(), so all columns of its references are used
+    graph = JoinModel.build(ref_left=middle, ref_right=base)
+    assert prune_columns(PGDialect(), graph) is graph
+
+
+class FilterSlotModel(SqlModelBuilder):
+    """ Model with a filter placeholder, that can be applied on columns a and b """
+    @property
+    def sql(self) -> str:
+        return 'select a, b, c from x {filter}'
+
+    @property
+    def filter_placeholder(self) -> Optional[str]:
+        return 'filter'
+
+    @property
+    def filter_columns(self) -> Set[str]:
+        return {'a', 'b'}
+
+
+class PassthroughModel(SqlModelBuilder):
+    """ Model that passes through filters on columns a and c to its reference """
+    @property
+    def sql(self) -> str:
+        return 'select *, row_number() over (partition by a, c) as d from {{ref}}'
+
+    @property
+    def filter_passthrough(self) -> Dict[str, Set[str]]:
+        return {'ref': {'a', 'c'}}
+
+
+class WhereModel(SqlModel):
+    """ Model that applies the filters in placeholder 'conditions' to reference 'ref'. """
+
+    def get_row_filters(self, dialect: Dialect, reference_name: str) -> List[RowFilter]:
+        return [
+            RowFilter(sql=f'{column} = 1', columns=frozenset([column]))
+            for column in str(self.placeholders['conditions']).split(', ')
+        ]
+
+
+def _get_where_model(conditions: str, ref: SqlModel) -> WhereModel:
+    spec = CustomSqlModelBuilder(sql='select * from {{ref}} where {conditions}', name='where')
+    return WhereModel(
+        model_spec=spec,
+        placeholders={'conditions': conditions},
+        references={'ref': ref},
+        materialization=spec.materialization,
+        materialization_name=None
+    )
+
+
+def test_push_down_filters():
+    base = FilterSlotModel.build(filter='')
+    result = push_down_filters(PGDialect(), _get_where_model('a, c', base))
+    # filter on 'c' cannot be applied
+    assert result.references['ref'].placeholders['filter'] == 'where (a = 1)'
+
+    # filters are combined with an existing where clause, and passed through by PassthroughModel
+    base = FilterSlotModel.build(filter='where a > 0')
+    graph = _get_where_model('a, b', PassthroughModel.build(ref=base))
+    result = push_down_filters(PGDialect(), graph)
+    assert result.references['ref'].references['ref'].placeholders['filter'] == 'where (a > 0) and (a = 1)'
+    assert result.placeholders == graph.placeholders
+
+    # models that are referenced more than once are not filtered
+    graph = JoinModel.build(ref_left=_get_where_model('a', base), ref_right=base)
+    assert push_down_filters(PGDialect(), graph) is graph
+    graph = JoinModel.build(ref_left=_get_where_model('a', base), ref_right=_get_where_model('a', base))
+    assert push_down_filters(PGDialect(), graph) is graph
+
+
+def test_materialize_shared_models():
+    # two equal, but different, instances of the same sub-graph
+    graph = JoinModel.build(
+        ref_left=RefModel.build(ref=RefValueModel.build(ref=ValueModel.build(key='a', val=1), val=2)),
+        ref_right=RefModel.build(ref=RefValueModel.build(ref=ValueModel.build(key='a', val=1), val=2)),
+    )
+    result = materialize_shared_models(graph, min_models=2)
+    left = result.references['ref_left']
+    right = result.references['ref_right']
+    assert result.materialization == Materialization.CTE
+    assert left is right
+    assert left.materialization == Materialization.TEMP_TABLE
+    # The RefValueModel is part of both sub-graphs, but it's only referenced by a single (unique) model
+    assert left.references['ref'].materialization == Materialization.CTE
+
+    # The sub-graphs consist of three models
+    result = materialize_shared_models(graph, min_models=3)
+    assert result.references['ref_left'].materialization == Materialization.TEMP_TABLE
+    result = materialize_shared_models(graph, min_models=4)
+    assert result.references['ref_left'].materialization == Materialization.CTE
+    assert result.hash == graph.hash
+
+    # models that are referenced once are never materialized
+    assert materialize_shared_models(graph.references['ref_left'], min_models=1) \
+        is graph.references['ref_left']
+
+    # models without references are never materialized
+    value_model = ValueModel.build(key='a', val=1)
+    graph = JoinModel.build(ref_left=value_model, ref_right=value_model)
+    assert materialize_shared_models(graph, min_models=1) is graph
@@ -5,7 +5,8 @@ import pytest
 from sqlalchemy.dialects.postgresql.base import PGDialect
 
 from sql_models.model import SqlModelBuilder, CustomSqlModelBuilder
-from sql_models.sql_generator import to_sql
+from sql_models.sql_generator import to_sql, to_sql_materialized_nodes, model_to_name, COMPILER_CACHE, \
+    CompilerCache
 from sql_models.util import is_bigquery
 from tests.unit.sql_models.test_graph_operations import get_simple_test_graph
 from tests.unit.sql_models.util import assert_roughly_equal_sql
@@ -33,6 +34,22 @@ def test_format_injection_single_model(dialect):
     assert result == "select '{{{y}' from x"
 
 
+def test_no_parsing_without_ctes(dialect, monkeypatch):
+    sql = "select {a} from {{ref}} where x = 'with'"
+    ref = CustomSqlModelBuilder(sql='select 1 as x')()
+    expected = to_sql(dialect, CustomSqlModelBuilder(sql=sql)(a='y', ref=ref))
+
+    def raise_error(sql):
+        raise AssertionError('sql should not be parsed')
+
+    # If a model declares that its sql has no CTEs, then the sql_generator should not parse it.
+    COMPILER_CACHE.clear()
+    monkeypatch.setattr('sql_models.sql_generator.raw_sql_to_selects', raise_error)
+    ref = CustomSqlModelBuilder(sql='select 1 as x', has_ctes=False)()
+    model = CustomSqlModelBuilder(sql=sql, has_ctes=False)(a='y', ref=ref)
+    assert to_sql(dialect, model) == expected
+
+
 def test_format_injection_composed_models(dialect):
     def dialect_expected(expected_sql: str) -> str:
         # replace the expected identifier quoatations if we are dealing with BigQuery dialect
@@ -259,3 +276,46 @@ def test_code_deduplication_multiple_reference_many_paths(dialect):
     assert sql
     assert sql.count('select 1 as val') == 1
     assert sql.count('one.val + two.val') == depth
+
+
+def test_compiler_cache(dialect):
+    COMPILER_CACHE.clear()
+    graph = get_simple_test_graph()
+    sql = to_sql(dialect=dialect, model=graph)
+    # The graph consists of four models, none of which were compiled before
+    assert COMPILER_CACHE.stats.hits == 0
+    assert COMPILER_CACHE.stats.misses == 4
+    assert COMPILER_CACHE.stats.size == 4
+
+    # An equal graph, with different instances, is not compiled again
+    assert to_sql(dialect=dialect, model=get_simple_test_graph()) == sql
+    assert COMPILER_CACHE.stats.hits == 1
+    assert COMPILER_CACHE.stats.misses == 4
+    assert to_sql_materialized_nodes(dialect=dialect, start_node=graph) == {
+        model_to_name(graph): sql
+    }
+    assert COMPILER_CACHE.stats.hits == 2
+
+    # Changing a model only requires compiling that model and the models that depend on it
+    graph = graph.set(('ref_right', ), key='b')
+    assert "'b' as key" in to_sql(dialect=dialect, model=graph)
+    assert COMPILER_CACHE.stats.misses == 6
+
+    COMPILER_CACHE.clear()
+    assert COMPILER_CACHE.stats == (0, 0, 0, COMPILER_CACHE.max_size)
+
+
+def test_compiler_cache_max_size(dialect):
+    cache = CompilerCache(max_size=2)
+    models = [CustomSqlModelBuilder(sql=f'select {i}')() for i in range(3)]
+    for model in models:
+        cache.put(dialect=dialect, model=model, value=[])
+    assert cache.stats.size == 2
+    assert cache.get(dialect=dialect, model=models[0]) is None
+    assert cache.get(dialect=dialect, model=models[1]) == []
+    # models[1] is now the most recently used entry, adding a new entry should evict models[2]
+    cache.put(dialect=dialect, model=models[0], value=[])
+    assert cache.get(dialect=dialect, model=models[2]) is None
+    assert cache.get(dialect=dialect, model=models[1]) == []
+    assert cache.stats.hits == 2
+    assert cache.stats.misses == 2
@@ -4,7 +4,7 @@ Copyright 2021 Objectiv B.V.
 import re
 
 from sql_models.model import Materialization
-from sql_models.sql_generator import to_sql, to_sql_materialized_nodes
+from sql_models.sql_generator import to_sql, to_sql_materialized_nodes, to_sql_statements
 from sql_models.util import is_bigquery
 from tests.unit.sql_models.test_graph_operations import get_simple_test_graph
 from tests.unit.sql_models.util import ValueModel, RefModel, JoinModel, assert_roughly_equal_sql
@@ -120,3 +120,19 @@ def test_non_edge_node_materialization(dialect):
     result_list = list(result.values())
     assert_roughly_equal_sql(result_list[0], jm_expected_sql)
     assert_roughly_equal_sql(result_list[1], graph_expected_sql)
+
+
+def test_to_sql_statements(dialect):
+    vm = ValueModel.build(key='a', val=1)
+    temp_table = RefModel.build(ref=vm).copy_set_materialization(Materialization.TEMP_TABLE)
+    view = ValueModel.build(key='a', val=2).copy_set_materialization(Materialization.VIEW)
+    graph = JoinModel.build(ref_left=RefModel.build(ref=temp_table), ref_right=view)
+    statements = to_sql_statements(dialect=dialect, start_node=graph)
+    # The temporary table is created first, the view is assumed to exist
+    assert statements == [
+        to_sql(dialect=dialect, model=temp_table),
+        to_sql(dialect=dialect, model=graph)
+    ]
+    assert statements[0].startswith('create temporary table')
+
+    assert to_sql_statements(dialect=dialect, start_node=vm) == [to_sql(dialect=dialect, model=vm)]
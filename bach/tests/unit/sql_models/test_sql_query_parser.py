@@ -4,8 +4,9 @@ Copyright 2021 Objectiv B.V.
 from typing import List
 
 import pytest
+import sqlparse
 
-from sql_models.sql_query_parser import raw_sql_to_selects, CteTuple
+from sql_models.sql_query_parser import raw_sql_to_selects, CteTuple, _raw_sql_to_selects_cached
 from tests.unit.sql_models.util import assert_roughly_equal_sql
 
 
@@ -77,6 +78,29 @@ def test_parse_multiple_cte_select():
     _assert_equals_cte_tuples(result, expected)
 
 
+def test_result_is_cached(monkeypatch):
+    sql = 'with cte_a as (select x from t1) select x from cte_a'
+    _raw_sql_to_selects_cached.cache_clear()
+    parse_calls = []
+    original_parse = sqlparse.parse
+
+    def parse(*args, **kwargs):
+        parse_calls.append(args)
+        return original_parse(*args, **kwargs)
+    monkeypatch.setattr(sqlparse, 'parse', parse)
+
+    result = raw_sql_to_selects(sql)
+    assert raw_sql_to_selects(sql) == result
+    # the sql is only parsed once
+    assert len(parse_calls) == 1
+    assert _raw_sql_to_selects_cached.cache_info().hits == 1
+
+    # returned lists are copies, modifying one should not affect later results
+    result.append(CteTuple(name=None, select_sql='select 1'))
+    assert raw_sql_to_selects(sql) == result[:2]
+    assert raw_sql_to_selects(sql) is not raw_sql_to_selects(sql)
+
+
 def _assert_equals_cte_tuples(actual: List[CteTuple], expected: List[CteTuple]):
     assert len(actual) == len(expected)
     for a, e in zip(actual, expected):
@@ -0,0 +1,6 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Benchmarks for the collector and the workers. These are not part of the objectiv_backend package. See
+README.md in this directory for instructions.
+"""
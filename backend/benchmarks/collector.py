@@ -0,0 +1,137 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Collector throughput and latency benchmark.
+
+Posts synthetic tracker payloads to the collector through Flask's test client, for every combination of
+mode (sync/async) and batch size, and reports events/sec, p50/p99 request latency and CPU time per event.
+
+By default all output sinks are disabled, so only the collector's own processing is measured. With
+--postgres the collector writes to the Postgres database configured through the POSTGRES_* environment
+variables (which must have been initialized with objectiv-db-init).
+
+Usage:
+    python -m benchmarks.collector
+    python -m benchmarks.collector --batch-sizes 1 100 --requests 500 --output results.json
+    python -m benchmarks.collector --baseline results.json --max-regression 0.1
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import List, Dict, Any
+
+from benchmarks.common import percentile, run_in_subprocess, write_result, print_table, check_regressions
+from benchmarks.payloads import make_events, make_event_list
+
+_COLUMNS = ['mode', 'batch_size', 'requests', 'events', 'events_per_second', 'p50_ms', 'p99_ms',
+            'cpu_us_per_event']
+_KEY_COLUMNS = ['mode', 'batch_size']
+_WARMUP_REQUESTS = 5
+
+
+def run_case(mode: str, batch_size: int, requests: int, invalid_ratio: float, seed: int) -> Dict[str, Any]:
+    """
+    Run a single benchmark case in the current process. The collector's mode is determined by the
+    environment (ASYNC_MODE), mode is only used for reporting.
+    """
+    # import here, so the configuration is read after the environment of this process is set up
+    from objectiv_backend.app import create_app
+
+    client = create_app().test_client()
+    rng = random.Random(seed)
+    now = round(time.time() * 1000)
+    payloads = [
+        json.dumps(make_event_list(
+            events=make_events(batch_size, time_millis=now, invalid_ratio=invalid_ratio, rng=rng),
+            transport_time=now
+        ))
+        for _ in range(_WARMUP_REQUESTS + requests)
+    ]
+
+    for payload in payloads[:_WARMUP_REQUESTS]:
+        client.post('/', data=payload)
+
+    latencies: List[float] = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for payload in payloads[_WARMUP_REQUESTS:]:
+        start = time.perf_counter()
+        response = client.post('/', data=payload)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise Exception(f'Unexpected response: {response.status_code} {response.data!r}')
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+
+    event_count = requests * batch_size
+    return {
+        'mode': mode,
+        'batch_size': batch_size,
+        'requests': requests,
+        'events': event_count,
+        'events_per_second': event_count / wall_time,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'cpu_us_per_event': cpu_time / event_count * 1_000_000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collector')
+    parser.add_argument('--modes', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 100, 1000])
+    parser.add_argument('--requests', type=int, default=None,
+                        help='Number of requests per case. Default: enough for 2000 events, at least 20')
+    parser.add_argument('--invalid-ratio', type=float, default=0.05,
+                        help='Fraction of events that fails validation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--postgres', action='store_true',
+                        help='Write to the Postgres database configured through the environment')
+    parser.add_argument('--output', type=str, help='Write results as json to this file')
+    parser.add_argument('--baseline', type=str, help='Compare with results of an earlier run (--output)')
+    parser.add_argument('--max-regression', type=float, default=0.1,
+                        help='Fail if events/sec is more than this fraction lower than the baseline')
+    # internal: run a single case in this process, and write the result to a file
+    parser.add_argument('--result-file', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.result_file:
+        result = run_case(mode=args.modes[0], batch_size=args.batch_sizes[0], requests=args.requests,
+                          invalid_ratio=args.invalid_ratio, seed=args.seed)
+        write_result(args.result_file, result)
+        return
+
+    results = []
+    for mode in args.modes:
+        for batch_size in args.batch_sizes:
+            requests = args.requests or max(20, 2000 // batch_size)
+            env = {
+                'ASYNC_MODE': 'true' if mode == 'async' else 'false',
+                'OUTPUT_ENABLE_PG': 'true' if args.postgres else 'false',
+                'OUTPUT_ENABLE_AWS': 'false',
+                'OUTPUT_ENABLE_FILESYSTEM': 'false',
+                'SP_GCP_PROJECT': '',
+                'SP_AWS_MESSAGE_TOPIC_RAW': '',
+                'LOG_LEVEL': 'WARNING'
+            }
+            case_args = ['--modes', mode, '--batch-sizes', str(batch_size), '--requests', str(requests),
+                         '--invalid-ratio', str(args.invalid_ratio), '--seed', str(args.seed)]
+            results.append(run_in_subprocess('benchmarks.collector', case_args, env))
+
+    print_table(results, _COLUMNS)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, _KEY_COLUMNS, 'events_per_second',
+                                        args.max_regression)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
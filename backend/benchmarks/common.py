@@ -0,0 +1,90 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Helpers shared by the benchmarks: running a benchmark case in a separate process with its own
+environment, and reporting and comparing results.
+"""
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Any, Sequence, Optional
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """ Give the q-th percentile (0 <= q <= 100) of values, using the nearest-rank method. """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def run_in_subprocess(module: str, args: List[str], env: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Run `python -m module args --result-file <file>` with the given extra environment variables, and
+    return the json result that the module writes to the result file.
+
+    The collector and worker configuration is read from environment variables when objectiv_backend is
+    imported, so each benchmark case that needs a different configuration must run in its own process.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_file = os.path.join(tmp_dir, 'result.json')
+        process_env = dict(os.environ)
+        process_env.update(env)
+        subprocess.run([sys.executable, '-m', module] + args + ['--result-file', result_file],
+                       env=process_env, check=True)
+        with open(result_file) as f:
+            return json.load(f)
+
+
+def write_result(result_file: str, result: Dict[str, Any]):
+    with open(result_file, 'w') as f:
+        json.dump(result, f)
+
+
+def print_table(results: List[Dict[str, Any]], columns: List[str]):
+    """ Print results as a table with the given columns. """
+    widths = [max(len(column), *(len(_format(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.rjust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(_format(result[column]).rjust(width) for column, width in zip(columns, widths)))
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, float):
+        return f'{value:.2f}'
+    return str(value)
+
+
+def check_regressions(results: List[Dict[str, Any]],
+                      baseline_file: str,
+                      key_columns: List[str],
+                      metric: str,
+                      max_regression: float) -> List[str]:
+    """
+    Compare results with the results in a baseline file, as written with --output by an earlier run.
+    :param key_columns: columns that identify a benchmark case
+    :param metric: column to compare, higher is better
+    :param max_regression: fraction that metric may be lower than the baseline
+    :return: list of descriptions of the regressions found. Empty if there are none.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+
+    def key(result: Dict[str, Any]):
+        return tuple(result[column] for column in key_columns)
+
+    baseline_by_key = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        base: Optional[Dict[str, Any]] = baseline_by_key.get(key(result))
+        if base is None:
+            continue
+        minimum = base[metric] * (1 - max_regression)
+        if result[metric] < minimum:
+            regressions.append(f'{dict(zip(key_columns, key(result)))}: {metric} {result[metric]:.2f} < '
+                               f'{minimum:.2f} (baseline {base[metric]:.2f})')
+    return regressions
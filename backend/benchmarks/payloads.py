@@ -0,0 +1,89 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Generate realistic synthetic tracker payloads for the benchmarks.
+"""
+import random
+import uuid
+from copy import deepcopy
+from typing import List, Dict, Any, Optional
+
+from objectiv_backend.common.types import EventData, EventList
+
+# Paths and element ids to draw from. These give location stacks and contexts of a realistic size.
+_PATHS = ['/', '/docs/', '/docs/tracking/', '/docs/modeling/', '/blog/', '/about/', '/jobs/']
+_SECTIONS = ['header', 'navigation', 'main', 'footer', 'sidebar', 'overlay']
+_ELEMENTS = ['open-drawer', 'cta-button', 'logo', 'search', 'read-more', 'sign-up', 'menu-item']
+
+
+def make_event(event_type: str = 'PressEvent',
+               time_millis: int = 0,
+               event_id: Optional[str] = None,
+               rng: Optional[random.Random] = None) -> EventData:
+    """
+    Create an event as a tracker would send it. The event is valid according to the base schema, for
+    event_type PressEvent, VisibleEvent and ApplicationLoadedEvent.
+    :param event_type: type of event
+    :param time_millis: event time, in milliseconds since the epoch
+    :param event_id: event id. If not set a random uuid is used.
+    :param rng: random generator, for reproducible payloads
+    """
+    rng = rng or random.Random()
+    location_stack: List[Dict[str, Any]] = [{'_type': 'RootLocationContext', 'id': 'home'}]
+    for section in rng.sample(_SECTIONS, rng.randint(1, 3)):
+        location_stack.append({'_type': 'ContentContext', 'id': section})
+    if event_type == 'PressEvent':
+        location_stack.append({'_type': 'PressableContext', 'id': rng.choice(_ELEMENTS)})
+    elif event_type == 'ApplicationLoadedEvent':
+        location_stack = []
+    return {
+        '_type': event_type,
+        'id': event_id if event_id else str(uuid.uuid4()),
+        'time': time_millis,
+        'location_stack': location_stack,
+        'global_contexts': [
+            {'_type': 'ApplicationContext', 'id': 'objectiv-website'},
+            {'_type': 'PathContext', 'id': f'https://objectiv.io{rng.choice(_PATHS)}?utm_source=benchmark'}
+        ]
+    }
+
+
+def make_invalid_event(time_millis: int = 0, rng: Optional[random.Random] = None) -> EventData:
+    """ Create an event that passes the structural checks, but fails validation: it lacks contexts. """
+    event = make_event(event_type='PressEvent', time_millis=time_millis, rng=rng)
+    event['global_contexts'] = []
+    return event
+
+
+def make_events(count: int,
+                time_millis: int,
+                invalid_ratio: float = 0.0,
+                duplicate_ratio: float = 0.0,
+                rng: Optional[random.Random] = None) -> List[EventData]:
+    """
+    Create a list of events, with a mix of event types.
+    :param count: number of events
+    :param time_millis: event time of all events
+    :param invalid_ratio: fraction of events that will fail validation
+    :param duplicate_ratio: fraction of events that have the same id as an earlier event in the list
+    :param rng: random generator, for reproducible payloads
+    """
+    rng = rng or random.Random()
+    events: List[EventData] = []
+    for _ in range(count):
+        draw = rng.random()
+        if events and draw < duplicate_ratio:
+            event = deepcopy(rng.choice(events))
+        elif draw < duplicate_ratio + invalid_ratio:
+            event = make_invalid_event(time_millis=time_millis, rng=rng)
+        else:
+            event_type = rng.choices(['PressEvent', 'VisibleEvent', 'ApplicationLoadedEvent'],
+                                     weights=[6, 3, 1])[0]
+            event = make_event(event_type=event_type, time_millis=time_millis, rng=rng)
+        events.append(event)
+    return events
+
+
+def make_event_list(events: List[EventData], transport_time: int) -> EventList:
+    """ Wrap events in an event list, as posted by the tracker. """
+    return {'events': events, 'transport_time': transport_time}
@@ -0,0 +1,236 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Worker throughput benchmark for the entry and finalize pipelines.
+
+Fills queue_entry with synthetic events (valid, invalid and duplicates), and then drains the entry queue
+and the finalize queue with one or more worker processes. For each stage it reports the drain rate, the
+transaction durations, and which share of the time was spent on validation, hydration, serialization, and
+the database (everything else).
+
+This needs a Postgres database configured through the POSTGRES_* environment variables and initialized
+with objectiv-db-init. Use a throwaway database: with --reset the queue and data tables are truncated.
+
+Usage:
+    python -m benchmarks.workers --events 20000 --processes 1 2 4 --reset
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+import uuid
+from typing import Dict, Any, List, Callable, Optional
+
+from benchmarks.common import percentile, print_table, write_result, run_in_subprocess
+from benchmarks.payloads import make_events
+
+_COLUMNS = ['stage', 'processes', 'events', 'events_per_second', 'tx_p50_ms', 'tx_p99_ms',
+            'validation_pct', 'hydration_pct', 'serialization_pct', 'db_pct']
+_PREFILL_CHUNK_SIZE = 1000
+_TABLES = ['queue_entry', 'queue_finalize', 'data', 'nok_data']
+
+
+def _get_connection():
+    from objectiv_backend.common.config import get_config_postgres
+    from objectiv_backend.common.db import get_db_connection
+    pg_config = get_config_postgres()
+    if pg_config is None:
+        raise Exception('Missing Postgres configuration')
+    return get_db_connection(pg_config)
+
+
+def _get_tables() -> List[str]:
+    from objectiv_backend.common.config import get_config_postgres
+    pg_config = get_config_postgres()
+    if pg_config is not None and pg_config.partitioned_data:
+        return _TABLES + ['data_event_ids']
+    return _TABLES
+
+
+def _enrich(event: Dict[str, Any], cookie_id: str) -> Dict[str, Any]:
+    """ Add the contexts that the collector adds, before events are put on the entry queue. """
+    event['global_contexts'].append({'_type': 'CookieIdContext', 'id': cookie_id, 'cookie_id': cookie_id})
+    event['global_contexts'].append({'_type': 'HttpContext', 'id': 'http_context', 'remote_address': '127.0.0.1',
+                                     'referrer': '', 'user_agent': 'benchmark'})
+    return event
+
+
+def prefill(event_count: int, invalid_ratio: float, duplicate_ratio: float, reset: bool, seed: int):
+    """ Put event_count synthetic events on the entry queue. """
+    from objectiv_backend.workers.pg_queues import PostgresQueues, ProcessingStage
+
+    rng = random.Random(seed)
+    connection = _get_connection()
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                if reset:
+                    cursor.execute(f'truncate {", ".join(_get_tables())}')
+                else:
+                    cursor.execute('select (select count(*) from queue_entry) + '
+                                   '(select count(*) from queue_finalize)')
+                    if cursor.fetchone()[0]:
+                        raise Exception('Queues are not empty. Use --reset to truncate the tables.')
+        now = round(time.time() * 1000)
+        cookie_ids = [str(uuid.uuid4()) for _ in range(max(1, event_count // 20))]
+        for offset in range(0, event_count, _PREFILL_CHUNK_SIZE):
+            count = min(_PREFILL_CHUNK_SIZE, event_count - offset)
+            events = make_events(count, time_millis=now, invalid_ratio=invalid_ratio,
+                                 duplicate_ratio=duplicate_ratio, rng=rng)
+            events = [_enrich(event, rng.choice(cookie_ids)) for event in events]
+            with connection:
+                PostgresQueues(connection=connection).put_events(queue=ProcessingStage.ENTRY, events=events)
+    finally:
+        connection.close()
+
+
+class _Timer:
+    """ Accumulates the time spent in wrapped functions, per category. """
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        self.reset()
+
+    def reset(self):
+        self.totals = {'validation': 0.0, 'hydration': 0.0, 'serialization': 0.0}
+
+    def wrap(self, category: str, function: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.totals[category] += time.perf_counter() - start
+        return wrapper
+
+
+# Timer of the current worker process, set by _init_worker_process()
+_timer: Optional[_Timer] = None
+
+
+def _init_worker_process():
+    """
+    Wrap the functions that do validation, hydration, and serialization in the worker modules, so we can
+    attribute the time spent in them.
+    """
+    import types
+    from objectiv_backend.workers import worker_entry, pg_queues, pg_storage, compact_event
+    global _timer
+    timer = _Timer()
+    _timer = timer
+
+    worker_entry.validate_event_adheres_to_schema = \
+        timer.wrap('validation', worker_entry.validate_event_adheres_to_schema)  # type: ignore
+    worker_entry.validate_event_time = timer.wrap('validation', worker_entry.validate_event_time)  # type: ignore
+    worker_entry.hydrate_types_into_event = \
+        timer.wrap('hydration', worker_entry.hydrate_types_into_event)  # type: ignore
+    timed_json = types.SimpleNamespace(dumps=timer.wrap('serialization', json.dumps), loads=json.loads)
+    pg_queues.json = timed_json  # type: ignore
+    pg_storage.json = timed_json  # type: ignore
+    compact_event.json = timed_json  # type: ignore
+
+
+def _drain(stage: str) -> Dict[str, Any]:
+    """ Process batches of the given stage until the queue is empty. Runs in a worker process. """
+    from objectiv_backend.workers.worker_entry import main_entry
+    from objectiv_backend.workers.worker_finalize import main_finalize
+
+    function = main_entry if stage == 'entry' else main_finalize
+    assert _timer is not None
+    _timer.reset()
+    connection = _get_connection()
+    durations: List[float] = []
+    event_count = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            count = function(connection)
+            if count == 0:
+                break
+            durations.append(time.perf_counter() - start)
+            event_count += count
+    finally:
+        connection.close()
+    return {'events': event_count, 'durations': durations, 'totals': _timer.totals}
+
+
+def run_stage(stage: str, processes: int) -> Dict[str, Any]:
+    """ Drain the queue of the given stage with a number of worker processes, and summarize. """
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes, initializer=_init_worker_process) as pool:
+        worker_results = pool.map(_drain, [stage] * processes)
+    wall_time = time.perf_counter() - start
+
+    events = sum(result['events'] for result in worker_results)
+    durations = [duration for result in worker_results for duration in result['durations']]
+    busy_time = sum(durations) or 1.0
+    totals = {category: sum(result['totals'][category] for result in worker_results)
+              for category in ('validation', 'hydration', 'serialization')}
+    db_time = busy_time - sum(totals.values())
+    return {
+        'stage': stage,
+        'processes': processes,
+        'events': events,
+        'events_per_second': events / wall_time,
+        'tx_p50_ms': percentile(durations, 50) * 1000,
+        'tx_p99_ms': percentile(durations, 99) * 1000,
+        'validation_pct': totals['validation'] / busy_time * 100,
+        'hydration_pct': totals['hydration'] / busy_time * 100,
+        'serialization_pct': totals['serialization'] / busy_time * 100,
+        'db_pct': db_time / busy_time * 100
+    }
+
+
+def run_case(processes: int, events: int, invalid_ratio: float, duplicate_ratio: float, reset: bool,
+             seed: int) -> List[Dict[str, Any]]:
+    prefill(events, invalid_ratio=invalid_ratio, duplicate_ratio=duplicate_ratio, reset=reset, seed=seed)
+    return [run_stage('entry', processes), run_stage('finalize', processes)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the entry and finalize workers')
+    parser.add_argument('--events', type=int, default=10_000, help='Number of events to put on the queue')
+    parser.add_argument('--processes', nargs='+', type=int, default=[1],
+                        help='Number of worker processes. Multiple values run multiple cases.')
+    parser.add_argument('--invalid-ratio', type=float, default=0.05)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05)
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Events per worker batch. Default: the configured WORKER_BATCH_SIZE')
+    parser.add_argument('--reset', action='store_true', help='Truncate the queue and data tables first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, help='Write results as json to this file')
+    # internal: run a single case in this process, and write the result to a file
+    parser.add_argument('--result-file', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.result_file:
+        if args.batch_size:
+            from objectiv_backend.workers import worker_entry, worker_finalize
+            worker_entry.WORKER_BATCH_SIZE = args.batch_size  # type: ignore
+            worker_finalize.WORKER_BATCH_SIZE = args.batch_size  # type: ignore
+        result = run_case(processes=args.processes[0], events=args.events, invalid_ratio=args.invalid_ratio,
+                          duplicate_ratio=args.duplicate_ratio, reset=args.reset, seed=args.seed)
+        write_result(args.result_file, {'results': result})
+        return
+
+    results: List[Dict[str, Any]] = []
+    for processes in args.processes:
+        case_args = ['--processes', str(processes), '--events', str(args.events),
+                     '--invalid-ratio', str(args.invalid_ratio), '--duplicate-ratio', str(args.duplicate_ratio),
+                     '--seed', str(args.seed)]
+        if args.batch_size:
+            case_args += ['--batch-size', str(args.batch_size)]
+        if args.reset:
+            case_args.append('--reset')
+        results.extend(run_in_subprocess('benchmarks.workers', case_args, {'LOG_LEVEL': 'WARNING'})['results'])
+
+    print_table(results, _COLUMNS)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
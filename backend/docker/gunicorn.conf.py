@@ -3,4 +3,6 @@ workers = os.environ.get('WORKERS', 2)
 host = os.environ.get('HOST', '0.0.0.0')
 port = os.environ.get('PORT', 5000)
 bind = f'{host}:{port}'
-
+# Load the app, including the config and the compiled event schema, once in the master process before
+# forking the workers. The workers share it, and start without loading the schema themselves.
+preload_app = os.environ.get('PRELOAD_APP', 'true') == 'true'
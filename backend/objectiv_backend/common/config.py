@@ -10,14 +10,28 @@ from typing import NamedTuple, Optional
 # These settings should not be accessed by the constants here, but through the functions defined
 # below (e.g. get_config_output())
 from objectiv_backend.schema.event_schemas import EventSchema, get_event_schema, get_event_list_schema
+from objectiv_backend.schema.schema_watcher import SchemaWatcher
 from objectiv_backend.common.types import EventListSchema
+from objectiv_backend.common.log import get_logger, init_logging
+from objectiv_backend.common.tracing import init_tracing
+
+logger = get_logger(__name__)
 
 LOAD_BASE_SCHEMA = os.environ.get('LOAD_BASE_SCHEMA', 'true') == 'true'
 SCHEMA_EXTENSION_DIRECTORY = os.environ.get('SCHEMA_EXTENSION_DIRECTORY')
+# Seconds between checks of SCHEMA_EXTENSION_DIRECTORY for changed files, after which the collector loads
+# the changed schema without a restart. Set to 0 to disable
+_SCHEMA_RELOAD_INTERVAL_SECONDS = float(os.environ.get('SCHEMA_RELOAD_INTERVAL_SECONDS', 0))
+# Directory in which the parsed event schema is cached, to speed up the start of the collector and
+# workers. If not set, the schema is parsed on every start
+SCHEMA_CACHE_DIRECTORY = os.environ.get('SCHEMA_CACHE_DIRECTORY')
 
 # when set to true, the collector will return detailed validation errors per event
 SCHEMA_VALIDATION_ERROR_REPORTING = os.environ.get('SCHEMA_VALIDATION_ERROR_REPORTING', 'false') == 'true'
 
+# Log level of the collector and workers. Set to DEBUG to get per-request and per-batch details.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
 # Number of ms before an event is considered too old. set to 0 to disable
 MAX_DELAYED_EVENTS_MILLIS = 1000 * 3600
 
@@ -32,6 +46,12 @@ _PG_PORT = os.environ.get('POSTGRES_PORT', '5432')
 _PG_DATABASE_NAME = os.environ.get('POSTGRES_DB', 'objectiv')
 _PG_USER = os.environ.get('POSTGRES_USER', 'objectiv')
 _PG_PASSWORD = os.environ.get('POSTGRES_PASSWORD', '')
+# Whether the data and nok_data tables are partitioned by day, i.e. were created with
+# `objectiv-db-init --partitioned`
+_PG_PARTITIONED_DATA = os.environ.get('POSTGRES_PARTITIONED_DATA', 'false') == 'true'
+# Whether the data table has the extracted columns, i.e. was created with
+# `objectiv-db-init --extracted-columns`
+_PG_EXTRACTED_COLUMNS = os.environ.get('POSTGRES_EXTRACTED_COLUMNS', 'false') == 'true'
 
 # ### AWS S3 values, for writing data to S3.
 # default access keys to an empty string, otherwise the boto library will default ot user defaults.
@@ -60,15 +80,34 @@ _SP_GCP_PUBSUB_TOPIC_BAD = os.environ.get('SP_GCP_PUBSUB_TOPIC_BAD', '')
 _SP_AWS_MESSAGE_TOPIC_RAW = os.environ.get('SP_AWS_MESSAGE_TOPIC_RAW', '')
 _SP_AWS_MESSAGE_TOPIC_BAD = os.environ.get('SP_AWS_MESSAGE_TOPIC_BAD', '')
 
+# ### Metrics settings
+# When enabled the collector serves Prometheus-style metrics on /metrics, and the workers serve them over http
+# on METRICS_WORKER_PORT.
+_METRICS_ENABLE = os.environ.get('METRICS_ENABLE', '') == 'true'
+_METRICS_WORKER_PORT = os.environ.get('METRICS_WORKER_PORT', '9090')
+
+# ### Tracing settings
+# Fraction of requests and worker batches for which the timing of each processing stage is logged.
+_TRACING_SAMPLE_RATE = os.environ.get('TRACING_SAMPLE_RATE', '0')
+# When enabled all stages are also reported as OpenTelemetry spans. Requires the opentelemetry-api package.
+_TRACING_OPENTELEMETRY = os.environ.get('TRACING_OPENTELEMETRY', '') == 'true'
+
 # Cookie settings
 _OBJ_COOKIE = 'obj_user_id'
 # default cookie duration is 1 year, can be overridden by setting `COOKIE_DURATION`
 _OBJ_COOKIE_DURATION = int(os.environ.get('COOKIE_DURATION', 60 * 60 * 24 * 365 * 1))
 
 # Maximum number of events that a worker will process in a single batch. Only relevant in async mode
-WORKER_BATCH_SIZE = 200
+WORKER_BATCH_SIZE = int(os.environ.get('WORKER_BATCH_SIZE', '200'))
+# If true, the workers hold the events of a batch as json text plus a few extracted fields, and only parse
+# an event while validating it. This takes much less memory, which allows for larger batches.
+WORKER_COMPACT_EVENTS = os.environ.get('WORKER_COMPACT_EVENTS', 'false') == 'true'
 # Time to sleep, if there is no work to do for the workers. Only relevant in async mode
 WORKER_SLEEP_SECONDS = 5
+# Number of recently stored event_ids that a worker (or the collector in sync mode) remembers, to send
+# duplicate events straight to the nok_data table without trying to insert them in the data table first.
+# 0 disables this. Each entry takes roughly 150 bytes.
+RECENT_EVENT_IDS_CACHE_SIZE = int(os.environ.get('RECENT_EVENT_IDS_CACHE_SIZE', '0'))
 
 
 class AwsOutputConfig(NamedTuple):
@@ -89,6 +128,8 @@ class PostgresConfig(NamedTuple):
     database_name: str
     user: str
     password: str
+    partitioned_data: bool
+    extracted_columns: bool
 
 
 class SnowplowConfig(NamedTuple):
@@ -116,6 +157,15 @@ class OutputConfig(NamedTuple):
     snowplow: SnowplowConfig
 
 
+class MetricsConfig(NamedTuple):
+    worker_port: int
+
+
+class TracingConfig(NamedTuple):
+    sample_rate: float
+    opentelemetry: bool
+
+
 class CookieConfig(NamedTuple):
     name: str
     # duration in seconds
@@ -131,6 +181,8 @@ class CollectorConfig(NamedTuple):
     cookie: Optional[CookieConfig]
     error_reporting: bool
     output: OutputConfig
+    metrics: Optional[MetricsConfig]
+    tracing: TracingConfig
     event_schema: EventSchema
     event_list_schema: EventListSchema
 
@@ -170,7 +222,9 @@ def get_config_postgres() -> Optional[PostgresConfig]:
         port=int(_PG_PORT),
         database_name=_PG_DATABASE_NAME,
         user=_PG_USER,
-        password=_PG_PASSWORD
+        password=_PG_PASSWORD,
+        partitioned_data=_PG_PARTITIONED_DATA,
+        extracted_columns=_PG_EXTRACTED_COLUMNS
     )
 
 
@@ -198,12 +252,12 @@ def get_config_output_snowplow() -> SnowplowConfig:
         schema_schema_violations=_SP_SCHEMA_SCHEMA_VIOLATIONS
     )
     if config.gcp_enabled:
-        print(f'Enabled snowplow: GCP pipeline (raw:{config.gcp_pubsub_topic_raw} '
-              f'/ bad:{config.gcp_pubsub_topic_bad})')
+        logger.info('Enabled snowplow: GCP pipeline (raw:%s / bad:%s)',
+                    config.gcp_pubsub_topic_raw, config.gcp_pubsub_topic_bad)
 
     if config.aws_enabled:
-        print(f'Enabled Snowplow: AWS pipeline (raw({config.aws_message_raw_type}):{config.aws_message_topic_raw} '
-              f'/ bad:{config.aws_message_topic_bad})')
+        logger.info('Enabled Snowplow: AWS pipeline (raw(%s):%s / bad:%s)',
+                    config.aws_message_raw_type, config.aws_message_topic_raw, config.aws_message_topic_bad)
 
     return config
 
@@ -225,6 +279,19 @@ def get_config_output() -> OutputConfig:
     return output_config
 
 
+def get_config_metrics() -> Optional[MetricsConfig]:
+    if not _METRICS_ENABLE:
+        return None
+    return MetricsConfig(worker_port=int(_METRICS_WORKER_PORT))
+
+
+def get_config_tracing() -> TracingConfig:
+    return TracingConfig(
+        sample_rate=float(_TRACING_SAMPLE_RATE),
+        opentelemetry=_TRACING_OPENTELEMETRY
+    )
+
+
 def get_config_cookie() -> CookieConfig:
     return CookieConfig(
         name=_OBJ_COOKIE,
@@ -233,7 +300,7 @@ def get_config_cookie() -> CookieConfig:
 
 
 def get_config_event_schema() -> EventSchema:
-    return get_event_schema(SCHEMA_EXTENSION_DIRECTORY)
+    return get_event_schema(SCHEMA_EXTENSION_DIRECTORY, cache_directory=SCHEMA_CACHE_DIRECTORY)
 
 
 def get_config_event_list_schema() -> EventListSchema:
@@ -247,19 +314,44 @@ def get_config_timestamp_validation() -> TimestampValidationConfig:
 # creating these configuration structures is not heavy, but it's pointless to do it for each request.
 # so we have some super simple caching here
 _CACHED_COLLECTOR_CONFIG: Optional[CollectorConfig] = None
+_SCHEMA_WATCHER: Optional[SchemaWatcher] = None
+
+
+def _set_collector_event_schema(event_schema: EventSchema):
+    """ Replace the event schema of the cached collector config. Requests that already got the config
+    keep using the old schema. """
+    global _CACHED_COLLECTOR_CONFIG
+    if _CACHED_COLLECTOR_CONFIG is not None:
+        _CACHED_COLLECTOR_CONFIG = _CACHED_COLLECTOR_CONFIG._replace(event_schema=event_schema)
 
 
 def init_collector_config():
     """ Load collector config into cache. """
-    global _CACHED_COLLECTOR_CONFIG
+    global _CACHED_COLLECTOR_CONFIG, _SCHEMA_WATCHER
+    init_logging(LOG_LEVEL)
+    tracing_config = get_config_tracing()
+    init_tracing(sample_rate=tracing_config.sample_rate, opentelemetry=tracing_config.opentelemetry)
     _CACHED_COLLECTOR_CONFIG = CollectorConfig(
         async_mode=_ASYNC_MODE,
         cookie=get_config_cookie(),
         error_reporting=SCHEMA_VALIDATION_ERROR_REPORTING,
         output=get_config_output(),
+        metrics=get_config_metrics(),
+        tracing=tracing_config,
         event_schema=get_config_event_schema(),
         event_list_schema=get_config_event_list_schema()
     )
+    # Compile the validators now rather than on the first requests. With gunicorn's preload_app, this
+    # happens once in the master process, and the forked worker processes share the result.
+    _CACHED_COLLECTOR_CONFIG.event_schema.compile_validators()
+    _SCHEMA_WATCHER = None
+    if SCHEMA_EXTENSION_DIRECTORY and _SCHEMA_RELOAD_INTERVAL_SECONDS > 0:
+        _SCHEMA_WATCHER = SchemaWatcher(
+            directory=SCHEMA_EXTENSION_DIRECTORY,
+            interval=_SCHEMA_RELOAD_INTERVAL_SECONDS,
+            load=get_config_event_schema,
+            on_change=_set_collector_event_schema
+        )
 
 
 def get_collector_config() -> CollectorConfig:
@@ -268,4 +360,7 @@ def get_collector_config() -> CollectorConfig:
     if not _CACHED_COLLECTOR_CONFIG:
         init_collector_config()
         assert _CACHED_COLLECTOR_CONFIG is not None  # help out mypy
+    # The watcher thread is started lazily, so that it runs in every (forked) gunicorn worker process
+    if _SCHEMA_WATCHER is not None and not _SCHEMA_WATCHER.is_alive():
+        _SCHEMA_WATCHER.start()
     return _CACHED_COLLECTOR_CONFIG
@@ -25,12 +25,12 @@ def get_context(event: EventData, context_type: ContextType) -> ContextData:
 
 def get_contexts(event: EventData, context_type: ContextType) -> List[ContextData]:
     """ Given all the Contexts of the given type."""
-    contexts = get_global_contexts(event) + get_location_stack(event)
     result = []
-    for context in contexts:
-        _contexts_types = cast(List[ContextType], context.get("_types", []))
-        if context.get("_type") == context_type or context_type in _contexts_types:
-            result.append(context)
+    for contexts in (get_global_contexts(event), get_location_stack(event)):
+        for context in contexts:
+            _contexts_types = cast(List[ContextType], context.get("_types", []))
+            if context.get("_type") == context_type or context_type in _contexts_types:
+                result.append(context)
     return result
 
 
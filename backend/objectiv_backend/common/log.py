@@ -0,0 +1,52 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Logging setup for the collector and workers.
+
+All modules get their logger through get_logger(), which returns a logger in the 'objectiv_backend'
+hierarchy. Messages should be logged with lazy %-style arguments (e.g. `logger.debug('count: %s', count)`),
+so that no string formatting happens for disabled levels. Code that needs to do actual work to build a
+log message should first check `logger.isEnabledFor(...)`.
+"""
+import logging
+import sys
+
+_ROOT_LOGGER_NAME = 'objectiv_backend'
+_LOG_FORMAT = '%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'
+
+_initialized = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a logger for the given module name. Loggers of modules outside of the objectiv_backend package
+    (e.g. '__main__') are placed under the objectiv_backend logger, so they share its configuration.
+    :param name: module name, typically `__name__`
+    """
+    if name != _ROOT_LOGGER_NAME and not name.startswith(f'{_ROOT_LOGGER_NAME}.'):
+        name = f'{_ROOT_LOGGER_NAME}.{name}'
+    return logging.getLogger(name)
+
+
+def init_logging(level: str) -> None:
+    """
+    Configure the objectiv_backend logger to write to stdout at the given level. Calling this more than
+    once only updates the level.
+    :param level: name of a logging level, e.g. 'DEBUG', 'INFO' or 'WARNING'
+    :raise ValueError: if level is not a known logging level
+    """
+    global _initialized
+    numeric_level = logging.getLevelName(level.upper())
+    if not isinstance(numeric_level, int):
+        raise ValueError(f'Unknown log level: {level}')
+
+    logger = logging.getLogger(_ROOT_LOGGER_NAME)
+    logger.setLevel(numeric_level)
+    if not _initialized:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+        logger.addHandler(handler)
+        # Don't pass our records on to the root logger as well, which might have a handler configured by
+        # e.g. gunicorn. That would give us every message twice.
+        logger.propagate = False
+        _initialized = True
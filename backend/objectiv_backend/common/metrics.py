@@ -0,0 +1,297 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Prometheus-style metrics for the collector and the workers.
+
+If the prometheus_client package is installed, the metrics are prometheus_client metrics and are exposed
+with its exposition code. If it is not installed, a small pure-Python implementation with the same
+interface (for the parts we use) is used instead, that renders the Prometheus text format itself.
+
+Metrics are kept per process. With prometheus_client and the PROMETHEUS_MULTIPROC_DIR environment variable
+set, the metrics of all gunicorn worker processes are aggregated when rendered.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple, Sequence, List, Iterator, Optional, Any
+
+from objectiv_backend.common.log import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import prometheus_client  # type: ignore
+    _HAVE_PROMETHEUS_CLIENT = True
+except ImportError:
+    _HAVE_PROMETHEUS_CLIENT = False
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets (in seconds) for the duration histograms.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets for the batch size histograms. The largest batches are limited by DATA_MAX_EVENT_COUNT
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class _Registry:
+    """ Collection of fallback metrics, in registration order. """
+
+    def __init__(self):
+        self._metrics: List['_Metric'] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: '_Metric'):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        return ''.join(metric.render() for metric in metrics)
+
+
+_REGISTRY = _Registry()
+
+
+class _CounterValue:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        # Like prometheus_client, we expose counters with a '_total' suffix
+        return [f'{name}_total{labels} {_format_value(self._value)}']
+
+
+class _GaugeValue:
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = float(value)
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f'{name}{labels} {_format_value(self._value)}']
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, amount: float) -> None:
+        with self._lock:
+            self._sum += amount
+            for i, bound in enumerate(self._buckets):
+                if amount <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        result = []
+        cumulative = 0
+        for bound, count in zip(self._buckets, self._counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            bucket_labels = labels[:-1] + ',' + le + '}' if labels else '{' + le + '}'
+            result.append(f'{name}_bucket{bucket_labels} {_format_value(cumulative)}')
+        result.append(f'{name}_count{labels} {_format_value(cumulative)}')
+        result.append(f'{name}_sum{labels} {_format_value(self._sum)}')
+        return result
+
+
+class _Metric:
+    """
+    Base class of the fallback metrics. A metric has zero or more label names. Metrics with labels must
+    be used through labels(), which returns the value for a specific set of label values. Metrics
+    without labels can be used directly.
+    """
+    _type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self._name = name
+        self._documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        _REGISTRY.register(self)
+
+    def _new_value(self):
+        raise NotImplementedError()
+
+    def labels(self, *labelvalues: str, **labelkwargs: str):
+        if labelkwargs:
+            labelvalues = tuple(labelkwargs[name] for name in self._labelnames)
+        key = tuple(str(value) for value in labelvalues)
+        if len(key) != len(self._labelnames):
+            raise ValueError(f'Incorrect label count for metric {self._name}')
+        value = self._values.get(key)
+        if value is None:
+            with self._lock:
+                value = self._values.setdefault(key, self._new_value())
+        return value
+
+    def _value_without_labels(self):
+        if self._labelnames:
+            raise ValueError(f'Metric {self._name} has labels, use labels() first')
+        return self.labels()
+
+    def render(self) -> str:
+        lines = [f'# HELP {self._name} {self._documentation}', f'# TYPE {self._name} {self._type}']
+        for key, value in sorted(self._values.items()):
+            labels = ','.join(f'{name}="{_escape_label_value(label)}"'
+                              for name, label in zip(self._labelnames, key))
+            lines.extend(value.samples(self._name, '{' + labels + '}' if labels else ''))
+        return '\n'.join(lines) + '\n'
+
+
+class _Counter(_Metric):
+    _type = 'counter'
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1) -> None:
+        self._value_without_labels().inc(amount)
+
+
+class _Gauge(_Metric):
+    _type = 'gauge'
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value: float) -> None:
+        self._value_without_labels().set(value)
+
+
+class _Histogram(_Metric):
+    _type = 'histogram'
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        self._buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self._buckets)
+
+    def observe(self, amount: float) -> None:
+        self._value_without_labels().observe(amount)
+
+
+if _HAVE_PROMETHEUS_CLIENT:
+    Counter = prometheus_client.Counter
+    Gauge = prometheus_client.Gauge
+    Histogram = prometheus_client.Histogram
+else:
+    Counter = _Counter  # type: ignore
+    Gauge = _Gauge  # type: ignore
+    Histogram = _Histogram  # type: ignore
+
+
+# ### Metrics definitions
+# Collector
+EVENTS_RECEIVED = Counter('objectiv_events_received', 'Number of events received by the collector')
+EVENTS_OK = Counter('objectiv_events_ok', 'Number of events that passed validation')
+EVENTS_NOK = Counter('objectiv_events_nok', 'Number of rejected events, per reason', ['reason'])
+REQUESTS_FAILED = Counter('objectiv_requests_failed', 'Number of requests with data that could not be parsed')
+STAGE_DURATION = Histogram('objectiv_stage_duration_seconds', 'Duration of processing stages and output sinks',
+                           ['stage'], buckets=DURATION_BUCKETS)
+BATCH_SIZE = Histogram('objectiv_batch_size_events', 'Number of events per request or worker batch',
+                       ['source'], buckets=BATCH_SIZE_BUCKETS)
+# Workers
+WORKER_BATCH_DURATION = Histogram('objectiv_worker_batch_duration_seconds',
+                                  'Duration of processing a non-empty worker batch', ['source'],
+                                  buckets=DURATION_BUCKETS)
+# Postgres
+DB_TRANSACTION_DURATION = Histogram('objectiv_db_transaction_duration_seconds',
+                                    'Duration of database transactions', ['source'], buckets=DURATION_BUCKETS)
+QUEUE_DEPTH = Gauge('objectiv_queue_depth_events', 'Estimated number of events on a queue', ['queue'])
+CACHED_DUPLICATES = Counter('objectiv_cached_duplicates',
+                            'Number of duplicate events that were detected with the recent event_ids cache')
+
+
+@contextmanager
+def observe_duration(histogram, **labels: str) -> Iterator[None]:
+    """ Context manager that observes the duration of its body, in seconds, in the given histogram. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric = histogram.labels(**labels) if labels else histogram
+        metric.observe(time.perf_counter() - start)
+
+
+def generate_metrics() -> str:
+    """ Render all metrics in the Prometheus text exposition format. """
+    if not _HAVE_PROMETHEUS_CLIENT:
+        return _REGISTRY.render()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess, CollectorRegistry
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return prometheus_client.generate_latest(registry).decode('utf-8')
+    return prometheus_client.generate_latest().decode('utf-8')
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """ Request handler that serves the metrics on every path. """
+
+    def do_GET(self):
+        data = generate_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Don't log every scrape to stderr
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> Optional[ThreadingHTTPServer]:
+    """
+    Serve the metrics over http in a daemon thread. Intended for processes that don't run a http server
+    themselves, i.e. the workers. Calling this again after the server has been started is a no-op.
+    :return: the server, or None if the port could not be bound
+    """
+    global _metrics_server
+    if _metrics_server is not None:
+        return _metrics_server
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as exc:
+        logger.error('Could not start metrics server on port %d: %s', port, exc)
+        return None
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info('Serving metrics on port %d', port)
+    _metrics_server = server
+    return server
@@ -0,0 +1,44 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+
+class RecentEventIds:
+    """
+    Bounded set of recently stored event_ids. If more than max_size event_ids are added, the least recently
+    used event_ids are forgotten.
+
+    Only add event_ids of events that are committed to the data table. Then every event_id in this set is
+    known to be a duplicate, and the unique constraint in the database remains the source of truth for all
+    other events.
+
+    Thread-safe, as the collector might handle multiple requests in parallel.
+    """
+
+    def __init__(self, max_size: int):
+        if max_size <= 0:
+            raise ValueError(f'max_size must be positive, got {max_size}')
+        self._max_size = max_size
+        self._event_ids: 'OrderedDict[str, None]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, event_id: str) -> bool:
+        with self._lock:
+            if event_id not in self._event_ids:
+                return False
+            self._event_ids.move_to_end(event_id)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._event_ids)
+
+    def add_all(self, event_ids: Iterable[str]) -> None:
+        with self._lock:
+            for event_id in event_ids:
+                self._event_ids[event_id] = None
+                self._event_ids.move_to_end(event_id)
+            while len(self._event_ids) > self._max_size:
+                self._event_ids.popitem(last=False)
@@ -0,0 +1,122 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Light-weight tracing of the processing stages of the collector and workers.
+
+Code wraps a stage in `with span('name'):`. Every span:
+  * observes its duration in the STAGE_DURATION metric
+  * is forwarded to OpenTelemetry, if enabled and the opentelemetry-api package is installed
+  * is passed to the registered span hooks, if the trace it is part of is sampled
+
+A trace starts with the outermost span, at which point it is decided whether the trace is sampled, based
+on the configured sample rate. Nested spans are part of the same trace. By default sampled spans are
+logged; additional exporters can be added with add_span_hook().
+"""
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Dict, Any, Optional, Iterator, NamedTuple
+
+from objectiv_backend.common.log import get_logger
+from objectiv_backend.common.metrics import STAGE_DURATION
+
+logger = get_logger(__name__)
+
+
+class SpanRecord(NamedTuple):
+    trace_id: str
+    name: str
+    # duration in seconds
+    duration: float
+    attributes: Dict[str, Any]
+
+
+SpanHook = Callable[[SpanRecord], None]
+
+
+class _Trace(NamedTuple):
+    trace_id: str
+    sampled: bool
+
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar('objectiv_trace', default=None)
+
+_sample_rate = 0.0
+_hooks: List[SpanHook] = []
+_otel_tracer = None
+
+
+def log_span_hook(record: SpanRecord) -> None:
+    """ Span hook that logs the span's timing. """
+    logger.info('span %s: %.3f ms, trace: %s, %s',
+                record.name, record.duration * 1000, record.trace_id, record.attributes)
+
+
+def add_span_hook(hook: SpanHook) -> None:
+    """ Register a function that will be called for every finished span of a sampled trace. """
+    _hooks.append(hook)
+
+
+def remove_span_hook(hook: SpanHook) -> None:
+    _hooks.remove(hook)
+
+
+def init_tracing(sample_rate: float, opentelemetry: bool) -> None:
+    """
+    Configure tracing.
+    :param sample_rate: fraction of traces that is passed to the span hooks. The default hook logs the
+        spans. 0 disables this, 1 samples every trace.
+    :param opentelemetry: whether to forward all spans to OpenTelemetry. Requires the opentelemetry-api
+        package; exporting the spans is up to the OpenTelemetry SDK configuration.
+    """
+    global _sample_rate, _otel_tracer
+    if not 0 <= sample_rate <= 1:
+        raise ValueError(f'Sample rate must be between 0 and 1, got {sample_rate}')
+    _sample_rate = sample_rate
+    if sample_rate > 0 and log_span_hook not in _hooks:
+        add_span_hook(log_span_hook)
+
+    _otel_tracer = None
+    if opentelemetry:
+        try:
+            from opentelemetry import trace  # type: ignore
+            _otel_tracer = trace.get_tracer('objectiv_backend')
+        except ImportError:
+            logger.warning('OpenTelemetry tracing enabled, but opentelemetry-api is not installed')
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    Context manager that traces its body as a span with the given name.
+    :param name: name of the stage, also used as 'stage' label of the STAGE_DURATION metric
+    :param attributes: extra information for the span hooks, e.g. an event count
+    """
+    trace = _current_trace.get()
+    token = None
+    if trace is None:
+        sampled = _sample_rate > 0 and random.random() < _sample_rate
+        trace = _Trace(trace_id=uuid.uuid4().hex if sampled else '', sampled=sampled)
+        token = _current_trace.set(trace)
+
+    start = time.perf_counter()
+    try:
+        if _otel_tracer is not None:
+            with _otel_tracer.start_as_current_span(name, attributes=attributes):
+                yield
+        else:
+            yield
+    finally:
+        duration = time.perf_counter() - start
+        if token is not None:
+            _current_trace.reset(token)
+        STAGE_DURATION.labels(stage=name).observe(duration)
+        if trace.sampled:
+            record = SpanRecord(trace_id=trace.trace_id, name=name, duration=duration, attributes=attributes)
+            for hook in _hooks:
+                try:
+                    hook(record)
+                except Exception as exc:
+                    logger.error('Span hook failed: %s', exc)
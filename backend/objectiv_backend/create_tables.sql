@@ -12,6 +12,12 @@ create table queue_finalize (
     value json not null
 );
 
+create type failure_reason as enum('failed validation', 'duplicate');
+
+-- The section markers in this file are used by objectiv-db-init to swap in the partitioned versions of the
+-- tables from create_tables_partitioned.sql, and the extra columns from create_tables_extracted_columns.sql,
+-- if requested.
+-- [section: data tables]
 create table data (
     event_id uuid not null,
     day date not null, -- This is for query convenience; a possible sharding key? We might well put an index on this badboy
@@ -23,8 +29,6 @@ create table data (
 
 create index on data(day);
 
-create type failure_reason as enum('failed validation', 'duplicate');
-
 create table nok_data (
     -- perhaps we want to add a field here that states the reason why the data is not ok?
     event_id uuid not null,
@@ -34,49 +38,48 @@ create table nok_data (
     value json not null,
     reason failure_reason default 'failed validation'
 );
+-- [end section]
+
+-- [section: extracted columns]
+-- [end section]
 
 
 create view data_with_sessions as
+-- A session starts with the first event of a user (cookie_id), or with an event that is more than the session
+-- gap after the previous event of the same user. For persisted sessions that are updated incrementally,
+-- see objectiv-sessionize.
 with session_starts as (
     select
-        cookie_id as cookie_id,
         event_id as event_id,
+        cookie_id as cookie_id,
+        moment as moment,
         coalesce(
             -- TODO: session is now 5 seconds, change this.
             extract(epoch from (moment - lag(moment, 1) over (partition by cookie_id order by moment, event_id))) > 5,
             true
-        ) as is_start_of_session,
-        moment as moment
+        ) as is_start_of_session
     from data
 ),
-session_id_and_start as (
+session_numbers as (
     select
-            -- We need a unique identifier for the session. We use event_id, as that gives us a unique id
-            -- per session. The event_ids are all unique, and an event can only belong to one
-            -- session, and thus we can use the event_id as a unique session_id.
-           event_id as session_id,
-           cookie_id,
-           event_id as event_id,
-           moment as moment
+        event_id as event_id,
+        cookie_id as cookie_id,
+        moment as moment,
+        -- number of session starts up to and including this event; identifies the session of a user
+        count(case when is_start_of_session then 1 end)
+            over (partition by cookie_id order by moment, event_id) as session_number
     from session_starts
-    where is_start_of_session
 )
 select
-        s.session_id as session_id,
-        row_number() over (partition by s.session_id order by d.moment, d.event_id asc) as session_hit_number,
+        -- We need a unique identifier for the session. We use the event_id of the first event of the
+        -- session, as that gives us a unique id per session.
+        first_value(s.event_id)
+            over (partition by s.cookie_id, s.session_number order by s.moment, s.event_id) as session_id,
+        row_number()
+            over (partition by s.cookie_id, s.session_number order by s.moment, s.event_id) as session_hit_number,
         d.*
-from data as d
-inner join session_id_and_start as s on s.cookie_id = d.cookie_id and s.moment <= d.moment
-where not exists (
-    select *
-    from session_id_and_start as s2
-    where
-      -- a session start for the same cookie
-          s2.cookie_id = d.cookie_id
-      and s2.moment <= d.moment
-      -- and that session is closer to pq.moment than the selected session s
-      and s2.moment > s.moment
-)
+from session_numbers as s
+inner join data as d on d.event_id = s.event_id
 order by session_id, moment
 ;
 
@@ -99,5 +102,8 @@ grant insert on data, nok_data to obj_worker_role;
 create role obj_reader_role noinherit;
 grant select on data, data_with_sessions to obj_reader_role;
 
+-- [section: extra grants]
+-- [end section]
+
 
 commit;
@@ -0,0 +1,16 @@
+-- Extra columns for the data table, with values that are extracted from the value column at ingest time.
+-- This is not a complete script: objectiv-db-init replaces the sections with the same name in
+-- create_tables.sql with the sections below, when run with --extracted-columns. To add the columns to an
+-- existing database, run the statement below. Rows inserted before that keep null values in these columns.
+--
+-- Queries on these columns don't have to parse the json in value for every row. The columns are filled
+-- by insert_events_into_data() in pg_storage.py if POSTGRES_EXTRACTED_COLUMNS is set, and used by the
+-- modelhub if present.
+
+-- [section: extracted columns]
+alter table data
+    add column event_type text,
+    add column stack_event_types jsonb,
+    add column global_contexts jsonb,
+    add column location_stack jsonb;
+-- [end section]
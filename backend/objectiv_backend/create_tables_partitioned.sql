@@ -0,0 +1,52 @@
+-- Partitioned versions of the data and nok_data tables. This is not a complete script: objectiv-db-init
+-- replaces the sections with the same name in create_tables.sql with the sections below, when run with
+-- --partitioned.
+--
+-- Both tables are range-partitioned by day. Queries that filter on day (as all modelhub queries do) only
+-- scan the matching partitions, and old data can be removed by detaching partitions instead of deleting
+-- rows. Partitions are created and retired with objectiv-db-partitions. Rows that do not fall in any
+-- partition end up in the default partitions.
+--
+-- A primary key on a partitioned table must contain the partition key, so the key on data is
+-- (day, event_id). That alone does not guarantee that event_ids are unique, as two events with the same
+-- event_id could have a different day. Therefore the event_ids are also registered in data_event_ids,
+-- which is not partitioned and has event_id as primary key. See insert_events_into_data() in
+-- pg_storage.py
+
+-- [section: data tables]
+create table data (
+    event_id uuid not null,
+    day date not null,
+    moment timestamp not null,
+    cookie_id uuid not null,
+    value json not null,
+    primary key(day, event_id)
+) partition by range (day);
+
+create table data_default partition of data default;
+
+create table data_event_ids (
+    event_id uuid not null,
+    day date not null,
+    primary key(event_id)
+);
+
+-- used by objectiv-db-partitions to remove the event_ids of retired partitions
+create index on data_event_ids(day);
+
+create table nok_data (
+    event_id uuid not null,
+    day date not null,
+    moment timestamp not null,
+    cookie_id uuid not null,
+    value json not null,
+    reason failure_reason default 'failed validation'
+) partition by range (day);
+
+create table nok_data_default partition of nok_data default;
+-- [end section]
+
+-- [section: extra grants]
+grant select, insert on data_event_ids to obj_collector_role;
+grant select, insert on data_event_ids to obj_worker_role;
+-- [end section]
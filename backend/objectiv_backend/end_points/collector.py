@@ -5,14 +5,19 @@ from datetime import datetime
 import flask
 import time
 from urllib.parse import urlparse, parse_qs
-from typing import List
+from typing import List, Dict, Optional
 
 from flask import Response, Request
 
-from objectiv_backend.common.config import get_collector_config
+from objectiv_backend.common.config import get_collector_config, RECENT_EVENT_IDS_CACHE_SIZE
 from objectiv_backend.common.types import EventData, EventDataList, EventList
 from objectiv_backend.common.db import get_db_connection
-from objectiv_backend.common.event_utils import add_global_context_to_event, get_contexts
+from objectiv_backend.common.log import get_logger
+from objectiv_backend.common.metrics import observe_duration, EVENTS_RECEIVED, BATCH_SIZE, REQUESTS_FAILED, \
+    DB_TRANSACTION_DURATION
+from objectiv_backend.common.recent_event_ids import RecentEventIds
+from objectiv_backend.common.tracing import span
+from objectiv_backend.common.event_utils import add_global_context_to_event, get_optional_context
 from objectiv_backend.end_points.common import get_json_response, get_cookie_id
 from objectiv_backend.end_points.extra_output import events_to_json, write_data_to_fs_if_configured, \
     write_data_to_s3_if_configured, write_data_to_snowplow_if_configured
@@ -24,32 +29,49 @@ from objectiv_backend.workers.worker_finalize import insert_events_into_data
 
 from objectiv_backend.schema.schema import HttpContext, CookieIdContext, MarketingContext
 
+logger = get_logger(__name__)
+
 # Some limits on the inputs we accept
 DATA_MAX_SIZE_BYTES = 1_000_000
 DATA_MAX_EVENT_COUNT = 1_000
 
+# event_ids that this process stored recently in sync mode, see RecentEventIds
+_recent_event_ids = RecentEventIds(RECENT_EVENT_IDS_CACHE_SIZE) if RECENT_EVENT_IDS_CACHE_SIZE else None
+
 
 def collect() -> Response:
     """
     Endpoint that accepts event data from the tracker and stores it for further processing.
     """
+    with span('collect'):
+        return _collect()
+
+
+def _collect() -> Response:
     current_millis = round(time.time() * 1000)
     try:
-        event_data: EventList = _get_event_data(flask.request)
+        with span('parse'):
+            event_data: EventList = _get_event_data(flask.request)
         events: EventDataList = event_data['events']
         transport_time: int = event_data['transport_time']
     except ValueError as exc:
-        print(f'Data problem: {exc}')  # todo: real error logging
+        logger.warning('Data problem: %s', exc)
+        REQUESTS_FAILED.inc()
         return _get_collector_response(error_count=1, event_count=-1, data_error=exc.__str__())
 
-    # Do all the enrichment steps that can only be done in this phase
-    add_enriched_contexts(events)
+    EVENTS_RECEIVED.inc(len(events))
+    BATCH_SIZE.labels(source='collector').observe(len(events))
 
-    set_time_in_events(events, current_millis, transport_time)
+    # Do all the enrichment steps that can only be done in this phase
+    with span('enrich', event_count=len(events)):
+        add_enriched_contexts(events)
+        set_time_in_events(events, current_millis, transport_time)
 
     if not get_collector_config().async_mode:
-        ok_events, nok_events, event_errors = process_events_entry(events=events, current_millis=current_millis)
-        print(f'ok_events: {len(ok_events)}, nok_events: {len(nok_events)}')
+        with span('validate', event_count=len(events)):
+            ok_events, nok_events, event_errors = process_events_entry(events=events,
+                                                                       current_millis=current_millis)
+        logger.debug('ok_events: %d, nok_events: %d', len(ok_events), len(nok_events))
         write_sync_events(ok_events=ok_events, nok_events=nok_events, event_errors=event_errors)
         return _get_collector_response(error_count=len(nok_events), event_count=len(events), event_errors=event_errors)
     else:
@@ -122,12 +144,20 @@ def _get_collector_response(
 def add_enriched_contexts(events: EventDataList):
     """
     Enrich the list of events
-    """
 
+    Contexts that are the same for all events of the request are created once, and that single instance is
+    added to all events: the CookieIdContext, the HttpContext for events that don't have one yet, and the
+    MarketingContexts of events with the same url. These context instances must not be modified afterwards.
+    """
+    request = flask.request
     add_cookie_id_contexts(events)
+    remote_address = _get_remote_address(request)
+    http_context = _make_http_context(request, remote_address)
+    marketing_contexts_cache: Dict[str, List[MarketingContext]] = {}
     for event in events:
-        add_http_context_to_event(event=event, request=flask.request)
-        add_marketing_context_to_event(event=event)
+        add_http_context_to_event(event=event, request=request,
+                                  remote_address=remote_address, http_context=http_context)
+        add_marketing_context_to_event(event=event, cache=marketing_contexts_cache)
 
 
 def add_cookie_id_contexts(events: EventDataList):
@@ -158,7 +188,7 @@ def set_time_in_events(events: EventDataList, current_millis: int, client_millis
         client_millis = current_millis
 
     offset = current_millis - client_millis
-    print(f'debug - time offset: {offset}')
+    logger.debug('time offset: %d', offset)
     for event in events:
         # here we correct the tracking time with the calculated offset
         # the assumption here is that transport time should be the same as the server time (current_millis)
@@ -196,7 +226,20 @@ def _get_remote_address(request: Request) -> str:
     return 'unknown'
 
 
-def add_http_context_to_event(event: EventData, request: Request):
+def _make_http_context(request: Request, remote_address: str) -> HttpContext:
+    """ Create an HttpContext from scratch, based on the data in the request. """
+    return HttpContext(
+        id='http_context',
+        remote_address=remote_address,
+        referrer=request.headers.get('Referer', ''),
+        user_agent=request.headers.get('User-Agent', '')
+    )
+
+
+def add_http_context_to_event(event: EventData,
+                              request: Request,
+                              remote_address: Optional[str] = None,
+                              http_context: Optional[HttpContext] = None):
     """
         Create or enrich an HttpContext based on the data in the current request. If an HttpContext is already
         present, the remote address is added to the existing context. Otherwise, a new context is created and
@@ -204,44 +247,59 @@ def add_http_context_to_event(event: EventData, request: Request):
 
         :param event - event to add context to
         :param request - request object, used to extract extra context from.
+        :param remote_address - remote address of the request, if already determined.
+        :param http_context - HttpContext to add if the event doesn't have one. If not set, a new context is
+            created from the request.
     """
-
-    remote_address = _get_remote_address(request)
+    if remote_address is None:
+        remote_address = _get_remote_address(request)
 
     # check if there is a pre-existing http_context
     # if so, use that.
-    contexts = get_contexts(event, 'HttpContext')
-    if contexts:
-        tracker_http_context = contexts[0]
+    tracker_http_context = get_optional_context(event, 'HttpContext')
+    if tracker_http_context is not None:
         tracker_http_context['remote_address'] = remote_address
     else:
-        # if a pre-existing context cannot be found, we create one from scratch
-        http_context = {
-            'id': 'http_context',
-            'remote_address': remote_address,
-            'referrer': request.headers.get('Referer', ''),
-            'user_agent': request.headers.get('User-Agent', '')
-        }
+        # if a pre-existing context cannot be found, we use one created from scratch
+        if http_context is None:
+            http_context = _make_http_context(request, remote_address)
+        add_global_context_to_event(event, http_context)
 
-        add_global_context_to_event(event, HttpContext(**http_context))
 
-
-def add_marketing_context_to_event(event: EventData) -> None:
+def add_marketing_context_to_event(event: EventData,
+                                   cache: Optional[Dict[str, List[MarketingContext]]] = None) -> None:
     """
     Tries to generate MarketingContext(s) based on parameters in the query string, and add to global contexts
     in the provided event.
     :param event: EventData
+    :param cache: optional dict, from url to the MarketingContexts of that url. Used to create the contexts
+        only once for events with the same url.
     :return:
     """
-    path_contexts = get_contexts(event, 'PathContext')
+    path_context = get_optional_context(event, 'PathContext')
 
-    if not path_contexts:
+    if path_context is None:
         # without a PathContext, we have no query_string
         return
+
+    url = str(path_context.get('id', ''))
+    if cache is None:
+        marketing_contexts = make_marketing_contexts(url)
     else:
-        path_context = path_contexts[0]
+        if url not in cache:
+            cache[url] = make_marketing_contexts(url)
+        marketing_contexts = cache[url]
+    for marketing_context in marketing_contexts:
+        add_global_context_to_event(event, marketing_context)
 
-    query_string = urlparse(str(path_context.get('id', ''))).query
+
+def make_marketing_contexts(url: str) -> List[MarketingContext]:
+    """
+    Generate MarketingContext(s) based on parameters in the query string of the url.
+    :param url: url, as found in the PathContext
+    :return: list of MarketingContexts, empty if there are no (complete) marketing parameters in the url
+    """
+    query_string = urlparse(url).query
     parsed_qs = parse_qs(query_string)
 
     # for now, we only support utm, but other mappings are possible
@@ -259,6 +317,7 @@ def add_marketing_context_to_event(event: EventData) -> None:
         }
     }
 
+    result = []
     for mapping_type in mappings:
         mapping = mappings[mapping_type]
         marketing_context_fields = {}
@@ -276,13 +335,14 @@ def add_marketing_context_to_event(event: EventData) -> None:
         if len(marketing_context_fields) > 1:
             # if no fields are set (other than id), no point in trying
             try:
-                add_global_context_to_event(event, MarketingContext(**marketing_context_fields))
+                result.append(MarketingContext(**marketing_context_fields))
             except TypeError as e:
                 # couldn't create a marketing context for this mapping, no problem, as this is not a mandatory context
                 #
                 # This way, the MarketingContext class decides whether sufficient / appropriate arguments are supplied
                 # to create a valid instance (that adheres to the schema), no need to implement that logic here.
                 pass
+    return result
 
 
 def write_sync_events(ok_events: EventDataList, nok_events: EventDataList, event_errors: List[EventError] = None):
@@ -295,17 +355,25 @@ def write_sync_events(ok_events: EventDataList, nok_events: EventDataList, event
     output_config = get_collector_config().output
     # todo: add exception handling. if one output fails, continue to next if configured.
     if output_config.postgres:
-        connection = get_db_connection(output_config.postgres)
-        try:
-            with connection:
-                insert_events_into_data(connection, events=ok_events)
-                insert_events_into_nok_data(connection, events=nok_events)
-        finally:
-            connection.close()
+        with span('write_postgres'):
+            connection = get_db_connection(output_config.postgres)
+            try:
+                with observe_duration(DB_TRANSACTION_DURATION, source='collector'), connection:
+                    insert_events_into_data(connection,
+                                            events=ok_events,
+                                            partitioned=output_config.postgres.partitioned_data,
+                                            extracted_columns=output_config.postgres.extracted_columns,
+                                            recent_event_ids=_recent_event_ids)
+                    insert_events_into_nok_data(connection, events=nok_events)
+                if _recent_event_ids is not None:
+                    _recent_event_ids.add_all(event['id'] for event in ok_events)
+            finally:
+                connection.close()
 
     if output_config.snowplow:
-        write_data_to_snowplow_if_configured(events=ok_events, good=True)
-        write_data_to_snowplow_if_configured(events=nok_events, good=False, event_errors=event_errors)
+        with span('write_snowplow'):
+            write_data_to_snowplow_if_configured(events=ok_events, good=True)
+            write_data_to_snowplow_if_configured(events=nok_events, good=False, event_errors=event_errors)
 
     if not output_config.file_system and not output_config.aws:
         return
@@ -313,8 +381,7 @@ def write_sync_events(ok_events: EventDataList, nok_events: EventDataList, event
         if events:
             data = events_to_json(events)
             moment = datetime.utcnow()
-            write_data_to_fs_if_configured(data=data, prefix=prefix, moment=moment)
-            write_data_to_s3_if_configured(data=data, prefix=prefix, moment=moment)
+            _write_data_to_files(data=data, prefix=prefix, moment=moment)
 
 
 def write_async_events(events: EventDataList):
@@ -327,13 +394,14 @@ def write_async_events(events: EventDataList):
     output_config = get_collector_config().output
     # todo: add exception handling. if one output fails, continue to next if configured.
     if output_config.postgres:
-        connection = get_db_connection(output_config.postgres)
-        try:
-            with connection:
-                pg_queue = PostgresQueues(connection=connection)
-                pg_queue.put_events(queue=ProcessingStage.ENTRY, events=events)
-        finally:
-            connection.close()
+        with span('write_queue'):
+            connection = get_db_connection(output_config.postgres)
+            try:
+                with observe_duration(DB_TRANSACTION_DURATION, source='collector'), connection:
+                    pg_queue = PostgresQueues(connection=connection)
+                    pg_queue.put_events(queue=ProcessingStage.ENTRY, events=events)
+            finally:
+                connection.close()
 
     if not output_config.file_system and not output_config.aws:
         return
@@ -341,6 +409,16 @@ def write_async_events(events: EventDataList):
     if events:
         data = events_to_json(events)
         moment = datetime.utcnow()
-        write_data_to_fs_if_configured(data=data, prefix=prefix, moment=moment)
-        write_data_to_s3_if_configured(data=data, prefix=prefix, moment=moment)
+        _write_data_to_files(data=data, prefix=prefix, moment=moment)
+
+
+def _write_data_to_files(data: str, prefix: str, moment: datetime):
+    """ Write data to the file system and to S3, if configured. """
+    output_config = get_collector_config().output
+    if output_config.file_system:
+        with span('write_fs', prefix=prefix):
+            write_data_to_fs_if_configured(data=data, prefix=prefix, moment=moment)
+    if output_config.aws:
+        with span('write_s3', prefix=prefix):
+            write_data_to_s3_if_configured(data=data, prefix=prefix, moment=moment)
 
@@ -5,6 +5,9 @@ import uuid
 import flask
 from flask import Response
 from objectiv_backend.common.config import get_collector_config
+from objectiv_backend.common.log import get_logger
+
+logger = get_logger(__name__)
 
 
 def get_json_response(status: int, msg: str) -> Response:
@@ -27,24 +30,26 @@ def get_cookie_id() -> str:
     """
     Get the tracking cookie uuid from the current request.
     If no tracking cookie is present in the current request, a random uuid is generated.
-    The generated random uuid is stored, so multiple invocations of this function within a request will
-    return the same value.
+    The cookie_id is stored, so multiple invocations of this function within a request will return the same
+    value without looking it up again.
 
     :raise Exception: If cookies are not configured
     """
     cookie_config = get_collector_config().cookie
     if not cookie_config:
         raise Exception('Cookies are not configured')  # This is a bug. We shouldn't call this function.
-    cookie_id = flask.request.cookies.get(cookie_config.name)
-    if not cookie_id:
-        # There's no cookie in the request, perhaps we already generated one earlier in this request
-        cookie_id = flask.g.get('G_COOKIE_ID')
+    # Perhaps we already determined the cookie_id earlier in this request
+    cookie_id = flask.g.get('G_COOKIE_ID')
+    if cookie_id:
+        return cookie_id
 
+    cookie_id = flask.request.cookies.get(cookie_config.name)
     if not cookie_id:
         # There's no cookie in the request, and we have not yet generated one
         # use uuid4 (random), so there is no predictability and bad actors cannot ruin sessions of others
         cookie_id = str(uuid.uuid4())
-        flask.g.G_COOKIE_ID = cookie_id
-        print(f'Generating cookie_id: {cookie_id}')
+        logger.debug('Generating cookie_id: %s', cookie_id)
 
-    return str(cookie_id)
+    cookie_id = str(cookie_id)
+    flask.g.G_COOKIE_ID = cookie_id
+    return cookie_id
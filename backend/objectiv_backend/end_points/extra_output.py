@@ -13,13 +13,15 @@ from typing import List
 
 
 from objectiv_backend.common.config import get_collector_config, SnowplowConfig
+from objectiv_backend.common.log import get_logger
 from objectiv_backend.common.types import EventDataList
 from objectiv_backend.schema.validate_events import EventError
-from objectiv_backend.snowplow.snowplow_helper import write_data_to_aws_pipeline, write_data_to_gcp_pubsub
 
-if get_collector_config().output.aws:
-    import boto3
-    from botocore.exceptions import ClientError
+# The clients of the optional outputs (boto3, the GCP pubsub client, and the generated Thrift code for
+# Snowplow) are slow to import. They are imported when first used, so they don't add to the start-up time
+# of the collector processes that don't use them.
+
+logger = get_logger(__name__)
 
 
 def events_to_json(events: EventDataList) -> str:
@@ -61,6 +63,9 @@ def write_data_to_s3_if_configured(data: str, prefix: str, moment: datetime) ->
     if not aws_config:
         return
 
+    import boto3
+    from botocore.exceptions import ClientError
+
     timestamp = moment.timestamp()
     datestamp = moment.strftime('%Y/%m/%d')
     object_name = f'{aws_config.s3_prefix}/{datestamp}/{prefix}/{timestamp}.json'
@@ -73,7 +78,7 @@ def write_data_to_s3_if_configured(data: str, prefix: str, moment: datetime) ->
     try:
         s3_client.upload_fileobj(file_obj, aws_config.bucket, object_name)
     except ClientError as e:
-        print(f'Error uploading to s3: {e} ')
+        logger.error('Error uploading to s3: %s', e)
 
 
 def write_data_to_snowplow_if_configured(events: EventDataList,
@@ -87,7 +92,10 @@ def write_data_to_snowplow_if_configured(events: EventDataList,
     :return:
     """
     config: SnowplowConfig = get_collector_config().output.snowplow
+    if not config.aws_enabled and not config.gcp_enabled:
+        return
 
+    from objectiv_backend.snowplow.snowplow_helper import write_data_to_aws_pipeline, write_data_to_gcp_pubsub
     if config.aws_enabled:
         write_data_to_aws_pipeline(events=events, config=config, good=good, event_errors=event_errors)
 
@@ -0,0 +1,11 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+from flask import Response
+
+from objectiv_backend.common.metrics import generate_metrics, CONTENT_TYPE
+
+
+def metrics() -> Response:
+    """ Endpoint that returns the metrics of this process in the Prometheus text format. """
+    return Response(content_type=CONTENT_TYPE, status=200, response=generate_metrics())
@@ -1,17 +1,24 @@
 """
 Copyright 2021 Objectiv B.V.
 """
+import hashlib
 import json5 # type: ignore
 import json
 import os
+import pickle
 import re
-import sys
+import tempfile
 from copy import deepcopy
 from typing import Set, List, Dict, Any, Optional, Tuple
 import pkgutil
 
+import jsonschema
+
+from objectiv_backend.common.log import get_logger
 from objectiv_backend.common.types import EventType, ContextType, EventListSchema
 
+logger = get_logger(__name__)
+
 MAX_HIERARCHY_DEPTH = 100
 
 
@@ -327,6 +334,16 @@ class EventSchema:
         self.version = {}
         self.events = EventSubSchema()
         self.contexts = ContextSubSchema()
+        # Cache of json-schema validators, per event type and context type. These are derived from the
+        # (immutable) schema, so they can be shared, and are not pickled.
+        self._event_validators: Dict[EventType, Any] = {}
+        self._context_validators: Dict[ContextType, Any] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_event_validators'] = {}
+        state['_context_validators'] = {}
+        return state
 
     def get_extended_schema(self, schema: Dict[str, Any]) -> 'EventSchema':
         """
@@ -423,6 +440,50 @@ class EventSchema:
     def get_event_schema(self, event_type: EventType) -> Optional[Dict[str, Any]]:
         return self.events.get_event_schema(event_type=event_type)
 
+    def get_event_validator(self, event_type: EventType):
+        """
+        Give a json-schema validator for the json-schema of the given event_type, or None if the event type
+        doesn't exist. Validators are created once, and then cached.
+        """
+        validator = self._event_validators.get(event_type)
+        if validator is None:
+            schema = self.get_event_schema(event_type)
+            if schema is None:
+                return None
+            validator = _create_validator(schema)
+            self._event_validators[event_type] = validator
+        return validator
+
+    def get_context_validator(self, context_type: ContextType):
+        """
+        Give a json-schema validator for the json-schema of the given context_type, or None if the context
+        type doesn't exist. Validators are created once, and then cached.
+        """
+        validator = self._context_validators.get(context_type)
+        if validator is None:
+            schema = self.get_context_schema(context_type)
+            if schema is None:
+                return None
+            validator = _create_validator(schema)
+            self._context_validators[context_type] = validator
+        return validator
+
+    def compile_validators(self):
+        """ Create the validators of all event types and context types, so no request has to wait on that. """
+        for event_type in self.list_event_types():
+            self.get_event_validator(event_type)
+        for context_type in self.list_context_types():
+            self.get_context_validator(context_type)
+
+
+def _create_validator(schema: Dict[str, Any]):
+    """
+    Create a validator for the given json-schema, of the same class that jsonschema.validate() would use.
+    """
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
 
 def get_event_list_schema() -> EventListSchema:
     data = pkgutil.get_data(__name__, "event_list.json5")
@@ -431,7 +492,8 @@ def get_event_list_schema() -> EventListSchema:
     return schema_json
 
 
-def get_event_schema(schema_extensions_directory: Optional[str]) -> EventSchema:
+def get_event_schema(schema_extensions_directory: Optional[str],
+                     cache_directory: Optional[str] = None) -> EventSchema:
     """
     Get the event schema.
 
@@ -440,31 +502,45 @@ def get_event_schema(schema_extensions_directory: Optional[str]) -> EventSchema:
     Files in the extension directory qualify for loading if their name matches [a-z0-9_]+\\.json.
     The files are loaded in alphabetical order.
 
+    If cache_directory is set, the resulting schema is stored there (pickled), and later calls with the same
+    schema files load it from there, instead of parsing and combining the schema files again.
+
     :param schema_extensions_directory: optional directory path.
+    :param cache_directory: optional directory path.
     """
-
-    schema_jsons = []
     # load base schema from the current dir using pkgutil
     # this should also work when running from a zipped package
     from objectiv_backend.common.config import LOAD_BASE_SCHEMA
+    base_data = None
     if LOAD_BASE_SCHEMA:
-        data = pkgutil.get_data(__name__, "base_schema.json5")
-        if data:
-            base_schema = json5.loads(data)
-            schema_jsons.append(base_schema)
+        base_data = pkgutil.get_data(__name__, "base_schema.json5")
 
     files_to_load = []
     if schema_extensions_directory:
         all_filenames = sorted(os.listdir(schema_extensions_directory))
         for filename in all_filenames:
             if not re.match(r'[a-z0-9_]+\.json', filename):
-                print(f'Ignoring non-schema file: {filename}', file=sys.stderr)
+                logger.warning('Ignoring non-schema file: %s', filename)
                 continue
             files_to_load.append(os.path.join(schema_extensions_directory, filename))
 
+    raw_extensions = []
     for filepath in files_to_load:
         with open(filepath, mode='r') as file:
-            raw_data = file.read()
+            raw_extensions.append((filepath, file.read()))
+
+    cache_path = None
+    if cache_directory:
+        cache_path = os.path.join(cache_directory,
+                                  f'event_schema_{_get_cache_key(base_data, raw_extensions)}.pickle')
+        event_schema = _load_cached_event_schema(cache_path)
+        if event_schema is not None:
+            return event_schema
+
+    schema_jsons = []
+    if base_data:
+        schema_jsons.append(json5.loads(base_data))
+    for filepath, raw_data in raw_extensions:
         try:
             schema = json.loads(raw_data)
         except ValueError as exc:
@@ -475,4 +551,50 @@ def get_event_schema(schema_extensions_directory: Optional[str]) -> EventSchema:
     event_schema = EventSchema()
     for schema_json in schema_jsons:
         event_schema = event_schema.get_extended_schema(schema_json)
-    return event_schema
\ No newline at end of file
+
+    if cache_path:
+        _store_cached_event_schema(cache_path, event_schema)
+    return event_schema
+
+
+def _get_cache_key(base_data: Optional[bytes], raw_extensions: List[Tuple[str, str]]) -> str:
+    """ Give a key that changes if the schema files, or the version of this package change. """
+    from objectiv_backend import __version__
+    digest = hashlib.sha256()
+    digest.update(__version__.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(base_data or b'')
+    for filepath, raw_data in raw_extensions:
+        digest.update(b'\0')
+        digest.update(os.path.basename(filepath).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(raw_data.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _load_cached_event_schema(cache_path: str) -> Optional[EventSchema]:
+    try:
+        with open(cache_path, 'rb') as file:
+            event_schema = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        logger.warning('Could not load cached event schema %s: %s', cache_path, exc)
+        return None
+    if not isinstance(event_schema, EventSchema):
+        logger.warning('Cached event schema %s does not contain an event schema', cache_path)
+        return None
+    logger.debug('Loaded cached event schema %s', cache_path)
+    return event_schema
+
+
+def _store_cached_event_schema(cache_path: str, event_schema: EventSchema):
+    """ Store the event schema. The file is written under a temporary name, and then moved in place. """
+    directory = os.path.dirname(cache_path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode='wb', dir=directory, delete=False) as file:
+            pickle.dump(event_schema, file)
+        os.replace(file.name, cache_path)
+    except OSError as exc:
+        logger.warning('Could not store cached event schema %s: %s', cache_path, exc)
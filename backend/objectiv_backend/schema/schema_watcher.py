@@ -0,0 +1,98 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Reloading of the event schema when the schema extension files change, without restarting the process.
+"""
+import os
+import threading
+from typing import Callable, Optional, Tuple
+
+from objectiv_backend.common.log import get_logger
+from objectiv_backend.schema.event_schemas import EventSchema
+
+logger = get_logger(__name__)
+
+DirectorySignature = Tuple[Tuple[str, int, int], ...]
+
+
+def get_directory_signature(directory: str) -> DirectorySignature:
+    """ Give a value that changes when files in the directory are added, removed, or modified. """
+    signature = []
+    for filename in sorted(os.listdir(directory)):
+        try:
+            stat = os.stat(os.path.join(directory, filename))
+        except FileNotFoundError:
+            # removed while we're listing
+            continue
+        signature.append((filename, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class SchemaWatcher:
+    """
+    Polls the schema extension directory, and if its files changed loads and compiles the new schema in a
+    background thread, and then hands it to on_change. Until then the current schema can be used as
+    usual. If loading the new schema fails, the error is logged and the current schema stays in use.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 interval: float,
+                 load: Callable[[], EventSchema],
+                 on_change: Callable[[EventSchema], None]):
+        """
+        :param directory: schema extension directory to watch
+        :param interval: seconds between checks
+        :param load: function that loads the schema
+        :param on_change: function that is called with the newly loaded schema
+        """
+        self._directory = directory
+        self._interval = interval
+        self._load = load
+        self._on_change = on_change
+        # Signature of the directory at creation, i.e. of the schema that was loaded when this was created
+        self._signature = get_directory_signature(directory)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def check(self) -> bool:
+        """
+        Check the directory once, and load and hand over the new schema if it changed.
+        :return: True if a new schema was loaded
+        """
+        signature = get_directory_signature(self._directory)
+        if signature == self._signature:
+            return False
+        # Remember the signature even if loading fails, to not retry the same broken files every interval
+        self._signature = signature
+        try:
+            event_schema = self._load()
+            event_schema.compile_validators()
+        except Exception as exc:
+            logger.error('Could not load changed event schema, keeping the current schema: %s', exc)
+            return False
+        self._on_change(event_schema)
+        logger.info('Loaded changed event schema, version: %s', event_schema.version)
+        return True
+
+    def is_alive(self) -> bool:
+        """ Whether the watcher thread runs. After a fork the thread does not run in the child process. """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Start checking the directory in a daemon thread, if that isn't running already. """
+        if self.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='schema-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.check()
+            except Exception as exc:
+                logger.error('Checking schema extension directory failed: %s', exc)
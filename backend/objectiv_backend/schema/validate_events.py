@@ -4,19 +4,24 @@ Copyright 2021 Objectiv B.V.
 import argparse
 import json
 import sys
-from typing import List, Any, Dict, NamedTuple
+from copy import deepcopy
+from typing import List, Any, Dict, NamedTuple, Optional, Tuple
 import uuid
 import re
 
 import jsonschema
 from jsonschema import ValidationError
+from jsonschema.exceptions import best_match
 
 from objectiv_backend.schema.event_schemas import EventSchema, get_event_schema
 from objectiv_backend.common.config import \
     get_config_timestamp_validation, get_collector_config
 
+from objectiv_backend.common.log import get_logger
 from objectiv_backend.common.types import EventData
 
+logger = get_logger(__name__)
+
 
 class ErrorInfo(NamedTuple):
     data: Any
@@ -44,7 +49,7 @@ def get_event_list_schema() -> Dict[str, Any]:
     :return: a dictionary containing a JSON schema like string to validate an array of events
     """
     event_schema = get_collector_config().event_schema
-    events = event_schema.events.schema
+    events = deepcopy(event_schema.events.schema)
 
     # we use AbstractEvent as the blueprint for what an event should look like
     abstract_event = events['AbstractEvent']
@@ -63,7 +68,7 @@ def get_event_list_schema() -> Dict[str, Any]:
     # the schema wants a list of abstract events. As that is not a valid JSON type,
     # we replace that type with the more generic 'object' type, and the actual definition of
     # an abstract event
-    event_list_schema = get_collector_config().event_list_schema
+    event_list_schema = deepcopy(get_collector_config().event_list_schema)
     if 'events' in event_list_schema['properties'] and \
             'items' in event_list_schema['properties']['events'] and \
             'type' in event_list_schema['properties']['events']['items'] and \
@@ -75,6 +80,39 @@ def get_event_list_schema() -> Dict[str, Any]:
     return event_list_schema
 
 
+# The validator for the event list schema, and the event schema and event list schema it was created for
+_event_list_validator: Optional[Tuple[EventSchema, Dict[str, Any], Any]] = None
+
+
+def _get_event_list_validator():
+    """
+    Give a validator for the schema of get_event_list_schema(). The validator is cached, until the event
+    schema or event list schema in the collector config change.
+    """
+    global _event_list_validator
+    config = get_collector_config()
+    cached = _event_list_validator
+    if cached is not None and cached[0] is config.event_schema and cached[1] is config.event_list_schema:
+        return cached[2]
+    schema = get_event_list_schema()
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    validator = validator_class(schema)
+    _event_list_validator = (config.event_schema, config.event_list_schema, validator)
+    return validator
+
+
+def _validate_instance(validator, instance: Any):
+    """
+    Validate instance with a validator from EventSchema.get_event_validator() or similar. Raises the same
+    error as jsonschema.validate() would, without checking the schema itself on every call.
+    :raise ValidationError: if instance is not valid
+    """
+    error = best_match(validator.iter_errors(instance))
+    if error is not None:
+        raise error
+
+
 def validate_structure_event_list(event_data: Any) -> List[ErrorInfo]:
     """
     Checks that event_data is a list of events, that each event has the required fields, and that all
@@ -85,8 +123,7 @@ def validate_structure_event_list(event_data: Any) -> List[ErrorInfo]:
     :return: list of found errors. Empty list indicates not errors
     """
     try:
-        event_list_schema = get_event_list_schema()
-        jsonschema.validate(instance=event_data, schema=event_list_schema)
+        _validate_instance(_get_event_list_validator(), event_data)
     except ValidationError as exc:
         return [ErrorInfo(event_data, f'Overall structure does not adhere to schema: {exc}')]
     return []
@@ -201,12 +238,12 @@ def _validate_context_item(event_schema: EventSchema, context) -> List[ErrorInfo
     context_type = context['_type']
     # theoretically we could generate some json schema with if-then that we could just validate, without
     # having to select the right sub-schema here, but that would be very complex and not very readable.
-    schema = event_schema.get_context_schema(context_type)
-    if not schema:
-        print(f'Unknown context {context_type}, ignoring')
+    validator = event_schema.get_context_validator(context_type)
+    if not validator:
+        logger.debug('Unknown context %s, ignoring', context_type)
         return []
     try:
-        jsonschema.validate(instance=context, schema=schema)
+        _validate_instance(validator, context)
     except ValidationError as exc:
         return [ErrorInfo(context, f'context validation failed: {exc}')]
     return []
@@ -214,9 +251,9 @@ def _validate_context_item(event_schema: EventSchema, context) -> List[ErrorInfo
 
 def _validate_event_item(event_schema: EventSchema, event) -> List[ErrorInfo]:
     event_type = event['_type']
-    schema = event_schema.get_event_schema(event_type=event_type)
+    validator = event_schema.get_event_validator(event_type=event_type)
     try:
-        jsonschema.validate(instance=event, schema=schema)
+        _validate_instance(validator, event)
     except ValidationError as exc:
         return [ErrorInfo(event, f'event validation failed {exc}')]
 
@@ -7,23 +7,16 @@ from urllib.parse import urlparse
 
 from objectiv_backend.snowplow.schema.ttypes import CollectorPayload  # type: ignore
 
-from objectiv_backend.common.config import SnowplowConfig, get_collector_config
+from objectiv_backend.common.config import SnowplowConfig
 from objectiv_backend.common.event_utils import get_context
+from objectiv_backend.common.log import get_logger
 from objectiv_backend.common.types import EventDataList, EventData
 from objectiv_backend.schema.validate_events import EventError
 
 from thrift.protocol import TBinaryProtocol
 from thrift.transport import TTransport
 
-# only load imports if needed
-snowplow_config = get_collector_config().output.snowplow
-if snowplow_config.gcp_enabled:
-    from google.cloud import pubsub_v1
-    from google.api_core.exceptions import NotFound
-
-if snowplow_config.aws_enabled:
-    import boto3
-    import botocore.exceptions
+logger = get_logger(__name__)
 
 
 def make_snowplow_custom_context(self_describing_event: Dict, config: SnowplowConfig) -> str:
@@ -281,6 +274,10 @@ def write_data_to_gcp_pubsub(events: EventDataList, config: SnowplowConfig, good
     :return:
     """
 
+    # only import the GCP client when it is used, it's slow to import and not installed for every setup
+    from google.cloud import pubsub_v1
+    from google.api_core.exceptions import NotFound
+
     project = config.gcp_project
     if good:
         # good events get sent to the raw topic, which means they get processed by snowplow's enrichment
@@ -298,7 +295,7 @@ def write_data_to_gcp_pubsub(events: EventDataList, config: SnowplowConfig, good
         try:
             publisher.publish(topic_path, data=data)
         except NotFound as e:
-            print(f'PubSub topic {topic} could not be found! {e}')
+            logger.error('PubSub topic %s could not be found! %s', topic, e)
 
 
 def write_data_to_aws_pipeline(events: EventDataList, config: SnowplowConfig,
@@ -312,6 +309,9 @@ def write_data_to_aws_pipeline(events: EventDataList, config: SnowplowConfig,
     :param event_errors: list of EventErrors
     :return:
     """
+    # only import the AWS client when it is used, it's slow to import and not installed for every setup
+    import boto3
+    import botocore.exceptions
 
     if good:
         # good events get sent to the raw topic, which means they get processed by snowplow's enrichment
@@ -339,9 +339,9 @@ def write_data_to_aws_pipeline(events: EventDataList, config: SnowplowConfig,
                     Data=data,
                     PartitionKey='event_id')
             except client.exceptions.ProvisionedThroughputExceededException as e:
-                print(f'Could not deliver event to Kinesis: throughput exceeded in {stream_name}: {e}')
+                logger.error('Could not deliver event to Kinesis: throughput exceeded in %s: %s', stream_name, e)
             except botocore.exceptions.ClientError as e:
-                print(f'Exception sending event to Kinesis ({stream_name}: {e}')
+                logger.error('Exception sending event to Kinesis (%s): %s', stream_name, e)
 
         elif client_type == 'sqs':
             # sqs doesn't support binary payloads, so in this case we base64 encode
@@ -358,9 +358,9 @@ def write_data_to_aws_pipeline(events: EventDataList, config: SnowplowConfig,
                                         }
                                     })
             except client.exceptions.InvalidMessageContents as e:
-                print(f'Failed to deliver event to SQS: Invalid Message Contents ({stream_name}: {e}')
+                logger.error('Failed to deliver event to SQS: Invalid Message Contents (%s): %s', stream_name, e)
             except botocore.exceptions.ClientError as e:
-                print(f'Failed to deliver event to SQS ({stream_name}: {e}')
+                logger.error('Failed to deliver event to SQS (%s): %s', stream_name, e)
 
         else:
             # this should never happen
@@ -3,13 +3,22 @@ Tool that connects to the database and creates the needed tables as defined in c
 If a duplicate-table error is encounterd, then the script will assume that the databse is already
 initialized correctly and exit successfully.
 
+With --partitioned the data and nok_data tables are created as tables that are partitioned by day, as
+defined in create_tables_partitioned.sql, and partitions for the current month are created. Use
+objectiv-db-partitions to create future partitions.
+
+With --extracted-columns the data table gets extra columns as defined in
+create_tables_extracted_columns.sql.
+
 This assumes that the user and database already exist.
 
 Copyright 2021 Objectiv B.V.
 """
 import argparse
 import os
+import re
 import sys
+from datetime import datetime
 from time import sleep
 
 import psycopg2
@@ -19,16 +28,50 @@ from objectiv_backend.common.db import get_db_connection
 
 _MAX_RETRIES = 5
 _POSTGRES_DUPLICATE_TABLE_ERROR = '42P07'
+_SECTION_PATTERN = re.compile(
+    r'(?P<start>^-- \[section: (?P<name>[\w ]+)\]\n)(?P<body>.*?)(?P<end>^-- \[end section\]$)',
+    re.MULTILINE | re.DOTALL
+)
 
 
-def get_sql() -> str:
-    """ get content of ../../create_tables.sql as string """
+def _read_sql_file(name: str) -> str:
     dirname = os.path.dirname(__file__)
-    filename = os.path.join(dirname, '../../create_tables.sql')
+    filename = os.path.join(dirname, '../..', name)
     with open(filename) as f:
         return f.read()
 
 
+def get_sql(partitioned: bool = False, extracted_columns: bool = False) -> str:
+    """
+    get content of ../../create_tables.sql as string
+    :param partitioned: if True, replace the sections in create_tables.sql with the sections from
+        create_tables_partitioned.sql
+    :param extracted_columns: if True, replace the sections in create_tables.sql with the sections from
+        create_tables_extracted_columns.sql
+    """
+    sql = _read_sql_file('create_tables.sql')
+    if partitioned:
+        sql = _replace_sections(sql, _read_sql_file('create_tables_partitioned.sql'))
+    if extracted_columns:
+        sql = _replace_sections(sql, _read_sql_file('create_tables_extracted_columns.sql'))
+    return sql
+
+
+def _replace_sections(sql: str, replacement_sql: str) -> str:
+    """ Replace the body of the sections in sql with the bodies of the same sections in replacement_sql """
+    replacements = {match.group('name'): match.group('body')
+                    for match in _SECTION_PATTERN.finditer(replacement_sql)}
+    missing = set(replacements) - {match.group('name') for match in _SECTION_PATTERN.finditer(sql)}
+    if missing:
+        raise Exception(f'Sections not found in create_tables.sql: {sorted(missing)}')
+    return _SECTION_PATTERN.sub(
+        lambda match: match.group('start')
+        + replacements.get(match.group('name'), match.group('body'))
+        + match.group('end'),
+        sql
+    )
+
+
 def get_connection_with_retries(retry: bool):
     """ Connect to database. If retry set will attempt multiple times"""
     pg_config = get_config_postgres()
@@ -54,8 +97,12 @@ def main():
                              "giving the database time to start up if run at start up. If set won't retry")
     parser.add_argument('--print', dest='print', default=False, action='store_true',
                         help="Instead of running sql to setup schema, print it to stdout")
+    parser.add_argument('--partitioned', dest='partitioned', default=False, action='store_true',
+                        help="Create the data and nok_data tables as tables that are partitioned by day")
+    parser.add_argument('--extracted-columns', dest='extracted_columns', default=False, action='store_true',
+                        help="Add columns with values extracted from the events to the data table")
     args = parser.parse_args(sys.argv[1:])
-    sql = get_sql()
+    sql = get_sql(partitioned=args.partitioned, extracted_columns=args.extracted_columns)
 
     if args.print:
         print(sql)
@@ -65,6 +112,11 @@ def main():
     with connection.cursor() as cursor:
         try:
             cursor.execute(sql)
+            if args.partitioned:
+                # Import here to prevent a circular import
+                from objectiv_backend.tools.db_partitions.db_partitions import maintain_partitions
+                with connection:
+                    maintain_partitions(cursor, today=datetime.utcnow().date(), interval='month', days_ahead=0)
             print('Succesfully initialized database.')
         except psycopg2.Error as error:
             if error.pgcode == _POSTGRES_DUPLICATE_TABLE_ERROR:
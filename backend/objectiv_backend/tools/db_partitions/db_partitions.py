@@ -0,0 +1,213 @@
+"""
+Tool to maintain the partitions of the data and nok_data tables, for databases that were initialized with
+`objectiv-db-init --partitioned`.
+
+Run this regularly (e.g. daily). It will:
+ * create the partitions for the coming days, such that new events never end up in the default partitions
+ * if --retention-days is set: detach the partitions that only contain data older than that, and either
+   drop them or move them to the schema given by --archive-schema. The event_ids of the retired data
+   partitions are removed from data_event_ids as well.
+
+Partitions cover either a day or a month, depending on --interval. The interval of an existing database
+should not be changed, as the new partitions would overlap with the existing ones. A partition can only
+be created if the default partition contains no rows for its period; so make sure to create partitions
+well in advance.
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import re
+import sys
+from datetime import date, datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+from psycopg2 import sql
+
+from objectiv_backend.tools.db_init.db_init import get_connection_with_retries
+
+PARTITIONED_TABLES = ('data', 'nok_data')
+INTERVALS = ('day', 'month')
+
+_BOUND_PATTERN = re.compile(r"^FOR VALUES FROM \('(?P<start>[\d-]+)'\) TO \('(?P<end>[\d-]+)'\)$")
+
+
+class Partition(NamedTuple):
+    name: str
+    # first day in the partition
+    start: date
+    # first day after the partition
+    end: date
+
+
+def get_period_start(day: date, interval: str) -> date:
+    """ Give the first day of the period of the given interval that contains day. """
+    if interval == 'day':
+        return day
+    if interval == 'month':
+        return day.replace(day=1)
+    raise ValueError(f'Unknown interval: {interval}')
+
+
+def get_next_period_start(start: date, interval: str) -> date:
+    """ Give the first day of the period after the period that starts at start. """
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if interval == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    raise ValueError(f'Unknown interval: {interval}')
+
+
+def get_periods(first_day: date, last_day: date, interval: str) -> List[Tuple[date, date]]:
+    """
+    Give the periods of the given interval that together cover first_day up to and including last_day.
+    :return: list of tuples (start, end), with end being the first day after the period
+    """
+    periods = []
+    start = get_period_start(first_day, interval)
+    while start <= last_day:
+        end = get_next_period_start(start, interval)
+        periods.append((start, end))
+        start = end
+    return periods
+
+
+def get_partition_name(table: str, start: date, interval: str) -> str:
+    """ Give the name of the partition of table that covers the period starting at start. """
+    if interval == 'day':
+        return f'{table}_{start:%Y%m%d}'
+    if interval == 'month':
+        return f'{table}_{start:%Y%m}'
+    raise ValueError(f'Unknown interval: {interval}')
+
+
+def parse_partition_bound(bound: str) -> Optional[Tuple[date, date]]:
+    """
+    Parse the bound of a range partition, as given by pg_get_expr(relpartbound, oid).
+    :return: tuple (start, end), or None for the default partition
+    """
+    if bound == 'DEFAULT':
+        return None
+    match = _BOUND_PATTERN.match(bound)
+    if not match:
+        raise ValueError(f'Unexpected partition bound: {bound}')
+    return date.fromisoformat(match.group('start')), date.fromisoformat(match.group('end'))
+
+
+def get_partitions(cursor, table: str) -> List[Partition]:
+    """ Give the range partitions of the given table, ordered by start. The default partition is skipped. """
+    cursor.execute('''
+        select c.relname, pg_get_expr(c.relpartbound, c.oid)
+        from pg_inherits as i
+        inner join pg_class as c on c.oid = i.inhrelid
+        where i.inhparent = %s::regclass
+    ''', (table, ))
+    partitions = []
+    for name, bound in cursor.fetchall():
+        parsed_bound = parse_partition_bound(bound)
+        if parsed_bound is not None:
+            partitions.append(Partition(name=name, start=parsed_bound[0], end=parsed_bound[1]))
+    return sorted(partitions, key=lambda partition: partition.start)
+
+
+def create_partitions(cursor, table: str, first_day: date, last_day: date, interval: str) -> List[str]:
+    """
+    Create the partitions of table that are needed to cover first_day up to and including last_day.
+    Periods that overlap with an existing partition are skipped.
+    :return: names of the created partitions
+    """
+    existing = get_partitions(cursor, table)
+    created = []
+    for start, end in get_periods(first_day, last_day, interval):
+        if any(partition.start < end and start < partition.end for partition in existing):
+            continue
+        name = get_partition_name(table, start, interval)
+        cursor.execute(
+            sql.SQL('create table {} partition of {} for values from ({}) to ({})').format(
+                sql.Identifier(name), sql.Identifier(table),
+                sql.Literal(start.isoformat()), sql.Literal(end.isoformat())
+            )
+        )
+        created.append(name)
+    return created
+
+
+def retire_partitions(cursor, table: str, before: date, archive_schema: Optional[str]) -> List[Partition]:
+    """
+    Detach the partitions of table that only contain days before the given day. Detached partitions are
+    moved to archive_schema if that is set, and dropped otherwise.
+    :return: the retired partitions
+    """
+    retired = [partition for partition in get_partitions(cursor, table) if partition.end <= before]
+    if retired and archive_schema:
+        cursor.execute(sql.SQL('create schema if not exists {}').format(sql.Identifier(archive_schema)))
+    for partition in retired:
+        cursor.execute(sql.SQL('alter table {} detach partition {}').format(
+            sql.Identifier(table), sql.Identifier(partition.name)))
+        if archive_schema:
+            cursor.execute(sql.SQL('alter table {} set schema {}').format(
+                sql.Identifier(partition.name), sql.Identifier(archive_schema)))
+        else:
+            cursor.execute(sql.SQL('drop table {}').format(sql.Identifier(partition.name)))
+    return retired
+
+
+def delete_event_ids(cursor, before: date) -> int:
+    """
+    Remove the event_ids of the days before the given day from data_event_ids. After this, duplicates of
+    those events are no longer detected, which is fine as long as the collector rejects events that old.
+    :return: number of removed event_ids
+    """
+    cursor.execute('delete from data_event_ids where day < %s', (before, ))
+    return cursor.rowcount
+
+
+def maintain_partitions(cursor,
+                        today: date,
+                        interval: str,
+                        days_ahead: int,
+                        retention_days: Optional[int] = None,
+                        archive_schema: Optional[str] = None):
+    """ Create and retire the partitions of all partitioned tables. See the module docstring. """
+    for table in PARTITIONED_TABLES:
+        created = create_partitions(cursor, table, today, today + timedelta(days=days_ahead), interval)
+        print(f'{table}: created {len(created)} partition(s) {", ".join(created)}')
+        if retention_days is None:
+            continue
+        retired = retire_partitions(cursor, table, today - timedelta(days=retention_days), archive_schema)
+        print(f'{table}: retired {len(retired)} partition(s) {", ".join(p.name for p in retired)}')
+        if table == 'data' and retired:
+            deleted = delete_event_ids(cursor, max(partition.end for partition in retired))
+            print(f'data_event_ids: deleted {deleted} event_id(s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Create and retire partitions of the data and nok_data tables')
+    parser.add_argument('--interval', choices=INTERVALS, default='month',
+                        help='Period covered by a single partition. Default: month')
+    parser.add_argument('--days-ahead', type=int, default=31,
+                        help='Create partitions for today up to this many days ahead. Default: 31')
+    parser.add_argument('--retention-days', type=int, default=None,
+                        help='If set, retire partitions that only contain days older than this many days')
+    parser.add_argument('--archive-schema', type=str, default=None,
+                        help='Move retired partitions to this schema, instead of dropping them')
+    parser.add_argument('--no-retries', dest='retry', default=True, action='store_false',
+                        help="By default we'll try to connect multiple times before giving up. "
+                             "If set won't retry")
+    args = parser.parse_args(sys.argv[1:])
+
+    today = datetime.utcnow().date()
+    connection = get_connection_with_retries(args.retry)
+    with connection:
+        with connection.cursor() as cursor:
+            maintain_partitions(cursor=cursor,
+                                today=today,
+                                interval=args.interval,
+                                days_ahead=args.days_ahead,
+                                retention_days=args.retention_days,
+                                archive_schema=args.archive_schema)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+"""
+Tool to bulk load events from files into the data and nok_data tables, e.g. to backfill a database from
+the RAW output of the file system or S3 sinks of the collector.
+
+Input files contain one json value per line: an event, a list of events (as written by the file system and
+S3 sinks), or a tracker request (an object with an 'events' list). Files ending in '.gz' are decompressed
+while reading. Directories are searched recursively, and all files are loaded in sorted order.
+
+The events go through the same steps as in the collector and workers, except for the steps that need the
+original http request:
+ * enrichment: MarketingContexts are added, if an event doesn't have any yet. Events without a
+   CookieIdContext cannot be stored and are skipped, as are events that are not structured as an event.
+ * validation against the configured schema. The time of the events is not validated, as the events
+   might have been received long ago.
+ * type hydration of the events that pass validation.
+These steps run in parallel in --processes worker processes. The events that pass validation are bulk
+loaded into data with COPY, through a temporary staging table; events that already exist, or occur more
+than once, are stored in nok_data as duplicates, as the workers do. The other events are copied into
+nok_data.
+
+Progress is tracked per file in the load_checkpoints table, updated in the same transaction as the loaded
+events. An interrupted load can simply be started again: finished files are skipped, and partially loaded
+files continue after the last loaded line. Files are identified by their absolute path.
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import sys
+from io import StringIO
+from typing import Dict, IO, Iterator, List, NamedTuple, Optional, Tuple
+
+from objectiv_backend.common.config import get_collector_config, get_config_postgres
+from objectiv_backend.common.event_utils import get_context, get_optional_context
+from objectiv_backend.common.types import EventData, EventDataList, FailureReason
+from objectiv_backend.end_points.collector import add_marketing_context_to_event
+from objectiv_backend.schema.validate_events import validate_structure_event_list
+from objectiv_backend.tools.db_init.db_init import get_connection_with_retries
+from objectiv_backend.tools.util import imap_bounded
+from objectiv_backend.workers.pg_storage import _millis_to_datetime
+from objectiv_backend.workers.worker_entry import process_events_entry
+
+_CREATE_TABLES_SQL = '''
+    create table if not exists load_checkpoints (
+        path text not null,
+        -- number of lines of the file that are loaded
+        line_count bigint not null,
+        finished boolean not null,
+        primary key(path)
+    );
+'''
+
+_DATA_COLUMNS = ['event_id', 'day', 'moment', 'cookie_id', 'value']
+_EXTRACTED_COLUMNS = ['event_type', 'stack_event_types', 'global_contexts', 'location_stack']
+_NOK_DATA_COLUMNS = ['event_id', 'day', 'moment', 'cookie_id', 'value', 'reason']
+
+
+class Batch(NamedTuple):
+    path: str
+    # lines of the file in this batch: [start_line, end_line)
+    start_line: int
+    end_line: int
+    finished: bool
+    events: EventDataList
+
+
+class BatchResult(NamedTuple):
+    path: str
+    end_line: int
+    finished: bool
+    # rows for the data and nok_data tables, in the COPY text format
+    data_rows: str
+    nok_data_rows: str
+    ok_count: int
+    nok_count: int
+    skipped_count: int
+
+
+class LoadResult(NamedTuple):
+    files: int
+    ok: int
+    nok: int
+    duplicates: int
+    skipped: int
+
+
+def find_files(paths: List[str]) -> List[str]:
+    """ Give the absolute paths of the given files, and of all files in the given directories, sorted. """
+    result: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in os.walk(path):
+                result.extend(os.path.join(directory, filename) for filename in filenames)
+        else:
+            result.append(path)
+    return sorted(os.path.abspath(path) for path in result)
+
+
+def _open(path: str) -> IO[str]:
+    if path.endswith('.gz'):
+        return gzip.open(path, mode='rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def parse_line(line: str) -> EventDataList:
+    """
+    Give the events in a line of an input file.
+    :raise ValueError: if the line is not valid json, or not an event, list of events, or event list.
+    """
+    value = json.loads(line)
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict) and isinstance(value.get('events'), list):
+        return value['events']
+    if isinstance(value, dict):
+        return [value]
+    raise ValueError(f'Line does not contain an event, list of events, or event list: {line[:100]}')
+
+
+def read_batches(path: str, start_line: int, batch_size: int) -> Iterator[Batch]:
+    """
+    Read the events of a file, in batches of complete lines with at least batch_size events (except for
+    the last batch).
+    :param path: path of the file
+    :param start_line: number of lines to skip, as they have been loaded already
+    :param batch_size: minimum number of events per batch
+    """
+    events: EventDataList = []
+    batch_start_line = start_line
+    line_number = 0
+    with _open(path) as file:
+        for line_number, line in enumerate(file, start=1):
+            if line_number <= start_line or not line.strip():
+                continue
+            try:
+                events.extend(parse_line(line))
+            except ValueError as exc:
+                raise ValueError(f'Cannot parse line {line_number} of {path}: {exc}') from exc
+            if len(events) >= batch_size:
+                yield Batch(path=path, start_line=batch_start_line, end_line=line_number, finished=False,
+                            events=events)
+                events = []
+                batch_start_line = line_number
+    yield Batch(path=path, start_line=batch_start_line, end_line=max(line_number, start_line), finished=True,
+                events=events)
+
+
+def _copy_value(value: Optional[str]) -> str:
+    """ Format a value for the COPY text format. """
+    if value is None:
+        return '\\N'
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _to_copy_row(event: EventData, cookie_id: str, extra_values: Tuple[Optional[str], ...]) -> str:
+    timestamp = _millis_to_datetime(event['time'])
+    values = (str(event['id']), timestamp.date().isoformat(), timestamp.isoformat(), cookie_id,
+              json.dumps(event)) + extra_values
+    return '\t'.join(_copy_value(value) for value in values) + '\n'
+
+
+def process_batch(batch: Batch) -> BatchResult:
+    """
+    Enrich, validate, and hydrate the events of the batch, and format them as rows for the data and
+    nok_data tables. This runs in the worker processes.
+    """
+    pg_config = get_config_postgres()
+    extracted_columns = pg_config is not None and pg_config.extracted_columns
+    events = []
+    skipped_count = 0
+    for event in batch.events:
+        # Check the structure of each event separately, to only skip the events that are malformed
+        if validate_structure_event_list({'events': [event], 'transport_time': 0}):
+            skipped_count += 1
+            continue
+        if get_optional_context(event, 'CookieIdContext') is None:
+            skipped_count += 1
+            continue
+        if get_optional_context(event, 'MarketingContext') is None:
+            add_marketing_context_to_event(event)
+        events.append(event)
+
+    ok_events, nok_events, _ = process_events_entry(events, validate_time=False)
+    data_rows = []
+    for event in ok_events:
+        extra_values: Tuple[Optional[str], ...] = ()
+        if extracted_columns:
+            extra_values = (event['_type'],
+                            json.dumps(event['_types']),
+                            json.dumps(event['global_contexts']),
+                            json.dumps(event['location_stack']))
+        cookie_id = str(get_context(event, 'CookieIdContext')['cookie_id'])
+        data_rows.append(_to_copy_row(event, cookie_id, extra_values))
+    nok_data_rows = []
+    for event in nok_events:
+        cookie_id = str(get_context(event, 'CookieIdContext')['cookie_id'])
+        nok_data_rows.append(_to_copy_row(event, cookie_id, (FailureReason.FAILED_VALIDATION.value,)))
+    return BatchResult(path=batch.path,
+                       end_line=batch.end_line,
+                       finished=batch.finished,
+                       data_rows=''.join(data_rows),
+                       nok_data_rows=''.join(nok_data_rows),
+                       ok_count=len(ok_events),
+                       nok_count=len(nok_events),
+                       skipped_count=skipped_count)
+
+
+def create_tables(cursor):
+    cursor.execute(_CREATE_TABLES_SQL)
+
+
+def get_checkpoints(cursor) -> Dict[str, Tuple[int, bool]]:
+    """ Give the number of loaded lines, and whether the file is finished, per path. """
+    cursor.execute('select path, line_count, finished from load_checkpoints')
+    return {path: (line_count, finished) for path, line_count, finished in cursor.fetchall()}
+
+
+def _create_staging_table(cursor):
+    cursor.execute('''
+        create temporary table if not exists load_staging (like data, seq bigserial) on commit delete rows;
+        create temporary table if not exists load_new_event_ids (event_id uuid primary key)
+            on commit delete rows;
+    ''')
+
+
+def write_batch(cursor, result: BatchResult, partitioned: bool, extracted_columns: bool) -> int:
+    """
+    Load the rows of the batch into data and nok_data, and update the checkpoint of the file. Must be
+    called in a transaction, such that the rows and the checkpoint are committed together.
+    :return: number of duplicate events
+    """
+    columns = ', '.join(_DATA_COLUMNS + _EXTRACTED_COLUMNS if extracted_columns else _DATA_COLUMNS)
+    duplicate_count = 0
+    if result.data_rows:
+        _create_staging_table(cursor)
+        cursor.copy_expert(f'copy load_staging ({columns}) from stdin', StringIO(result.data_rows))
+        # Of the events with the same event_id, only the first is inserted. For a partitioned data table the
+        # event_ids are claimed in data_event_ids first, see pg_storage.insert_events_into_data()
+        if partitioned:
+            cursor.execute(f'''
+                with claimed as (
+                    insert into data_event_ids (event_id, day)
+                    select distinct on (event_id) event_id, day from load_staging order by event_id, seq
+                    on conflict (event_id) do nothing
+                    returning event_id
+                )
+                insert into load_new_event_ids select event_id from claimed;
+
+                insert into data ({columns})
+                select distinct on (event_id) {columns}
+                from load_staging join load_new_event_ids using (event_id)
+                order by event_id, seq;
+            ''')
+        else:
+            cursor.execute(f'''
+                with inserted as (
+                    insert into data ({columns})
+                    select distinct on (event_id) {columns} from load_staging order by event_id, seq
+                    on conflict (event_id) do nothing
+                    returning event_id
+                )
+                insert into load_new_event_ids select event_id from inserted;
+            ''')
+        cursor.execute('''
+            insert into nok_data (event_id, day, moment, cookie_id, value, reason)
+            select event_id, day, moment, cookie_id, value, %(reason)s
+            from (
+                select *, row_number() over (partition by event_id order by seq) as occurrence
+                from load_staging
+            ) as staging
+            where occurrence > 1
+                or not exists (select from load_new_event_ids n where n.event_id = staging.event_id)
+        ''', {'reason': FailureReason.DUPLICATE.value})
+        duplicate_count = cursor.rowcount
+    if result.nok_data_rows:
+        cursor.copy_expert(f'copy nok_data ({", ".join(_NOK_DATA_COLUMNS)}) from stdin',
+                           StringIO(result.nok_data_rows))
+    cursor.execute('''
+        insert into load_checkpoints (path, line_count, finished)
+        values (%(path)s, %(line_count)s, %(finished)s)
+        on conflict (path) do update set line_count = excluded.line_count, finished = excluded.finished
+    ''', {'path': result.path, 'line_count': result.end_line, 'finished': result.finished})
+    return duplicate_count
+
+
+def _get_batches(paths: List[str], checkpoints: Dict[str, Tuple[int, bool]], batch_size: int) -> Iterator[Batch]:
+    for path in paths:
+        line_count, finished = checkpoints.get(path, (0, False))
+        if finished:
+            continue
+        yield from read_batches(path, start_line=line_count, batch_size=batch_size)
+
+
+def load(connection, paths: List[str], processes: int, batch_size: int, restart: bool = False) -> LoadResult:
+    """
+    Load the events in the given files into the database. See the module docstring.
+    :param connection: database connection. Every batch is committed in a separate transaction.
+    :param paths: paths of the files to load
+    :param processes: number of worker processes. If 1, the events are processed in this process.
+    :param batch_size: minimum number of events per batch
+    :param restart: if set, the checkpoints of the given files are removed first, so they are fully loaded
+        again. Events that are loaded already will be stored in nok_data as duplicates.
+    """
+    pg_config = get_config_postgres()
+    partitioned = pg_config is not None and pg_config.partitioned_data
+    extracted_columns = pg_config is not None and pg_config.extracted_columns
+    # Load the config before forking the worker processes, so they share the compiled schema
+    get_collector_config().event_schema.compile_validators()
+
+    with connection:
+        with connection.cursor() as cursor:
+            create_tables(cursor)
+            if restart:
+                cursor.execute('delete from load_checkpoints where path = any(%s)', (paths,))
+            checkpoints = get_checkpoints(cursor)
+
+    batches = _get_batches(paths, checkpoints, batch_size)
+    pool = None
+    if processes == 1:
+        results: Iterator[BatchResult] = (process_batch(batch) for batch in batches)
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = imap_bounded(pool, process_batch, batches, max_pending=processes * 2)
+    files = ok = nok = duplicates = skipped = 0
+    try:
+        for result in results:
+            with connection:
+                with connection.cursor() as cursor:
+                    duplicates += write_batch(cursor, result,
+                                              partitioned=partitioned, extracted_columns=extracted_columns)
+            ok += result.ok_count
+            nok += result.nok_count
+            skipped += result.skipped_count
+            if result.finished:
+                files += 1
+                print(f'loaded {result.path}; total ok: {ok - duplicates}, nok: {nok}, '
+                      f'duplicates: {duplicates}, skipped: {skipped}')
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return LoadResult(files=files, ok=ok - duplicates, nok=nok, duplicates=duplicates, skipped=skipped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk load events from files into the data and nok_data tables')
+    parser.add_argument('paths', type=str, nargs='+',
+                        help='Files, or directories with files, with one event, list of events, or event list '
+                             'per line. Files ending in .gz are decompressed.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes that process events. Default: number of CPUs')
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help='Minimum number of events per batch and transaction. Default: 5000')
+    parser.add_argument('--restart', default=False, action='store_true',
+                        help='Ignore the checkpoints of previous runs, and load the files from the start')
+    parser.add_argument('--no-retries', dest='retry', default=True, action='store_false',
+                        help="By default we'll try to connect multiple times before giving up. "
+                             "If set won't retry")
+    args = parser.parse_args(sys.argv[1:])
+
+    paths = find_files(args.paths)
+    connection = get_connection_with_retries(args.retry)
+    try:
+        result = load(connection, paths, processes=args.processes, batch_size=args.batch_size,
+                      restart=args.restart)
+    finally:
+        connection.close()
+    print(f'Loaded {result.files} file(s): {result.ok} event(s) in data, {result.nok} invalid and '
+          f'{result.duplicates} duplicate event(s) in nok_data, {result.skipped} event(s) skipped')
+
+
+if __name__ == '__main__':
+    main()
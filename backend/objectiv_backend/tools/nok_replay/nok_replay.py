@@ -0,0 +1,198 @@
+"""
+Tool that revalidates the events in the nok_data table that failed validation, and moves the events that
+now pass to the data table. Run this after a schema (extension) has been fixed, to recover the events that
+were rejected because of the mistake.
+
+The events are validated against the schema that is configured for the collector, i.e. the base schema and
+the extensions in SCHEMA_EXTENSION_DIRECTORY. The time of the events is not validated again: the events
+were received earlier, so they might be too old by now.
+
+The nok_data rows are read with a server-side cursor, and validated in parallel by --processes worker
+processes. For every batch of rows, the events that pass validation are inserted into the data table and
+their rows are deleted from nok_data, in a single transaction. Events that already are in the data table
+are stored in nok_data as duplicates, like the workers do. Rows that still fail validation are left as is.
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from datetime import date
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from objectiv_backend.common.config import get_collector_config, get_config_postgres
+from objectiv_backend.common.types import EventDataList, FailureReason
+from objectiv_backend.tools.db_init.db_init import get_connection_with_retries
+from objectiv_backend.tools.util import imap_bounded
+from objectiv_backend.workers.pg_storage import insert_events_into_data
+from objectiv_backend.workers.worker_entry import process_events_entry
+
+# tableoid, ctid, value. tableoid and ctid together identify the row, also if nok_data is partitioned.
+Row = Tuple[int, str, str]
+
+
+class BatchResult(NamedTuple):
+    # events that passed validation, with the hydrated types
+    ok_events: EventDataList
+    # tableoid and ctid of the rows of ok_events
+    ok_rows: List[Tuple[int, str]]
+    nok_count: int
+
+
+class ReplayResult(NamedTuple):
+    replayed: int
+    failed: int
+
+
+def get_rows(cursor,
+             batch_size: int,
+             start_date: Optional[date] = None,
+             end_date: Optional[date] = None) -> Iterator[List[Row]]:
+    """
+    Give the nok_data rows that failed validation, in batches.
+    :param cursor: psycopg2 cursor. Should be a named (server-side) cursor, to not load all rows at once
+    :param batch_size: number of rows per batch
+    :param start_date: if set, only give rows with a day on or after this date
+    :param end_date: if set, only give rows with a day before this date
+    """
+    query = '''
+        select tableoid::bigint, ctid::text, value::text
+        from nok_data
+        where reason = %(reason)s
+    '''
+    if start_date is not None:
+        query += ' and day >= %(start_date)s'
+    if end_date is not None:
+        query += ' and day < %(end_date)s'
+    cursor.execute(query, {
+        'reason': FailureReason.FAILED_VALIDATION.value,
+        'start_date': start_date,
+        'end_date': end_date
+    })
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def revalidate_rows(rows: List[Row]) -> BatchResult:
+    """ Validate the events of the given rows. This runs in the worker processes. """
+    events = []
+    row_ids = {}
+    for tableoid, ctid, value in rows:
+        event = json.loads(value)
+        events.append(event)
+        row_ids[id(event)] = (tableoid, ctid)
+    ok_events, nok_events, _ = process_events_entry(events, validate_time=False)
+    ok_rows = [row_ids[id(event)] for event in ok_events]
+    return BatchResult(ok_events=ok_events, ok_rows=ok_rows, nok_count=len(nok_events))
+
+
+def delete_rows(cursor, rows: List[Tuple[int, str]]):
+    """ Delete the given rows, identified by tableoid and ctid, from nok_data. """
+    ctids_per_table: Dict[int, List[str]] = {}
+    for tableoid, ctid in rows:
+        ctids_per_table.setdefault(tableoid, []).append(ctid)
+    for tableoid, ctids in ctids_per_table.items():
+        cursor.execute('delete from nok_data where tableoid = %s and ctid = any(%s::tid[])', (tableoid, ctids))
+
+
+def write_batch(connection, result: BatchResult, partitioned: bool, extracted_columns: bool):
+    """ Move the ok events of the batch from nok_data to data, in a single transaction. """
+    if not result.ok_events:
+        return
+    with connection:
+        insert_events_into_data(connection, events=result.ok_events,
+                                partitioned=partitioned, extracted_columns=extracted_columns)
+        with connection.cursor() as cursor:
+            delete_rows(cursor, result.ok_rows)
+
+
+def replay(read_connection,
+           write_connection,
+           processes: int,
+           batch_size: int,
+           start_date: Optional[date] = None,
+           end_date: Optional[date] = None,
+           dry_run: bool = False) -> ReplayResult:
+    """
+    Revalidate the nok_data rows that failed validation, and move the events that pass to data.
+    :param read_connection: connection used to read nok_data. Its transaction stays open during the replay.
+    :param write_connection: connection used to write the results, with a transaction per batch.
+    :param processes: number of worker processes. If 1, the events are validated in this process.
+    :param batch_size: number of rows per batch
+    :param start_date: if set, only replay rows with a day on or after this date
+    :param end_date: if set, only replay rows with a day before this date
+    :param dry_run: if set, only count the events that would be replayed
+    """
+    pg_config = get_config_postgres()
+    partitioned = pg_config is not None and pg_config.partitioned_data
+    extracted_columns = pg_config is not None and pg_config.extracted_columns
+    # Load the config before forking the worker processes, so they share the compiled schema
+    get_collector_config().event_schema.compile_validators()
+
+    replayed = 0
+    failed = 0
+    with read_connection:
+        with read_connection.cursor(name='nok_replay') as cursor:
+            batches = get_rows(cursor, batch_size=batch_size, start_date=start_date, end_date=end_date)
+            if processes == 1:
+                results: Iterator[BatchResult] = (revalidate_rows(batch) for batch in batches)
+                pool = None
+            else:
+                pool = multiprocessing.Pool(processes)
+                results = imap_bounded(pool, revalidate_rows, batches, max_pending=processes * 2)
+            try:
+                for result in results:
+                    if not dry_run:
+                        write_batch(write_connection, result,
+                                    partitioned=partitioned, extracted_columns=extracted_columns)
+                    replayed += len(result.ok_events)
+                    failed += result.nok_count
+                    print(f'replayed: {replayed}, still failing: {failed}')
+            finally:
+                if pool is not None:
+                    pool.terminate()
+    return ReplayResult(replayed=replayed, failed=failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Revalidate the events in nok_data that failed validation, and move the events that '
+                    'pass to data')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes that validate events. Default: number of CPUs')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Number of events per batch and transaction. Default: 1000')
+    parser.add_argument('--start-date', type=date.fromisoformat, default=None,
+                        help='Only replay events with a day on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                        help='Only replay events with a day before this date (YYYY-MM-DD)')
+    parser.add_argument('--dry-run', default=False, action='store_true',
+                        help='Only count the events that would be replayed, without changing any data')
+    parser.add_argument('--no-retries', dest='retry', default=True, action='store_false',
+                        help="By default we'll try to connect multiple times before giving up. "
+                             "If set won't retry")
+    args = parser.parse_args(sys.argv[1:])
+
+    read_connection = get_connection_with_retries(args.retry)
+    write_connection = get_connection_with_retries(args.retry)
+    try:
+        result = replay(read_connection, write_connection,
+                        processes=args.processes,
+                        batch_size=args.batch_size,
+                        start_date=args.start_date,
+                        end_date=args.end_date,
+                        dry_run=args.dry_run)
+    finally:
+        read_connection.close()
+        write_connection.close()
+    action = 'Would replay' if args.dry_run else 'Replayed'
+    print(f'{action} {result.replayed} event(s), {result.failed} event(s) still fail validation')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
@@ -0,0 +1,273 @@
+"""
+Tool that incrementally assigns the events in the data table to sessions, and persists the result in the
+sessions and data_sessionized tables. Queries can use those tables, instead of computing the sessions over
+all events on every query. The modelhub can use data_sessionized, see ModelHub.get_objectiv_dataframe()
+
+Sessions are computed per user (cookie_id). A new session starts if there is more than session_gap_seconds
+between an event and the previous event of the same user. This matches the sessions of the SessionizedData
+model of the modelhub, but the session_ids differ: here session_ids are assigned in order of creation.
+
+Run this regularly (e.g. every few minutes). Each run:
+ * finds the events that are not yet sessionized, looking at events with a moment after the watermark of
+   the previous run minus --lookback-seconds. Events that arrive later than that are never sessionized.
+ * for the users of those events, removes the sessions that might change because of the new events: the
+   sessions that end less than session_gap_seconds before the user's earliest new event, and all later
+   sessions. The session_ids of those sessions change.
+ * recomputes the sessions of those users, from the start of the earliest removed session.
+
+The first run sessionizes all events, as does a run with --rebuild. The session gap cannot be changed
+without --rebuild.
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from typing import Optional, NamedTuple
+
+from objectiv_backend.tools.db_init.db_init import get_connection_with_retries
+
+_CREATE_TABLES_SQL = '''
+    create table if not exists sessionization_state (
+        session_gap_seconds int not null,
+        -- max moment of the sessionized events
+        watermark timestamp,
+        last_session_id bigint not null
+    );
+
+    create table if not exists sessions (
+        session_id bigint not null,
+        user_id uuid not null,
+        session_start timestamp not null,
+        session_end timestamp not null,
+        hit_count bigint not null,
+        primary key(session_id)
+    );
+
+    create index if not exists sessions_user_id_session_end_idx on sessions(user_id, session_end);
+
+    create table if not exists data_sessionized (
+        event_id uuid not null,
+        day date not null,
+        moment timestamp not null,
+        user_id uuid not null,
+        session_id bigint not null,
+        session_hit_number bigint not null,
+        primary key(event_id)
+    );
+
+    create index if not exists data_sessionized_day_idx on data_sessionized(day);
+    create index if not exists data_sessionized_user_id_moment_idx on data_sessionized(user_id, moment);
+
+    grant select on sessions, data_sessionized to obj_reader_role;
+'''
+
+# Events of the data table that are not yet in data_sessionized
+_NEW_EVENTS_SQL = '''
+    create temporary table new_events on commit drop as
+    select d.event_id, d.moment, d.cookie_id as user_id
+    from data as d
+    where {window_filter}
+      and not exists (select from data_sessionized as s where s.event_id = d.event_id)
+'''
+
+# Per user with new events, the moment from which the sessions must be recomputed
+_AFFECTED_USERS_SQL = '''
+    create temporary table affected_users on commit drop as
+    select
+        n.user_id,
+        least(
+            n.min_moment,
+            (
+                select min(s.session_start)
+                from sessions as s
+                where s.user_id = n.user_id
+                  and s.session_end >= n.min_moment - make_interval(secs => %(session_gap_seconds)s)
+            )
+        ) as recompute_from
+    from (select user_id, min(moment) as min_moment from new_events group by user_id) as n
+'''
+
+_DELETE_SQL = '''
+    delete from data_sessionized as s
+    using affected_users as a
+    where s.user_id = a.user_id and s.moment >= a.recompute_from;
+
+    delete from sessions as s
+    using affected_users as a
+    where s.user_id = a.user_id and s.session_start >= a.recompute_from;
+'''
+
+# The same logic as the SessionizedData model of the modelhub, but only for the events of the affected users
+_RECOMPUTE_SQL = '''
+    create temporary table recomputed_events on commit drop as
+    with events as (
+        select d.event_id, d.day, d.moment, d.cookie_id as user_id
+        from data as d
+        inner join affected_users as a on a.user_id = d.cookie_id
+        where d.day >= %(min_day)s and d.moment >= a.recompute_from
+    ),
+    session_starts as (
+        select
+            *,
+            coalesce(
+                extract(
+                    epoch from (moment - lag(moment, 1) over (partition by user_id order by moment, event_id))
+                ) > %(session_gap_seconds)s,
+                true
+            ) as is_start_of_session
+        from events
+    ),
+    session_numbers as (
+        select
+            *,
+            count(case when is_start_of_session then 1 end)
+                over (partition by user_id order by moment, event_id) as session_number
+        from session_starts
+    )
+    select
+        event_id,
+        day,
+        moment,
+        user_id,
+        session_number,
+        row_number()
+            over (partition by user_id, session_number order by moment, event_id) as session_hit_number
+    from session_numbers;
+
+    create temporary table recomputed_sessions on commit drop as
+    select
+        %(last_session_id)s + row_number() over (order by min(moment), user_id) as session_id,
+        user_id,
+        session_number,
+        min(moment) as session_start,
+        max(moment) as session_end,
+        count(*) as hit_count
+    from recomputed_events
+    group by user_id, session_number;
+
+    insert into sessions(session_id, user_id, session_start, session_end, hit_count)
+    select session_id, user_id, session_start, session_end, hit_count
+    from recomputed_sessions;
+
+    insert into data_sessionized(event_id, day, moment, user_id, session_id, session_hit_number)
+    select e.event_id, e.day, e.moment, e.user_id, s.session_id, e.session_hit_number
+    from recomputed_events as e
+    inner join recomputed_sessions as s on s.user_id = e.user_id and s.session_number = e.session_number;
+'''
+
+
+class SessionizationState(NamedTuple):
+    session_gap_seconds: int
+    watermark: Optional[datetime]
+    last_session_id: int
+
+
+class SessionizationResult(NamedTuple):
+    new_events: int
+    affected_users: int
+    recomputed_sessions: int
+
+
+def create_tables(cursor):
+    """ Create the tables used by sessionize(), if they don't exist yet. """
+    cursor.execute(_CREATE_TABLES_SQL)
+
+
+def get_state(cursor, session_gap_seconds: int, rebuild: bool) -> SessionizationState:
+    """
+    Get the state of the previous run, and lock it for the rest of the transaction, such that runs
+    cannot overlap. If rebuild is set, or if there is no previous run, all existing sessions are removed.
+    :raise ValueError: if session_gap_seconds differs from the previous run, and rebuild is not set
+    """
+    cursor.execute('lock table sessionization_state in exclusive mode')
+    cursor.execute('select session_gap_seconds, watermark, last_session_id from sessionization_state')
+    row = cursor.fetchone()
+    if row is not None and not rebuild:
+        state = SessionizationState(*row)
+        if state.session_gap_seconds != session_gap_seconds:
+            raise ValueError(f'Existing sessions were computed with a session gap of '
+                             f'{state.session_gap_seconds} seconds, not {session_gap_seconds}. '
+                             f'Use --rebuild to recompute all sessions.')
+        return state
+
+    cursor.execute('truncate sessionization_state, sessions, data_sessionized')
+    state = SessionizationState(session_gap_seconds=session_gap_seconds, watermark=None, last_session_id=0)
+    cursor.execute('insert into sessionization_state(session_gap_seconds, watermark, last_session_id) '
+                   'values (%s, %s, %s)', state)
+    return state
+
+
+def sessionize(cursor,
+               session_gap_seconds: int,
+               lookback_seconds: int,
+               rebuild: bool = False) -> SessionizationResult:
+    """
+    Sessionize the new events in the data table. See the module docstring.
+    Does not do any transaction management, but must run in a single transaction.
+    """
+    state = get_state(cursor, session_gap_seconds=session_gap_seconds, rebuild=rebuild)
+    params = {'session_gap_seconds': session_gap_seconds, 'last_session_id': state.last_session_id}
+
+    if state.watermark is None:
+        cursor.execute(_NEW_EVENTS_SQL.format(window_filter='true'))
+    else:
+        window_start = state.watermark - timedelta(seconds=lookback_seconds)
+        cursor.execute(_NEW_EVENTS_SQL.format(window_filter='d.day >= %(day)s and d.moment > %(moment)s'),
+                       {'day': window_start.date(), 'moment': window_start})
+    cursor.execute('select count(*) from new_events')
+    new_event_count = cursor.fetchone()[0]
+    if not new_event_count:
+        return SessionizationResult(new_events=0, affected_users=0, recomputed_sessions=0)
+
+    cursor.execute(_AFFECTED_USERS_SQL, params)
+    cursor.execute(_DELETE_SQL)
+    cursor.execute('select count(*), min(recompute_from) from affected_users')
+    affected_user_count, min_recompute_from = cursor.fetchone()
+    params['min_day'] = min_recompute_from.date()
+    cursor.execute(_RECOMPUTE_SQL, params)
+
+    cursor.execute('select count(*), max(session_id) from recomputed_sessions')
+    session_count, last_session_id = cursor.fetchone()
+    cursor.execute('''
+        update sessionization_state
+        set watermark = greatest(watermark, (select max(moment) from new_events)),
+            last_session_id = %s
+    ''', (last_session_id, ))
+    return SessionizationResult(new_events=new_event_count,
+                                affected_users=affected_user_count,
+                                recomputed_sessions=session_count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assign new events to sessions')
+    parser.add_argument('--session-gap-seconds', type=int, default=1800,
+                        help='Minimum time between two events of a user that starts a new session. '
+                             'Default: 1800')
+    parser.add_argument('--lookback-seconds', type=int, default=3600,
+                        help='Also consider events up to this many seconds before the latest sessionized '
+                             'event, to include events that arrived late. Default: 3600')
+    parser.add_argument('--rebuild', default=False, action='store_true',
+                        help='Remove all sessions, and sessionize all events')
+    parser.add_argument('--no-retries', dest='retry', default=True, action='store_false',
+                        help="By default we'll try to connect multiple times before giving up. "
+                             "If set won't retry")
+    args = parser.parse_args(sys.argv[1:])
+
+    connection = get_connection_with_retries(args.retry)
+    with connection:
+        with connection.cursor() as cursor:
+            create_tables(cursor)
+    with connection:
+        with connection.cursor() as cursor:
+            result = sessionize(cursor,
+                                session_gap_seconds=args.session_gap_seconds,
+                                lookback_seconds=args.lookback_seconds,
+                                rebuild=args.rebuild)
+    connection.close()
+    print(f'Sessionized {result.new_events} new event(s) of {result.affected_users} user(s), '
+          f'{result.recomputed_sessions} session(s) (re)computed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Utilities shared by the tools.
+"""
+from collections import deque
+from typing import Any, Callable, Deque, Iterable, Iterator
+
+
+def imap_bounded(pool, function: Callable, items: Iterable[Any], max_pending: int) -> Iterator[Any]:
+    """
+    Like pool.imap(), but only takes a new item from items when less than max_pending items are being
+    processed. pool.imap() would read all items into memory as fast as it can, e.g. all rows of a large
+    query or all lines of a large file.
+    :param pool: multiprocessing.Pool
+    :param function: function to apply to each item, in the pool's worker processes
+    :param items: iterable of items
+    :param max_pending: maximum number of items that are being processed at the same time
+    :return: iterator with the results, in the order of items
+    """
+    pending: Deque = deque()
+    for item in items:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,91 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Compact representation of events, for workers that process large batches.
+"""
+import json
+from typing import List, Optional, Union
+
+from objectiv_backend.common.event_utils import get_optional_context
+from objectiv_backend.common.types import EventData
+
+
+class CompactEvent:
+    """
+    An event stored as its json text, plus the few fields that are needed to queue and store it.
+
+    A batch of events as python dicts takes many times the size of the json text. Code that needs the full
+    event calls get_event() when it needs it, and drops the result afterwards.
+    """
+    __slots__ = ('id', 'time', 'cookie_id', 'event_type', 'value', '_event')
+
+    def __init__(self,
+                 id: str,
+                 time: int,
+                 cookie_id: Optional[str],
+                 event_type: str,
+                 value: str,
+                 event: Optional[EventData] = None):
+        """
+        :param id: event_id
+        :param time: time of the event, in milliseconds since the epoch
+        :param cookie_id: cookie_id of the CookieIdContext, or None if the event doesn't have one
+        :param event_type: _type of the event
+        :param value: the event as json
+        :param event: the event as dict, if available. get_event() will return this instead of parsing the
+            value.
+        """
+        self.id = id
+        self.time = time
+        self.cookie_id = cookie_id
+        self.event_type = event_type
+        self.value = value
+        self._event = event
+
+    @classmethod
+    def from_event(cls, event: EventData, keep_event: bool = True) -> 'CompactEvent':
+        """
+        Create a CompactEvent from an event dict.
+        :param event: the event
+        :param keep_event: whether to keep a reference to the event dict, which get_event() will then return.
+            If False, the event dict can be garbage collected.
+        """
+        return cls._from_parsed(event, json.dumps(event), keep_event=keep_event)
+
+    @classmethod
+    def from_json(cls, event_json: str) -> 'CompactEvent':
+        """ Create a CompactEvent from json. The parsed event is not kept. """
+        return cls._from_parsed(json.loads(event_json), event_json, keep_event=False)
+
+    @classmethod
+    def _from_parsed(cls, event: EventData, event_json: str, keep_event: bool) -> 'CompactEvent':
+        cookie_id_context = get_optional_context(event, 'CookieIdContext')
+        return cls(id=str(event['id']),
+                   time=event['time'],
+                   cookie_id=str(cookie_id_context['cookie_id']) if cookie_id_context is not None else None,
+                   event_type=event['_type'],
+                   value=event_json,
+                   event=event if keep_event else None)
+
+    def get_event(self) -> EventData:
+        """ Give the event as dict. Unless this was created from a dict, this parses the value on every call. """
+        if self._event is not None:
+            return self._event
+        return json.loads(self.value)
+
+
+AnyEvent = Union[EventData, CompactEvent]
+AnyEventList = Union[List[EventData], List[CompactEvent]]
+
+
+def to_compact_event(event: AnyEvent) -> CompactEvent:
+    """ Give the event as CompactEvent. """
+    if isinstance(event, CompactEvent):
+        return event
+    return CompactEvent.from_event(event)
+
+
+def get_event_id(event: AnyEvent) -> str:
+    if isinstance(event, CompactEvent):
+        return event.id
+    return str(event['id'])
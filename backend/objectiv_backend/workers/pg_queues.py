@@ -2,7 +2,6 @@
 Copyright 2021 Objectiv B.V.
 """
 import json
-import uuid
 from enum import Enum
 from typing import List, Tuple
 
@@ -10,6 +9,7 @@ import psycopg2
 from psycopg2.extras import execute_values
 
 from objectiv_backend.common.types import EventDataList
+from objectiv_backend.workers.compact_event import CompactEvent, AnyEventList
 
 
 class ProcessingStage(Enum):
@@ -52,8 +52,25 @@ class PostgresQueues:
         :param max_items: maximum number of items to pick from the queue.
         :return: list of events with id, at most max_items, but can be less.
         """
+        with self.connection.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor) as cursor:
+            cursor.execute(self._get_events_query(queue, value_as_text=False), (max_items, ))
+            events: EventDataList = [row.value for row in cursor.fetchall()]
+        return events
+
+    def get_compact_events(self, queue: ProcessingStage, max_items: int) -> List[CompactEvent]:
+        """
+        Like get_events(), but give the events as CompactEvents.
+        """
+        with self.connection.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor) as cursor:
+            cursor.execute(self._get_events_query(queue, value_as_text=True), (max_items, ))
+            events = [CompactEvent.from_json(row.value) for row in cursor.fetchall()]
+        return events
+
+    def _get_events_query(self, queue: ProcessingStage, value_as_text: bool) -> str:
         table_name = self._queue_to_table(queue)
-        query = f'''
+        # With value_as_text, psycopg2 gives us the json as string, instead of parsing it
+        value = 'value::text as value' if value_as_text else 'value'
+        return f'''
             delete from {table_name}
             where event_id in (
                 select event_id
@@ -62,21 +79,17 @@ class PostgresQueues:
                 limit %s
                 for update skip locked
             )
-            returning event_id, value;
+            returning event_id, {value};
         '''
-        with self.connection.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor) as cursor:
-            cursor.execute(query, (max_items, ))
-            events_with_id: EventDataList = cursor.fetchall()
-        return events_with_id
 
     def put_events(self,
                    queue: ProcessingStage,
-                   events: EventDataList):
+                   events: AnyEventList):
         """
         Put an event with a given event-id on a queue
 
         :param queue: Which queue to put the event on
-        :param events: list of events with ids
+        :param events: list of events with ids, as dicts or CompactEvents
         """
         if not events:
             return
@@ -86,6 +99,26 @@ class PostgresQueues:
             {table_name}(event_id, value)
             values %s
             '''
-        values: List[Tuple[uuid.UUID, str]] = [(event['id'], json.dumps(event)) for event in events]
+        values: List[Tuple[str, str]] = []
+        for event in events:
+            if isinstance(event, CompactEvent):
+                values.append((event.id, event.value))
+            else:
+                values.append((event['id'], json.dumps(event)))
         with self.connection.cursor() as cursor:
             execute_values(cursor, insert_query, values, template=None, page_size=100)
+
+    def get_queue_size_estimate(self, queue: ProcessingStage) -> int:
+        """
+        Get an estimate of the number of events on a queue.
+
+        This uses Postgres' statistics instead of counting the rows, as a count(*) on a big queue is
+        expensive. The statistics are updated asynchronously, so the number can lag behind a bit.
+        :param queue: Queue to give the size of
+        """
+        table_name = self._queue_to_table(queue)
+        query = 'select n_live_tup from pg_stat_user_tables where relname = %s'
+        with self.connection.cursor() as cursor:
+            cursor.execute(query, (table_name, ))
+            row = cursor.fetchone()
+        return row[0] if row else 0
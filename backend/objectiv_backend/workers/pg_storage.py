@@ -3,15 +3,31 @@ Copyright 2021 Objectiv B.V.
 """
 import json
 from datetime import datetime, timedelta
+from typing import List, Tuple, Any, Set, Optional
+from uuid import UUID
 
 
 from psycopg2.extras import execute_values
 
-from objectiv_backend.common.event_utils import get_context
-from objectiv_backend.common.types import FailureReason, EventDataList
+from objectiv_backend.common.log import get_logger
+from objectiv_backend.common.metrics import EVENTS_NOK, CACHED_DUPLICATES
+from objectiv_backend.common.recent_event_ids import RecentEventIds
+from objectiv_backend.common.types import FailureReason
+from objectiv_backend.workers.compact_event import CompactEvent, AnyEventList, to_compact_event
 
+logger = get_logger(__name__)
 
-def insert_events_into_data(connection, events: EventDataList):
+_DATA_COLUMNS = ['event_id', 'day', 'moment', 'cookie_id', 'value']
+# Optional columns with values that are extracted from the event, so queries don't have to parse the
+# value column. See create_tables_extracted_columns.sql
+_EXTRACTED_COLUMNS = ['event_type', 'stack_event_types', 'global_contexts', 'location_stack']
+
+
+def insert_events_into_data(connection,
+                            events: AnyEventList,
+                            partitioned: bool = False,
+                            extracted_columns: bool = False,
+                            recent_event_ids: Optional[RecentEventIds] = None):
     """
     Insert events into the 'data' table.
 
@@ -20,6 +36,11 @@ def insert_events_into_data(connection, events: EventDataList):
     were not inserted (because they violated the uniqueness constraint), and those are inserted in the
     not-ok data table (nok_data).
 
+    If the data table is partitioned, then its primary key is (day, event_id), which does not guarantee
+    unique event_ids. In that case the event_ids are first inserted in the data_event_ids table, which
+    does have a unique index on event_id, and only the events for which that succeeded are inserted in the
+    data table.
+
     Does not do any transaction management, this merely issues insert commands. The insert might block if
     another transaction inserts events with the same event_ids. In extreme cases this function might even
     fail if the blocking exceeds the lock_timeout. To minimize impact of blocks and rollbacks, try to keep
@@ -29,12 +50,25 @@ def insert_events_into_data(connection, events: EventDataList):
     ISOLATION_LEVEL_READ_COMMITTED set and a lock_timeout is configured.
 
     :param connection: psycopg2 database connection, must have ISOLATION_LEVEL_READ_COMMITTED set.
-    :param events: EventDataList, list of events. Each event must be a valid Event, and must have a CookieIdContext
+    :param events: list of events, as dicts or CompactEvents. Each event must be a valid Event, and must have a
+        CookieIdContext
+    :param partitioned: whether the data table is partitioned, see create_tables_partitioned.sql
+    :param extracted_columns: whether the data table has the columns from
+        create_tables_extracted_columns.sql, which will then be filled
+    :param recent_event_ids: optional cache of recently stored event_ids. Events in the cache are inserted
+        in nok_data directly. This function does not add to the cache, the caller should do that after the
+        transaction is committed.
     :raise Exception: If the database is not available, or if it blocks longer than lock_timeout.
     """
     if not events:
         return
 
+    compact_events = [to_compact_event(event) for event in events]
+    if recent_event_ids is not None:
+        compact_events = _filter_recent_event_ids(connection, compact_events, recent_event_ids)
+        if not compact_events:
+            return
+
     # We use 'on conflict do nothing'. With the read-committed isolation level this guarantees that this
     # transaction will not insert a row that will conflict with another transaction, even if the results
     # of that transaction are not yet visible to this transaction [1]. This guarantees that the transaction
@@ -50,48 +84,117 @@ def insert_events_into_data(connection, events: EventDataList):
     #
     # [1] https://www.postgresql.org/docs/13/transaction-iso.html
     # [2] https://www.postgresql.org/docs/13/sql-insert.html
+    columns = _DATA_COLUMNS + _EXTRACTED_COLUMNS if extracted_columns else _DATA_COLUMNS
     insert_query = f'''
-        insert into data(event_id, day, moment, cookie_id, value)
+        insert into data({', '.join(columns)})
         values %s
         on conflict(event_id) do nothing
         returning event_id
     '''
     values = []
-    for event in events:
-        timestamp = _millis_to_datetime(event['time'])
-        cookie_id = get_context(event, 'CookieIdContext')['cookie_id']
-        value = (event['id'],
-                 timestamp,
-                 timestamp,
-                 cookie_id,
-                 json.dumps(event))
+    for event in compact_events:
+        timestamp = _millis_to_datetime(event.time)
+        value: Tuple[Any, ...] = (event.id,
+                                  timestamp,
+                                  timestamp,
+                                  _get_cookie_id(event),
+                                  event.value)
+        if extracted_columns:
+            event_data = event.get_event()
+            value += (event.event_type,
+                      json.dumps(event_data['_types']),
+                      json.dumps(event_data['global_contexts']),
+                      json.dumps(event_data['location_stack']))
         values.append(value)
     with connection.cursor() as cursor:
-        inserted_event_ids = execute_values(
-            cursor, insert_query, values, template=None, page_size=100, fetch=True)
+        if partitioned:
+            inserted_event_ids = _insert_into_partitioned_data(cursor, columns, values)
+        else:
+            rows = execute_values(cursor, insert_query, values, template=None, page_size=100, fetch=True)
+            inserted_event_ids = {row[0] for row in rows}
 
     # Determine whether there were any duplicate events that were already in the table
     # In case of duplicate events, we'll add those to the nok_data table for traceability
-    duplicate_events: EventDataList = []
-    if len(inserted_event_ids) < len(events):
-        inserted_event_ids_set = set(inserted_event_ids)
-        for event in events:
-            if event['id'] not in inserted_event_ids_set:
+    # An event_id can occur more than once within events, in which case only the first occurrence is inserted
+    duplicate_events: List[CompactEvent] = []
+    if len(inserted_event_ids) < len(compact_events):
+        remaining_event_ids = set(inserted_event_ids)
+        for event in compact_events:
+            event_id = UUID(event.id)
+            if event_id in remaining_event_ids:
+                remaining_event_ids.remove(event_id)
+            else:
                 duplicate_events.append(event)
     if duplicate_events:
-        print(f'Duplicate events found, count: {len(duplicate_events)}. '
-              f'Will be inserted in nok_data table.')
+        logger.info('Duplicate events found, count: %d. Will be inserted in nok_data table.',
+                    len(duplicate_events))
+        EVENTS_NOK.labels(reason=FailureReason.DUPLICATE.value).inc(len(duplicate_events))
+        insert_events_into_nok_data(connection, duplicate_events, reason=FailureReason.DUPLICATE)
+
+
+def _filter_recent_event_ids(connection,
+                             events: List[CompactEvent],
+                             recent_event_ids: RecentEventIds) -> List[CompactEvent]:
+    """
+    Insert the events of which the event_id is in recent_event_ids in nok_data as duplicates.
+    :return: the other events
+    """
+    new_events: List[CompactEvent] = []
+    duplicate_events: List[CompactEvent] = []
+    for event in events:
+        if event.id in recent_event_ids:
+            duplicate_events.append(event)
+        else:
+            new_events.append(event)
+    if duplicate_events:
+        logger.info('Duplicate events found in cache, count: %d. Will be inserted in nok_data table.',
+                    len(duplicate_events))
+        CACHED_DUPLICATES.inc(len(duplicate_events))
+        EVENTS_NOK.labels(reason=FailureReason.DUPLICATE.value).inc(len(duplicate_events))
         insert_events_into_nok_data(connection, duplicate_events, reason=FailureReason.DUPLICATE)
+    return new_events
+
+
+def _insert_into_partitioned_data(cursor, columns: List[str], values: List[Tuple[Any, ...]]) -> Set[UUID]:
+    """
+    Insert the rows in values into the partitioned data table, skipping rows with an event_id that is
+    already known. The same 'on conflict do nothing' reasoning as in insert_events_into_data() applies,
+    but here to the data_event_ids table.
+    :param cursor: psycopg2 cursor
+    :param columns: columns of the data table to insert, starting with event_id and day
+    :param values: rows for the data table
+    :return: set with the event_ids of the inserted rows
+    """
+    claim_query = f'''
+        insert into data_event_ids(event_id, day)
+        values %s
+        on conflict(event_id) do nothing
+        returning event_id
+    '''
+    rows = execute_values(cursor, claim_query, [value[:2] for value in values],
+                          template=None, page_size=100, fetch=True)
+    inserted_event_ids = {row[0] for row in rows}
+    new_values = []
+    remaining_event_ids = set(inserted_event_ids)
+    for value in values:
+        event_id = UUID(value[0])
+        if event_id in remaining_event_ids:
+            remaining_event_ids.remove(event_id)
+            new_values.append(value)
+    if new_values:
+        insert_query = f'insert into data({", ".join(columns)}) values %s'
+        execute_values(cursor, insert_query, new_values, template=None, page_size=100)
+    return inserted_event_ids
 
 
 def insert_events_into_nok_data(connection,
-                                events: EventDataList,
+                                events: AnyEventList,
                                 reason: FailureReason = FailureReason.FAILED_VALIDATION):
     """
     Insert events into the not-ok data ('nok_data') table
     Does not do any transaction management, this merely issues insert commands.
     :param connection: db connection
-    :param events: EventDataList, list of events. Each event must have a CookieIdContext
+    :param events: list of events, as dicts or CompactEvents. Each event must have a CookieIdContext
     :param reason: Why are these events written to the nok_data table.
     """
     if not events:
@@ -100,19 +203,25 @@ def insert_events_into_nok_data(connection,
     insert_query = f'insert into nok_data (event_id, day, moment, cookie_id, value, reason) values %s'
     values = []
     for event in events:
-        timestamp = _millis_to_datetime(event['time'])
-        cookie_id = get_context(event, 'CookieIdContext')['cookie_id']
-        value = (event['id'],
+        compact_event = to_compact_event(event)
+        timestamp = _millis_to_datetime(compact_event.time)
+        value = (compact_event.id,
                  timestamp,
                  timestamp,
-                 cookie_id,
-                 json.dumps(event),
+                 _get_cookie_id(compact_event),
+                 compact_event.value,
                  reason.value)
         values.append(value)
     with connection.cursor() as cursor:
         execute_values(cursor, insert_query, values, template=None, page_size=100)
 
 
+def _get_cookie_id(event: CompactEvent) -> str:
+    if event.cookie_id is None:
+        raise ValueError(f'context-type CookieIdContext not present in event. event_id: {event.id}')
+    return event.cookie_id
+
+
 def _millis_to_datetime(millis: int) -> datetime:
     """
     Convert an int with milliseconds since the epoch to a datetime object with milliseconds accuracy.
@@ -4,33 +4,64 @@ Copyright 2021 Objectiv B.V.
 import time
 from typing import Callable, Any
 
-from objectiv_backend.common.config import get_config_postgres
+from objectiv_backend.common.config import get_config_postgres, get_config_metrics, get_config_tracing, \
+    LOG_LEVEL
 from objectiv_backend.common.db import get_db_connection
+from objectiv_backend.common.log import get_logger, init_logging
+from objectiv_backend.common.metrics import start_metrics_server, WORKER_BATCH_DURATION, QUEUE_DEPTH
+from objectiv_backend.common.tracing import init_tracing, span
+from objectiv_backend.workers.pg_queues import PostgresQueues, ProcessingStage
+
+logger = get_logger(__name__)
 
 
 def worker_main(function: Callable[[Any], int], loop: bool) -> int:
     """
     Run the function once, or in a loop.
-    Will print the last part of the function's name and information about the function's execution time.
+    Will log the last part of the function's name and information about the function's execution time.
 
     If running in a loop it will sleep a second between invocations if the function returns 0.
+
+    If metrics are enabled, this serves the metrics over http and updates the queue depth metrics after
+    each invocation. The duration of each invocation that processed events is recorded in the batch duration
+    metric.
     :param function: function that will be called. Should take a `connection` as arguments. The connection
         is a db_connection as delivered by get_db_connection()
     :param loop: whether to call the function once (False) or in an endless loop (True)
     :return number of processed events, if loop is False
     """
+    init_logging(LOG_LEVEL)
+    tracing_config = get_config_tracing()
+    init_tracing(sample_rate=tracing_config.sample_rate, opentelemetry=tracing_config.opentelemetry)
     pg_config = get_config_postgres()
     if pg_config is None:
         raise Exception('Missing Postgres configuration')
+    metrics_config = get_config_metrics()
+    if metrics_config:
+        start_metrics_server(metrics_config.worker_port)
     connection = get_db_connection(pg_config)
     name = function.__name__.split('_')[-1]
-    print(f'{name} worker')
+    logger.info('%s worker', name)
     while True:
         start = time.time()
-        event_count = function(connection)
+        with span(name):
+            event_count = function(connection)
         end = time.time()
-        print(f'Processing time: {(end - start):.5} s')
+        logger.info('Processing time: %.5f s, events: %d', end - start, event_count)
+        if event_count:
+            # Empty polls are not recorded, as they would only measure the queue being idle.
+            WORKER_BATCH_DURATION.labels(source=name).observe(end - start)
+        if metrics_config:
+            _update_queue_depth_metrics(connection)
         if not loop:
             return event_count
         if event_count == 0:
             time.sleep(1)
+
+
+def _update_queue_depth_metrics(connection):
+    """ Set the queue depth metrics to the current (estimated) queue sizes. """
+    with connection:
+        pg_queues = PostgresQueues(connection=connection)
+        for queue in ProcessingStage:
+            QUEUE_DEPTH.labels(queue=queue.value).set(pg_queues.get_queue_size_estimate(queue))
@@ -5,13 +5,23 @@ import sys
 import time
 from typing import List, Tuple
 
-from objectiv_backend.common.config import WORKER_BATCH_SIZE, get_collector_config
+import logging
+
+from objectiv_backend.common.config import WORKER_BATCH_SIZE, WORKER_COMPACT_EVENTS, get_collector_config
+from objectiv_backend.common.log import get_logger
+from objectiv_backend.common.metrics import BATCH_SIZE, EVENTS_OK, EVENTS_NOK
+from objectiv_backend.common.tracing import span
 from objectiv_backend.schema.hydrate_events import hydrate_types_into_event
-from objectiv_backend.schema.validate_events import validate_event_adheres_to_schema, validate_event_time, EventError
+from objectiv_backend.schema.event_schemas import EventSchema
+from objectiv_backend.schema.validate_events import validate_event_adheres_to_schema, validate_event_time, EventError, \
+    ErrorInfo
+from objectiv_backend.workers.compact_event import CompactEvent, AnyEventList, get_event_id
 from objectiv_backend.workers.pg_queues import PostgresQueues, ProcessingStage
 from objectiv_backend.workers.pg_storage import insert_events_into_nok_data
 from objectiv_backend.workers.util import worker_main
-from objectiv_backend.common.types import EventDataList
+from objectiv_backend.common.types import EventData, EventDataList, FailureReason
+
+logger = get_logger(__name__)
 
 
 def main_entry(connection) -> int:
@@ -19,21 +29,37 @@ def main_entry(connection) -> int:
     Pick events from the entry queue and insert them into the finalize queue.
     :return number of processed events
     """
+    ok_events: AnyEventList
+    nok_events: AnyEventList
     with connection:
         pg_queues = PostgresQueues(connection=connection)
-        events: EventDataList = pg_queues.get_events(queue=ProcessingStage.ENTRY,
-                                                     max_items=WORKER_BATCH_SIZE)
-        print(f'event-ids: {sorted(event["id"] for event in events)}')
+        with span('read_queue'):
+            if WORKER_COMPACT_EVENTS:
+                compact_events = pg_queues.get_compact_events(queue=ProcessingStage.ENTRY,
+                                                              max_items=WORKER_BATCH_SIZE)
+                events: AnyEventList = compact_events
+            else:
+                dict_events = pg_queues.get_events(queue=ProcessingStage.ENTRY, max_items=WORKER_BATCH_SIZE)
+                events = dict_events
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('event-ids: %s', sorted(get_event_id(event) for event in events))
+        BATCH_SIZE.labels(source='entry').observe(len(events))
 
-        ok_events, nok_events, event_errors = process_events_entry(events)
+        with span('validate', event_count=len(events)):
+            if WORKER_COMPACT_EVENTS:
+                ok_events, nok_events = process_compact_events_entry(compact_events)
+            else:
+                ok_events, nok_events, _ = process_events_entry(dict_events)
         # ok_events continue on the happy path
         # nok_events failed to validate and are written to the nok_data table
-        pg_queues.put_events(queue=ProcessingStage.FINALIZE, events=ok_events)
-        insert_events_into_nok_data(connection=connection, events=nok_events)
+        with span('write_queue', event_count=len(ok_events)):
+            pg_queues.put_events(queue=ProcessingStage.FINALIZE, events=ok_events)
+        with span('write_postgres', event_count=len(nok_events)):
+            insert_events_into_nok_data(connection=connection, events=nok_events)
     return len(events)
 
 
-def process_events_entry(events: EventDataList, current_millis: int = 0) -> \
+def process_events_entry(events: EventDataList, current_millis: int = 0, validate_time: bool = True) -> \
         Tuple[EventDataList, EventDataList, List[EventError]]:
     """
     Two step processing of events:
@@ -42,6 +68,8 @@ def process_events_entry(events: EventDataList, current_millis: int = 0) -> \
 
     :param events: List of events. validate_structure_event_list() must pass on this list.
     :param current_millis: (current) timestamp to compare events with
+    :param validate_time: whether to validate the time of the events against current_millis. Set to False
+        to revalidate events that were received earlier, and therefore might be too old by now.
     :return: tuple with three lists. Both event lists have the hydrated types.
         1) ok events: events that passed validation
         2) not-ok events: events that didn't pass validation
@@ -56,21 +84,64 @@ def process_events_entry(events: EventDataList, current_millis: int = 0) -> \
         current_millis = round(time.time() * 1000)
 
     for event in events:
-
-        error_info = \
-            validate_event_adheres_to_schema(event_schema=event_schema, event=event) + \
-            validate_event_time(event=event, current_millis=current_millis)
-
+        error_info = _validate_event(event_schema, event, current_millis=current_millis,
+                                     validate_time=validate_time)
         if error_info:
-            print(f"error, event_id: {event['id']}, errors: {[ei.info for ei in error_info]}")
             nok_events.append(event)
             event_errors.append(EventError(event_id=event['id'], error_info=error_info))
         else:
             event = hydrate_types_into_event(event_schema=event_schema, event=event)
             ok_events.append(event)
+    EVENTS_OK.inc(len(ok_events))
+    EVENTS_NOK.labels(reason=FailureReason.FAILED_VALIDATION.value).inc(len(nok_events))
     return ok_events, nok_events, event_errors
 
 
+def process_compact_events_entry(events: List[CompactEvent], current_millis: int = 0) -> \
+        Tuple[List[CompactEvent], List[CompactEvent]]:
+    """
+    Like process_events_entry(), but for CompactEvents. Each event is parsed only while it's validated and
+    hydrated, so only a single event of the batch is held as dict at any time.
+
+    :param events: List of events. validate_structure_event_list() must have passed on these events.
+    :param current_millis: (current) timestamp to compare events with
+    :return: tuple with two lists
+        1) ok events: events that passed validation, with the hydrated types
+        2) not-ok events: events that didn't pass validation
+    """
+    ok_events: List[CompactEvent] = []
+    nok_events: List[CompactEvent] = []
+    event_schema = get_collector_config().event_schema
+
+    if current_millis == 0:
+        current_millis = round(time.time() * 1000)
+
+    for compact_event in events:
+        event = compact_event.get_event()
+        error_info = _validate_event(event_schema, event, current_millis=current_millis, validate_time=True)
+        if error_info:
+            nok_events.append(compact_event)
+        else:
+            event = hydrate_types_into_event(event_schema=event_schema, event=event)
+            ok_events.append(CompactEvent.from_event(event, keep_event=False))
+    EVENTS_OK.inc(len(ok_events))
+    EVENTS_NOK.labels(reason=FailureReason.FAILED_VALIDATION.value).inc(len(nok_events))
+    return ok_events, nok_events
+
+
+def _validate_event(event_schema: EventSchema,
+                    event: EventData,
+                    current_millis: int,
+                    validate_time: bool) -> List[ErrorInfo]:
+    """ Validate a single event, and log the errors if any. """
+    error_info = validate_event_adheres_to_schema(event_schema=event_schema, event=event)
+    if validate_time:
+        error_info += validate_event_time(event=event, current_millis=current_millis)
+    if error_info and logger.isEnabledFor(logging.INFO):
+        logger.info('error, event_id: %s, errors: %s', event['id'], [ei.info for ei in error_info])
+    return error_info
+
+
 if __name__ == '__main__':
     _loop = sys.argv[1:2] == ['--loop']
     worker_main(function=main_entry, loop=_loop)
@@ -1,25 +1,54 @@
 """
 Copyright 2021 Objectiv B.V.
 """
+import logging
 import sys
 
-from objectiv_backend.common.config import WORKER_BATCH_SIZE
-from objectiv_backend.common.types import EventDataList
+from objectiv_backend.common.config import WORKER_BATCH_SIZE, WORKER_COMPACT_EVENTS, RECENT_EVENT_IDS_CACHE_SIZE, \
+    get_config_postgres
+from objectiv_backend.common.log import get_logger
+from objectiv_backend.common.metrics import BATCH_SIZE
+from objectiv_backend.common.recent_event_ids import RecentEventIds
+from objectiv_backend.common.tracing import span
+from objectiv_backend.workers.compact_event import AnyEventList, get_event_id
 from objectiv_backend.workers.pg_queues import PostgresQueues, ProcessingStage
 from objectiv_backend.workers.pg_storage import insert_events_into_data
 from objectiv_backend.workers.util import worker_main
 
+logger = get_logger(__name__)
+
+# event_ids that this worker process stored recently, see RecentEventIds
+_recent_event_ids = RecentEventIds(RECENT_EVENT_IDS_CACHE_SIZE) if RECENT_EVENT_IDS_CACHE_SIZE else None
+
 
 def main_finalize(connection) -> int:
     """
     Pick events from the finalize queue, and write them to the data table.
     :return number of processed events
     """
+    pg_config = get_config_postgres()
+    partitioned = pg_config is not None and pg_config.partitioned_data
+    extracted_columns = pg_config is not None and pg_config.extracted_columns
     with connection:
         pg_queues = PostgresQueues(connection=connection)
-        events: EventDataList = pg_queues.get_events(queue=ProcessingStage.FINALIZE, max_items=WORKER_BATCH_SIZE)
-        print(f'event-ids: {sorted(event["id"] for event in events)}')
-        insert_events_into_data(connection, events)
+        with span('read_queue'):
+            # Compact events take less memory, and are stored with the json as read from the queue, instead
+            # of serializing them again.
+            if WORKER_COMPACT_EVENTS:
+                events: AnyEventList = pg_queues.get_compact_events(queue=ProcessingStage.FINALIZE,
+                                                                    max_items=WORKER_BATCH_SIZE)
+            else:
+                events = pg_queues.get_events(queue=ProcessingStage.FINALIZE, max_items=WORKER_BATCH_SIZE)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('event-ids: %s', sorted(get_event_id(event) for event in events))
+        BATCH_SIZE.labels(source='finalize').observe(len(events))
+        with span('write_postgres', event_count=len(events)):
+            insert_events_into_data(connection, events, partitioned=partitioned,
+                                    extracted_columns=extracted_columns, recent_event_ids=_recent_event_ids)
+    # The transaction is committed, so all events are now in the data table: either inserted by us, or
+    # they were already there.
+    if _recent_event_ids is not None:
+        _recent_event_ids.add_all(get_event_id(event) for event in events)
     return len(events)
 
 
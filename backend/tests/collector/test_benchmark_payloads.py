@@ -0,0 +1,18 @@
+import random
+import time
+
+from benchmarks.payloads import make_events, make_event_list
+from objectiv_backend.schema.validate_events import validate_structure_event_list, \
+    validate_event_adheres_to_schema
+from tests.schema.test_schema import EVENT_SCHEMA
+
+
+def test_make_events():
+    now = round(time.time() * 1000)
+    events = make_events(50, time_millis=now, invalid_ratio=0.2, duplicate_ratio=0.1, rng=random.Random(1))
+    assert len(events) == 50
+    assert validate_structure_event_list(make_event_list(events, transport_time=now)) == []
+
+    invalid_count = sum(1 for event in events if validate_event_adheres_to_schema(EVENT_SCHEMA, event))
+    assert 0 < invalid_count < 50
+    assert len({event['id'] for event in events}) < 50
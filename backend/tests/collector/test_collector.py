@@ -153,3 +153,44 @@ def test_enrich_marketing_context():
 
     # check serialized jsons match for set and unset optionals
     assert json.dumps(order_dict(generated_marketing_context)) == marketing_context_json
+
+
+def test_add_shared_http_context():
+    """
+    Test that a given HttpContext is only added to the events that don't have one yet, as the same instance
+    """
+    event_list = json.loads(CLICK_EVENT_JSON)
+    event_without_context = make_event_from_dict(event_list['events'][0])
+    event_with_context = make_event_from_dict(event_list['events'][0])
+    tracker_http_context = dict(_get_http_context(), remote_address='127.0.0.1')
+    add_global_context_to_event(event=event_with_context, context=tracker_http_context)
+
+    shared_http_context = _get_http_context()
+    for event in [event_without_context, event_with_context]:
+        add_http_context_to_event(event=event, request=HTTP_REQUEST, remote_address='256.256.256.256',
+                                  http_context=shared_http_context)
+
+    assert get_contexts(event=event_without_context, context_type='HttpContext') == [shared_http_context]
+    assert get_contexts(event=event_without_context, context_type='HttpContext')[0] is shared_http_context
+    generated_http_contexts = get_contexts(event=event_with_context, context_type='HttpContext')
+    assert len(generated_http_contexts) == 1
+    assert generated_http_contexts[0] is tracker_http_context
+    assert tracker_http_context['remote_address'] == '256.256.256.256'
+
+
+def test_enrich_marketing_context_cache():
+    event_list = json.loads(CLICK_EVENT_JSON)
+    events = [make_event_from_dict(event_list['events'][0]) for _ in range(2)]
+    for event in events:
+        get_contexts(event=event, context_type='PathContext')[0]['id'] = \
+            'http://localhost:3000?utm_source=test-source&utm_medium=test-medium&utm_campaign=test-campaign'
+
+    cache = {}
+    for event in events:
+        add_marketing_context_to_event(event=event, cache=cache)
+
+    assert len(cache) == 1
+    marketing_contexts = [get_contexts(event=event, context_type='MarketingContext') for event in events]
+    assert len(marketing_contexts[0]) == 1
+    assert marketing_contexts[0][0]['source'] == 'test-source'
+    assert marketing_contexts[0][0] is marketing_contexts[1][0]
@@ -0,0 +1,49 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Guard the start-up time of the collector: importing the collector should not import the clients of the
+optional outputs, nor load the event schema.
+"""
+import json
+import os
+import subprocess
+import sys
+
+# Generous limit on the import time of the collector module, in seconds. This is not a benchmark, it
+# catches an accidental import of something big.
+_IMPORT_TIME_BUDGET = 2.0
+
+_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import objectiv_backend.end_points.collector
+import objectiv_backend.common.config as config
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "modules": sorted(sys.modules),
+    "config_loaded": config._CACHED_COLLECTOR_CONFIG is not None,
+}))
+'''
+
+_LAZY_MODULES = ['boto3', 'botocore', 'google.cloud.pubsub_v1', 'objectiv_backend.snowplow.schema.ttypes',
+                 'objectiv_backend.snowplow.snowplow_helper']
+
+
+def _import_collector(env_overrides=None):
+    env = dict(os.environ)
+    env.update(env_overrides or {})
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+    output = subprocess.check_output([sys.executable, '-c', _SCRIPT], env=env, cwd=root)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def test_collector_import_is_lazy():
+    result = _import_collector()
+    imported = [module for module in _LAZY_MODULES if module in result['modules']]
+    assert imported == []
+    assert not result['config_loaded']
+
+
+def test_collector_import_time_budget():
+    result = _import_collector()
+    assert result['seconds'] < _IMPORT_TIME_BUDGET
@@ -0,0 +1,44 @@
+from objectiv_backend.common.metrics import _Counter, _Gauge, _Histogram, _REGISTRY, observe_duration
+
+
+def test_counter_render():
+    counter = _Counter('test_counter', 'test counter', ['reason'])
+    counter.labels(reason='duplicate').inc()
+    counter.labels(reason='duplicate').inc(2)
+    counter.labels('failed validation').inc()
+    assert counter.render() == (
+        '# HELP test_counter test counter\n'
+        '# TYPE test_counter counter\n'
+        'test_counter_total{reason="duplicate"} 3.0\n'
+        'test_counter_total{reason="failed validation"} 1.0\n'
+    )
+    assert 'test_counter_total{reason="duplicate"} 3.0' in _REGISTRY.render()
+
+
+def test_gauge_render():
+    gauge = _Gauge('test_gauge', 'test gauge')
+    gauge.set(12)
+    assert gauge.render().endswith('test_gauge 12.0\n')
+
+
+def test_histogram_render():
+    histogram = _Histogram('test_histogram', 'test histogram', ['stage'], buckets=(1, 10))
+    histogram.labels(stage='parse').observe(0.5)
+    histogram.labels(stage='parse').observe(5)
+    histogram.labels(stage='parse').observe(50)
+    assert histogram.render() == (
+        '# HELP test_histogram test histogram\n'
+        '# TYPE test_histogram histogram\n'
+        'test_histogram_bucket{stage="parse",le="1.0"} 1.0\n'
+        'test_histogram_bucket{stage="parse",le="10.0"} 2.0\n'
+        'test_histogram_bucket{stage="parse",le="+Inf"} 3.0\n'
+        'test_histogram_count{stage="parse"} 3.0\n'
+        'test_histogram_sum{stage="parse"} 55.5\n'
+    )
+
+
+def test_observe_duration():
+    histogram = _Histogram('test_histogram_duration', 'test histogram', ['stage'])
+    with observe_duration(histogram, stage='enrich'):
+        pass
+    assert 'test_histogram_duration_count{stage="enrich"} 1.0' in histogram.render()
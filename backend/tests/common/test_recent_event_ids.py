@@ -0,0 +1,35 @@
+import pytest
+
+from objectiv_backend.common.recent_event_ids import RecentEventIds
+
+
+def test_recent_event_ids():
+    recent_event_ids = RecentEventIds(max_size=3)
+    assert 'a' not in recent_event_ids
+    recent_event_ids.add_all(['a', 'b', 'c'])
+    assert len(recent_event_ids) == 3
+    assert 'a' in recent_event_ids
+    assert 'd' not in recent_event_ids
+
+
+def test_recent_event_ids_evicts_least_recently_used():
+    recent_event_ids = RecentEventIds(max_size=3)
+    recent_event_ids.add_all(['a', 'b', 'c'])
+    # 'a' is used, so 'b' is now the least recently used
+    assert 'a' in recent_event_ids
+    recent_event_ids.add_all(['d'])
+    assert len(recent_event_ids) == 3
+    assert 'b' not in recent_event_ids
+    assert 'a' in recent_event_ids
+    assert 'c' in recent_event_ids
+    assert 'd' in recent_event_ids
+
+    # adding more ids than fit at once
+    recent_event_ids.add_all(['e', 'f', 'g', 'h'])
+    assert len(recent_event_ids) == 3
+    assert all(event_id in recent_event_ids for event_id in ['f', 'g', 'h'])
+
+
+def test_recent_event_ids_max_size():
+    with pytest.raises(ValueError):
+        RecentEventIds(max_size=0)
@@ -0,0 +1,51 @@
+import pytest
+
+from objectiv_backend.common.tracing import span, init_tracing, add_span_hook, remove_span_hook
+
+
+@pytest.fixture
+def records():
+    result = []
+    add_span_hook(result.append)
+    yield result
+    remove_span_hook(result.append)
+    init_tracing(sample_rate=0, opentelemetry=False)
+
+
+def test_span_sampled(records):
+    init_tracing(sample_rate=1, opentelemetry=False)
+    with span('collect'):
+        with span('parse', event_count=3):
+            pass
+        with span('validate'):
+            pass
+    assert [record.name for record in records] == ['parse', 'validate', 'collect']
+    assert records[0].attributes == {'event_count': 3}
+    # all spans are part of the same trace
+    assert len({record.trace_id for record in records}) == 1
+    assert all(record.duration >= 0 for record in records)
+
+    with span('collect'):
+        pass
+    assert records[-1].trace_id != records[0].trace_id
+
+
+def test_span_not_sampled(records):
+    init_tracing(sample_rate=0, opentelemetry=False)
+    with span('collect'):
+        with span('parse'):
+            pass
+    assert records == []
+
+
+def test_span_exception(records):
+    init_tracing(sample_rate=1, opentelemetry=False)
+    with pytest.raises(ValueError):
+        with span('parse'):
+            raise ValueError('test')
+    assert [record.name for record in records] == ['parse']
+
+
+def test_init_tracing_invalid_sample_rate():
+    with pytest.raises(ValueError):
+        init_tracing(sample_rate=2, opentelemetry=False)
@@ -0,0 +1,71 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import os
+import shutil
+from typing import List
+
+from objectiv_backend.schema.event_schemas import EventSchema, get_event_schema
+from objectiv_backend.schema.schema_watcher import SchemaWatcher
+
+_TEST_SCHEMA_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'test_data', 'schemas1')
+
+
+def _make_watcher(directory: str, changes: List[EventSchema]) -> SchemaWatcher:
+    return SchemaWatcher(
+        directory=directory,
+        interval=60,
+        load=lambda: get_event_schema(directory),
+        on_change=changes.append
+    )
+
+
+def test_schema_watcher_no_change(tmp_path):
+    changes: List[EventSchema] = []
+    watcher = _make_watcher(str(tmp_path), changes)
+    assert not watcher.check()
+    assert changes == []
+
+
+def test_schema_watcher_added_file(tmp_path):
+    changes: List[EventSchema] = []
+    watcher = _make_watcher(str(tmp_path), changes)
+    shutil.copy(os.path.join(_TEST_SCHEMA_DIRECTORY, 'extension1.json'), tmp_path)
+    assert watcher.check()
+    assert len(changes) == 1
+    assert 'NewEvent' in changes[0].list_event_types()
+    assert changes[0].version['extension1'] == '0.0.2'
+    # validators are compiled before the schema is handed over
+    assert changes[0]._event_validators
+    # no further changes
+    assert not watcher.check()
+    assert len(changes) == 1
+
+
+def test_schema_watcher_invalid_file(tmp_path):
+    changes: List[EventSchema] = []
+    watcher = _make_watcher(str(tmp_path), changes)
+    with open(os.path.join(tmp_path, 'broken.json'), 'w') as file:
+        file.write('{"not json')
+    assert not watcher.check()
+    assert changes == []
+    # the broken file is not retried until the directory changes again
+    assert not watcher.check()
+    os.remove(os.path.join(tmp_path, 'broken.json'))
+    assert watcher.check()
+    assert len(changes) == 1
+
+
+def test_get_event_schema_cache(tmp_path):
+    cache_directory = os.path.join(str(tmp_path), 'cache')
+    schema = get_event_schema(_TEST_SCHEMA_DIRECTORY, cache_directory=cache_directory)
+    cache_files = os.listdir(cache_directory)
+    assert len(cache_files) == 1
+    cached_schema = get_event_schema(_TEST_SCHEMA_DIRECTORY, cache_directory=cache_directory)
+    assert cached_schema.version == schema.version
+    assert cached_schema.list_event_types() == schema.list_event_types()
+    assert cached_schema.list_context_types() == schema.list_context_types()
+    assert os.listdir(cache_directory) == cache_files
+    # a different set of schema files gives a different cache entry
+    get_event_schema(None, cache_directory=cache_directory)
+    assert len(os.listdir(cache_directory)) == 2
@@ -0,0 +1,27 @@
+from objectiv_backend.tools.db_init.db_init import get_sql
+
+
+def test_get_sql_partitioned():
+    sql = get_sql()
+    assert 'partition by range' not in sql
+    assert 'data_event_ids' not in sql
+
+    partitioned_sql = get_sql(partitioned=True)
+    assert 'primary key(day, event_id)\n) partition by range (day);' in partitioned_sql
+    assert 'create table data_event_ids' in partitioned_sql
+    assert 'grant select, insert on data_event_ids to obj_worker_role;' in partitioned_sql
+    # everything outside the sections is unchanged
+    assert partitioned_sql.startswith(sql[:sql.index('-- [section: data tables]')])
+    middle = sql[sql.index('-- [end section]'):sql.index('-- [section: extra grants]')]
+    assert middle in partitioned_sql
+    assert partitioned_sql.endswith('-- [end section]\n\n\ncommit;\n')
+
+
+def test_get_sql_extracted_columns():
+    assert 'add column' not in get_sql()
+    for partitioned in (False, True):
+        sql = get_sql(partitioned=partitioned, extracted_columns=True)
+        assert 'alter table data\n    add column event_type text,' in sql
+        assert ('partition by range' in sql) == partitioned
+        # the columns must be added after the table is created, but before the view is created
+        assert sql.index('create table data') < sql.index('alter table data') < sql.index('create view')
@@ -0,0 +1,39 @@
+from datetime import date
+
+import pytest
+
+from objectiv_backend.tools.db_partitions.db_partitions import get_periods, get_partition_name, \
+    parse_partition_bound
+
+
+def test_get_periods_day():
+    assert get_periods(date(2022, 2, 27), date(2022, 3, 1), 'day') == [
+        (date(2022, 2, 27), date(2022, 2, 28)),
+        (date(2022, 2, 28), date(2022, 3, 1)),
+        (date(2022, 3, 1), date(2022, 3, 2)),
+    ]
+
+
+def test_get_periods_month():
+    assert get_periods(date(2021, 12, 15), date(2022, 1, 31), 'month') == [
+        (date(2021, 12, 1), date(2022, 1, 1)),
+        (date(2022, 1, 1), date(2022, 2, 1)),
+    ]
+    assert get_periods(date(2022, 1, 31), date(2022, 1, 31), 'month') == [
+        (date(2022, 1, 1), date(2022, 2, 1))
+    ]
+    with pytest.raises(ValueError):
+        get_periods(date(2022, 1, 31), date(2022, 1, 31), 'week')
+
+
+def test_get_partition_name():
+    assert get_partition_name('data', date(2022, 3, 1), 'day') == 'data_20220301'
+    assert get_partition_name('nok_data', date(2022, 3, 1), 'month') == 'nok_data_202203'
+
+
+def test_parse_partition_bound():
+    assert parse_partition_bound("FOR VALUES FROM ('2022-03-01') TO ('2022-04-01')") == \
+        (date(2022, 3, 1), date(2022, 4, 1))
+    assert parse_partition_bound('DEFAULT') is None
+    with pytest.raises(ValueError):
+        parse_partition_bound('FOR VALUES IN (1)')
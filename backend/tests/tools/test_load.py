@@ -0,0 +1,83 @@
+import gzip
+import json
+
+import pytest
+
+from objectiv_backend.tools.load.load import parse_line, read_batches, process_batch, Batch, find_files
+from tests.schema.test_schema import CLICK_EVENT_JSON
+
+
+def _get_event(event_id: str = 'd8b0f1ca-4ebe-45b6-b7fb-7858cf46082a'):
+    event = json.loads(CLICK_EVENT_JSON)['events'][0]
+    event['id'] = event_id
+    cookie_id = 'f5ff1d7e-0b86-4c88-9e43-6b9a41e1bc1b'
+    event['global_contexts'].append({'_type': 'CookieIdContext', 'id': cookie_id, 'cookie_id': cookie_id})
+    return event
+
+
+def test_parse_line():
+    event = _get_event()
+    assert parse_line(json.dumps(event)) == [event]
+    assert parse_line(json.dumps([event, event])) == [event, event]
+    assert parse_line(json.dumps({'events': [event], 'transport_time': 0})) == [event]
+    with pytest.raises(ValueError):
+        parse_line('{"not json')
+    with pytest.raises(ValueError):
+        parse_line('1')
+
+
+def test_read_batches(tmp_path):
+    path = str(tmp_path / 'events.json.gz')
+    event = _get_event()
+    with gzip.open(path, 'wt') as file:
+        file.write(json.dumps([event] * 3) + '\n')
+        file.write('\n')
+        file.write(json.dumps(event) + '\n')
+        file.write(json.dumps([event] * 2) + '\n')
+
+    batches = list(read_batches(path, start_line=0, batch_size=3))
+    assert [(b.start_line, b.end_line, b.finished, len(b.events)) for b in batches] == [
+        (0, 1, False, 3),
+        (1, 4, False, 3),
+        (4, 4, True, 0),
+    ]
+    # continue after the lines that are loaded already
+    batches = list(read_batches(path, start_line=3, batch_size=3))
+    assert [(b.start_line, b.end_line, b.finished, len(b.events)) for b in batches] == [
+        (3, 4, True, 2),
+    ]
+
+
+def test_find_files(tmp_path):
+    (tmp_path / 'b').mkdir()
+    (tmp_path / 'b' / 'y.json').write_text('')
+    (tmp_path / 'a.json').write_text('')
+    assert find_files([str(tmp_path)]) == [str(tmp_path / 'a.json'), str(tmp_path / 'b' / 'y.json')]
+
+
+def test_process_batch():
+    ok_event = _get_event('8f2ba5b4-0bb0-4a1b-93d5-8c1f9ffba18d')
+    ok_event['global_contexts'][1]['id'] = 'http://localhost:3000/?utm_source=test-source&utm_medium=test-medium' \
+                                           '&utm_campaign=test-campaign'
+    nok_event = _get_event('ba9cb53a-d6b8-4d4b-a2a0-c9b6c2a5e1e2')
+    nok_event['_type'] = 'UnknownEvent'
+    no_cookie_event = json.loads(CLICK_EVENT_JSON)['events'][0]
+    malformed_event = {'_type': 'PressEvent'}
+    batch = Batch(path='/tmp/x', start_line=0, end_line=4, finished=True,
+                  events=[ok_event, nok_event, no_cookie_event, malformed_event])
+
+    result = process_batch(batch)
+    assert (result.ok_count, result.nok_count, result.skipped_count) == (1, 1, 2)
+    assert (result.path, result.end_line, result.finished) == ('/tmp/x', 4, True)
+
+    data_row = result.data_rows.rstrip('\n').split('\t')
+    assert data_row[:4] == ['8f2ba5b4-0bb0-4a1b-93d5-8c1f9ffba18d', '2021-08-27', '2021-08-27T07:28:54.860000',
+                            'f5ff1d7e-0b86-4c88-9e43-6b9a41e1bc1b']
+    value = json.loads(data_row[4])
+    # hydrated, and enriched with a MarketingContext
+    assert 'PressEvent' in value['_types']
+    assert [c['_type'] for c in value['global_contexts']][-1] == 'MarketingContext'
+
+    nok_data_row = result.nok_data_rows.rstrip('\n').split('\t')
+    assert nok_data_row[0] == 'ba9cb53a-d6b8-4d4b-a2a0-c9b6c2a5e1e2'
+    assert nok_data_row[-1] == 'failed validation'
@@ -0,0 +1,28 @@
+import json
+
+from objectiv_backend.tools.nok_replay.nok_replay import revalidate_rows
+from tests.schema.test_schema import CLICK_EVENT_JSON
+
+
+def _get_event():
+    return json.loads(CLICK_EVENT_JSON)['events'][0]
+
+
+def test_revalidate_rows():
+    valid_event = _get_event()
+    invalid_event = _get_event()
+    invalid_event['_type'] = 'UnknownEvent'
+    # the event is far too old, but the time is not validated again
+    assert valid_event['time'] < 1700000000000
+    rows = [
+        (1234, '(0,1)', json.dumps(invalid_event)),
+        (1234, '(0,2)', json.dumps(valid_event)),
+        (5678, '(0,1)', json.dumps(valid_event)),
+    ]
+    result = revalidate_rows(rows)
+    assert result.nok_count == 1
+    assert result.ok_rows == [(1234, '(0,2)'), (5678, '(0,1)')]
+    assert [event['id'] for event in result.ok_events] == [valid_event['id'], valid_event['id']]
+    # events are hydrated
+    assert 'PressEvent' in result.ok_events[0]['_types']
+
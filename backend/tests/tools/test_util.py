@@ -0,0 +1,9 @@
+import multiprocessing
+
+from objectiv_backend.tools.util import imap_bounded
+
+
+def test_imap_bounded():
+    batches = ([i] * i for i in range(1, 8))
+    with multiprocessing.Pool(2) as pool:
+        assert list(imap_bounded(pool, len, batches, max_pending=3)) == [1, 2, 3, 4, 5, 6, 7]
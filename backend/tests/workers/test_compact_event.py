@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from objectiv_backend.workers.compact_event import CompactEvent, to_compact_event, get_event_id
+from objectiv_backend.workers.worker_entry import process_compact_events_entry
+from objectiv_backend.workers.pg_storage import _get_cookie_id
+from tests.schema.test_schema import CLICK_EVENT_JSON
+
+_COOKIE_ID = 'f5ff1d7e-0b86-4c88-9e43-6b9a41e1bc1b'
+
+
+def _get_event():
+    event = json.loads(CLICK_EVENT_JSON)['events'][0]
+    event['global_contexts'].append({'_type': 'CookieIdContext', 'id': _COOKIE_ID, 'cookie_id': _COOKIE_ID})
+    return event
+
+
+def test_compact_event_from_json():
+    event = _get_event()
+    compact_event = CompactEvent.from_json(json.dumps(event))
+    assert compact_event.id == event['id']
+    assert compact_event.time == event['time']
+    assert compact_event.cookie_id == _COOKIE_ID
+    assert compact_event.event_type == 'PressEvent'
+    assert compact_event.value == json.dumps(event)
+    assert compact_event.get_event() == event
+    # parsed again on every call
+    assert compact_event.get_event() is not compact_event.get_event()
+    assert not hasattr(compact_event, '__dict__')
+
+
+def test_compact_event_from_event():
+    event = _get_event()
+    compact_event = to_compact_event(event)
+    assert compact_event.get_event() is event
+    assert json.loads(compact_event.value) == event
+    assert to_compact_event(compact_event) is compact_event
+    assert get_event_id(event) == get_event_id(compact_event) == event['id']
+    assert CompactEvent.from_event(event, keep_event=False).get_event() is not event
+
+
+def test_compact_event_without_cookie_id():
+    event = json.loads(CLICK_EVENT_JSON)['events'][0]
+    compact_event = CompactEvent.from_event(event)
+    assert compact_event.cookie_id is None
+    with pytest.raises(ValueError):
+        _get_cookie_id(compact_event)
+
+
+def test_process_compact_events_entry():
+    ok_event = _get_event()
+    nok_event = _get_event()
+    nok_event['_type'] = 'UnknownEvent'
+    events = [CompactEvent.from_json(json.dumps(event)) for event in (ok_event, nok_event)]
+    ok_events, nok_events = process_compact_events_entry(events, current_millis=ok_event['time'])
+    assert nok_events == [events[1]]
+    assert len(ok_events) == 1
+    assert ok_events[0].id == ok_event['id']
+    # hydrated
+    assert 'PressEvent' in json.loads(ok_events[0].value)['_types']
@@ -93,7 +93,8 @@ class ModelHub():
                                db_url: str = None,
                                table_name: str = 'data',
                                start_date: str = None,
-                               end_date: str = None):
+                               end_date: str = None,
+                               sessionized_table_name: str = None):
         """
         Sets data from sql table into an :py:class:`bach.DataFrame` object.
 
@@ -109,6 +110,10 @@ class ModelHub():
             the first date in the sql table. Format as 'YYYY-MM-DD'.
         :param end_date: last date for which data is loaded to the DataFrame. If None, data is loaded up to
             and including the last date in the sql table. Format as 'YYYY-MM-DD'.
+        :param sessionized_table_name: the name of a sql table with the sessions of the events, as
+            maintained by the objectiv-sessionize tool of the backend (e.g. 'data_sessionized'). If given,
+            sessions are read from this table instead of being computed, which is much faster for large
+            tables. Events that are not yet in this table are left out.
         :returns: :py:class:`bach.DataFrame` with Objectiv data.
         """
         import sqlalchemy
@@ -137,12 +142,24 @@ class ModelHub():
                             'moment': 'timestamp',
                             'cookie_id': 'uuid',
                             'value': 'json'}
-        if dtypes != expected_columns:
+        # Optional columns with values that were extracted from `value` at ingest time. If present we use
+        # them, so the json doesn't have to be parsed on every query.
+        extracted_columns = {'event_type': 'string',
+                             'stack_event_types': 'jsonb',
+                             'global_contexts': 'jsonb',
+                             'location_stack': 'jsonb'}
+        if dtypes == {**expected_columns, **extracted_columns}:
+            has_extracted_columns = True
+        elif dtypes == expected_columns:
+            has_extracted_columns = False
+        else:
             raise KeyError(f'Expected columns not in table {table_name}. Found: {dtypes}')
 
         model = sessionized_data_model(start_date=start_date,
                                        end_date=end_date,
-                                       table_name=table_name)
+                                       table_name=table_name,
+                                       extracted_columns=has_extracted_columns,
+                                       sessionized_table_name=sessionized_table_name)
         # The model returned by `sessionized_data_model()` has different columns than the underlying table.
         # Note that the order of index_dtype and dtypes matters, as we use it below to get the model_columns
         index_dtype = {'event_id': 'uuid'}
@@ -1,8 +1,13 @@
 """
 Copyright 2021 Objectiv B.V.
 """
+from typing import Set, Optional
+
 from sql_models.model import SqlModelBuilder
 
+# Columns that have the same name and value in the table and in the output of the ExtractedContexts models
+_FILTER_COLUMNS = {'event_id', 'day', 'moment'}
+
 
 class ExtractedContexts(SqlModelBuilder):
 
@@ -10,6 +15,35 @@ class ExtractedContexts(SqlModelBuilder):
     def sql(self):
         return _SQL
 
+    @property
+    def filter_placeholder(self) -> Optional[str]:
+        return 'date_range'
+
+    @property
+    def filter_columns(self) -> Set[str]:
+        return _FILTER_COLUMNS
+
+
+class ExtractedContextsFromColumns(SqlModelBuilder):
+    """
+    Like ExtractedContexts, but for a table that has columns with the values already extracted at ingest
+    time (event_type, stack_event_types, global_contexts, and location_stack), which saves parsing the
+    json in the value column. For rows where those columns are null, the values are still extracted from
+    the value column.
+    """
+
+    @property
+    def sql(self):
+        return _SQL_FROM_COLUMNS
+
+    @property
+    def filter_placeholder(self) -> Optional[str]:
+        return 'date_range'
+
+    @property
+    def filter_columns(self) -> Set[str]:
+        return _FILTER_COLUMNS
+
 
 _SQL = \
     '''
@@ -24,3 +58,20 @@ _SQL = \
      FROM {table_name}
      {date_range}
      '''
+
+_SQL_FROM_COLUMNS = \
+    '''
+    SELECT event_id,
+            day,
+            moment,
+            cookie_id AS user_id,
+            COALESCE(global_contexts, CAST(JSON_EXTRACT_PATH(value, 'global_contexts') AS jsonb))
+                AS global_contexts,
+            COALESCE(location_stack, CAST(JSON_EXTRACT_PATH(value, 'location_stack') AS jsonb))
+                AS location_stack,
+            COALESCE(event_type, value->>'_type') AS event_type,
+            COALESCE(stack_event_types, CAST(JSON_EXTRACT_PATH(value, '_types') AS jsonb))
+                AS stack_event_types
+     FROM {table_name}
+     {date_range}
+     '''
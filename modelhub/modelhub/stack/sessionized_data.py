@@ -1,16 +1,56 @@
 """
 Copyright 2021 Objectiv B.V.
 """
+from typing import Dict, Set, Optional
+
 from sql_models.model import SqlModelBuilder
 
 
 class SessionizedData(SqlModelBuilder):
+    """
+    Computes the sessions of the events in extracted_contexts.
+
+    The session_ids are numbered over all events, so filtering the events changes the session_ids. Hence
+    this model doesn't declare any filter_passthrough.
+    """
 
     @property
     def sql(self):
         return _SQL
 
 
+class PersistedSessionizedData(SqlModelBuilder):
+    """
+    Like SessionizedData, but instead of computing the sessions, it reads the session_id and
+    session_hit_number from a table that is kept up to date by the objectiv-sessionize tool of the
+    backend. Events that are not (yet) in that table are left out.
+    """
+
+    @property
+    def sql(self):
+        return _SQL_PERSISTED
+
+    @property
+    def filter_placeholder(self) -> Optional[str]:
+        return 'date_range'
+
+    @property
+    def filter_columns(self) -> Set[str]:
+        # The columns of the sessionized table that have the same values as the columns of the events
+        return {'event_id', 'day', 'moment', 'user_id'}
+
+    @property
+    def filter_passthrough(self) -> Dict[str, Set[str]]:
+        # The join on event_id filters neither side based on other rows, so conditions on the columns of
+        # extracted_contexts can be applied to it directly.
+        return {'extracted_contexts': _EXTRACTED_CONTEXTS_COLUMNS}
+
+
+_EXTRACTED_CONTEXTS_COLUMNS = {
+    'event_id', 'day', 'moment', 'user_id', 'global_contexts', 'location_stack', 'event_type',
+    'stack_event_types'
+}
+
 _SQL = \
     '''
     with session_starts_{{id}} as (
@@ -48,3 +88,17 @@ _SQL = \
         row_number() over (partition by is_one_session order by moment, event_id) as session_hit_number
     from session_id_and_start_{{id}}
     '''
+
+_SQL_PERSISTED = \
+    '''
+    select
+        e.*,
+        s.session_id,
+        s.session_hit_number
+    from {{extracted_contexts}} as e
+    inner join (
+        select event_id, session_id, session_hit_number
+        from {sessionized_table_name}
+        {date_range}
+    ) as s on s.event_id = e.event_id
+    '''
@@ -2,8 +2,8 @@
 Copyright 2021 Objectiv B.V.
 """
 from modelhub.stack.basic_features import BasicFeatures
-from modelhub.stack.extracted_contexts import ExtractedContexts
-from modelhub.stack.sessionized_data import SessionizedData
+from modelhub.stack.extracted_contexts import ExtractedContexts, ExtractedContextsFromColumns
+from modelhub.stack.sessionized_data import SessionizedData, PersistedSessionizedData
 
 from sql_models.model import SqlModel
 
@@ -23,14 +23,25 @@ def _get_date_range(start_date, end_date):
     return date_range
 
 
+def _get_extracted_contexts(date_range, table_name, extracted_columns):
+    if extracted_columns:
+        return ExtractedContextsFromColumns(date_range=date_range, table_name=table_name)
+    return ExtractedContexts(date_range=date_range, table_name=table_name)
+
+
 def basic_feature_model(session_gap_seconds=1800,
                         start_date=None,
                         end_date=None,
-                        table_name='data') -> SqlModel:
-    """ Give a linked BasicFeatures model"""
+                        table_name='data',
+                        extracted_columns=False) -> SqlModel:
+    """
+    Give a linked BasicFeatures model
+    :param extracted_columns: whether the table has the columns with extracted values, see
+        ExtractedContextsFromColumns
+    """
     date_range = _get_date_range(start_date, end_date)
 
-    extracted_contexts = ExtractedContexts(date_range=date_range, table_name=table_name)
+    extracted_contexts = _get_extracted_contexts(date_range, table_name, extracted_columns)
     return BasicFeatures.build(
         sessionized_data=SessionizedData(
             session_gap_seconds=session_gap_seconds,
@@ -42,11 +53,25 @@ def basic_feature_model(session_gap_seconds=1800,
 def sessionized_data_model(session_gap_seconds=1800,
                            start_date=None,
                            end_date=None,
-                           table_name='data') -> SqlModel:
-    """ Give a linked SessionizedData model"""
+                           table_name='data',
+                           extracted_columns=False,
+                           sessionized_table_name=None) -> SqlModel:
+    """
+    Give a linked SessionizedData model
+    :param extracted_columns: whether the table has the columns with extracted values, see
+        ExtractedContextsFromColumns
+    :param sessionized_table_name: if set, read the sessions from this table instead of computing them,
+        see PersistedSessionizedData. session_gap_seconds is ignored in that case.
+    """
     date_range = _get_date_range(start_date, end_date)
 
-    extracted_contexts = ExtractedContexts(date_range=date_range, table_name=table_name)
+    extracted_contexts = _get_extracted_contexts(date_range, table_name, extracted_columns)
+    if sessionized_table_name:
+        return PersistedSessionizedData.build(
+            sessionized_table_name=sessionized_table_name,
+            date_range=date_range,
+            extracted_contexts=extracted_contexts
+        )
     return SessionizedData.build(
             session_gap_seconds=session_gap_seconds,
             extracted_contexts=extracted_contexts
@@ -57,7 +57,7 @@ def get_bt_with_json_data_real() -> DataFrame:
     return bt
 
 
-def get_objectiv_dataframe_test(time_aggregation=None):
+def get_objectiv_dataframe_test(time_aggregation=None, extracted_columns=False):
     sql = """
     drop table if exists objectiv_data;
 
@@ -76,6 +76,23 @@ def get_objectiv_dataframe_test(time_aggregation=None):
 
     run_query(sqlalchemy.create_engine(DB_TEST_URL), sql)
     run_query(sqlalchemy.create_engine(DB_TEST_URL), TEST_DATA_OBJECTIV)
+    if extracted_columns:
+        # Only fill the extracted columns for part of the rows, the other rows should fall back to `value`
+        sql = """
+        alter table objectiv_data
+            add column event_type text,
+            add column stack_event_types jsonb,
+            add column global_contexts jsonb,
+            add column location_stack jsonb;
+
+        update objectiv_data
+        set event_type = value->>'_type',
+            stack_event_types = cast(json_extract_path(value, '_types') as jsonb),
+            global_contexts = cast(json_extract_path(value, 'global_contexts') as jsonb),
+            location_stack = cast(json_extract_path(value, 'location_stack') as jsonb)
+        where event_id < '12b55ed5-4295-4fc1-bf1f-88d64d1ac307'
+        """
+        run_query(sqlalchemy.create_engine(DB_TEST_URL), sql)
 
     kwargs = {}
     if time_aggregation:
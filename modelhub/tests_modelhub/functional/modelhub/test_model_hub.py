@@ -4,8 +4,10 @@ Copyright 2021 Objectiv B.V.
 
 # Any import from from modelhub initializes all the types, do not remove
 from modelhub import __version__
-from tests_modelhub.functional.modelhub.data_and_utils import get_objectiv_dataframe_test
-from tests.functional.bach.test_data_and_utils import assert_equals_data
+import sqlalchemy
+
+from tests_modelhub.functional.modelhub.data_and_utils import get_objectiv_dataframe_test, DB_TEST_URL
+from tests.functional.bach.test_data_and_utils import assert_equals_data, run_query
 from uuid import UUID
 
 
@@ -13,6 +15,32 @@ def test_get_objectiv_stack():
     get_objectiv_dataframe_test()
 
 
+def test_get_objectiv_stack_extracted_columns():
+    df, _ = get_objectiv_dataframe_test()
+    expected = df.to_pandas().sort_index()
+    df_extracted, _ = get_objectiv_dataframe_test(extracted_columns=True)
+    assert 'ExtractedContextsFromColumns' in df_extracted.view_sql()
+    result = df_extracted.to_pandas().sort_index()
+    assert result.equals(expected)
+
+
+def test_get_objectiv_stack_sessionized_table():
+    df, modelhub = get_objectiv_dataframe_test()
+    expected = df.to_pandas().sort_index()
+    sql = f'''
+        drop table if exists objectiv_data_sessionized;
+        create table objectiv_data_sessionized as
+        select event_id, day, moment, user_id, session_id, session_hit_number
+        from ({df.view_sql()}) as sessionized
+    '''
+    run_query(sqlalchemy.create_engine(DB_TEST_URL), sql)
+    df_persisted = modelhub.get_objectiv_dataframe(DB_TEST_URL,
+                                                   table_name='objectiv_data',
+                                                   sessionized_table_name='objectiv_data_sessionized')
+    assert 'PersistedSessionizedData' in df_persisted.view_sql()
+    assert df_persisted.to_pandas().sort_index().equals(expected)
+
+
 # map
 def test_is_first_session():
     df, modelhub = get_objectiv_dataframe_test(time_aggregation='YYYY-MM-DD')